@@ -0,0 +1,73 @@
+import os, sys, time, random, argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper.contours import Contours
+
+"""
+Contour extraction of one big image on the whole image vs in tiles on 1, 2, 4, ... worker processes.
+
+    python bench/bench_contours.py
+    python bench/bench_contours.py --size 16000 --tile 2048 --workers 1 2 4 8 16
+    python bench/bench_contours.py --image scan.png
+"""
+
+
+def make_image(size: int) -> np.ndarray:
+    # shapes of every size, nested and overlapping, so plenty of edges cross the tile seams
+    rng = random.Random(size)
+    img = np.full((size, size, 3), 255, dtype=np.uint8)
+    for _ in range(size * size // 40_000):
+        x, y = rng.randrange(size), rng.randrange(size)
+        r = int(rng.expovariate(1 / 60)) + 3
+        shade = rng.randrange(0, 200)
+        match rng.randrange(3):
+            case 0:
+                cv2.circle(img, (x, y), r, (shade,) * 3, rng.choice((-1, 2)))
+            case 1:
+                cv2.rectangle(img, (x, y), (x + r, y + rng.randrange(3, 3 * r)), (shade,) * 3, rng.choice((-1, 3)))
+            case 2:
+                cv2.line(img, (x, y), (x + rng.randrange(-4 * r, 4 * r), y + rng.randrange(-4 * r, 4 * r)), (shade,) * 3, 2)
+    return img
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=8000, help="side of the generated test image in pixels")
+    parser.add_argument("--image", default=None, help="benchmark this image instead of a generated one")
+    parser.add_argument("--tile", type=int, default=Contours.TILE_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="default: 1, 2, 4, ... up to the core count")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image) if args.image else make_image(args.size)
+    if img is None:
+        sys.exit(f"Could not read image '{args.image}'")
+    cores = os.cpu_count() or 1
+    workers = args.workers or [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+
+    def best(func) -> tuple[float, tuple]:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    print(f"{img.shape[1]}x{img.shape[0]} image, {len(Contours.tiles(img.shape[1::-1], args.tile))} tiles of {args.tile}px, {cores} cores")
+    whole, (contours, parents) = best(lambda: Contours.find(img))
+    print(f"{'mode':>8} {'workers':>8} {'seconds':>10} {'vs whole':>9} {'vs 1 tiled':>11} {'contours':>9} {'same':>5}")
+    print(f"{'whole':>8} {1:>8} {whole:>10.3f} {1:>9.2f} {'':>11} {len(contours):>9} {'':>5}")
+
+    single = None
+    for n in workers:
+        t, (found, found_parents) = best(lambda: Contours.find_tiled(img, args.tile, n))
+        single = single or t
+        same = len(found) == len(contours) and np.array_equal(found_parents, parents) and all(np.array_equal(a, b) for a, b in zip(found, contours))
+        print(f"{'tiled':>8} {n:>8} {t:>10.3f} {whole / t:>9.2f} {single / t:>11.2f} {len(found):>9} {'yes' if same else 'NO':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os, sys, time, random, argparse, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from helper.mutil import Util, Point, Origin
+from gcode.p2code import GCode
+
+"""
+Throughput of GCode.write_gcode against the previous string building implementation.
+
+    python bench/bench_gcode.py
+    python bench/bench_gcode.py --sizes 1000 10000 1000000 --legacy-max 20000
+"""
+
+
+def legacy_generate_gcode(points: list[Point], size: tuple[float, float], origin: int, feedrate: float = 10.0, ppin: float = 50) -> str:
+    # the implementation GCode.iter_gcode replaced: copy_points + points.index() + code +=
+    points = Util.copy_points(points)
+    points = sorted(points, key=lambda p: p._id)
+    points = Util.Transform.hflip(points)
+
+    translated: list[float, float] = []
+    for p in points:
+        if origin == Origin.CENTER:
+            x, y = (p.x - size[0] / 2, p.y - size[1] / 2)
+        translated.append((x / ppin, y / ppin))
+
+    code = "(Generated by PyCNC)\n"
+    for p in points:
+        index = points.index(p)
+        x = str(round(translated[index][0], 3))
+        y = str(round(translated[index][1], 3))
+        code += f"G1 X{x} Y{y} F{feedrate}\n"
+    return code
+
+
+def make_points(n: int) -> list[Point]:
+    rng = random.Random(n)
+    points = [Point(rng.uniform(0, 4000), rng.uniform(0, 3000)) for _ in range(n)]
+    for a, b in zip(points, points[1:]):
+        a._next, b._prev = b, a
+    return points
+
+
+def measure(func) -> tuple[float, int]:
+    # tracemalloc slows allocation down a lot, so time and memory come from separate runs
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 5_000, 20_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=5_000, help="the old implementation is quadratic, skip it above this size")
+    args = parser.parse_args()
+
+    size = (4000, 3000)
+    print(f"{'points':>10} {'impl':>8} {'seconds':>10} {'lines/s':>12} {'peak MB':>9}")
+    for n in args.sizes:
+        points = make_points(n)
+
+        with open(os.devnull, "w") as sink:
+            t, peak = measure(lambda: GCode.write_gcode(sink, points, size, Origin.CENTER, ppin=50))
+        print(f"{n:>10} {'stream':>8} {t:>10.3f} {n / t:>12,.0f} {peak / 1e6:>9.2f}")
+
+        if n <= args.legacy_max:
+            t, peak = measure(lambda: legacy_generate_gcode(points, size, Origin.CENTER))
+            print(f"{n:>10} {'legacy':>8} {t:>10.3f} {n / t:>12,.0f} {peak / 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os, io, sys, json, math, time, random, argparse, platform, subprocess, tracemalloc, contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from helper.mutil import Util, Point, Origin
+from gcode.p2code import GCode
+from gcode.motion import Motion
+from bench_contours import make_image
+
+"""
+Timings and peak memory of the geometry and export hot paths on synthetic data, from 1k to 1M points.
+Results go to JSON, two result files can be compared to find regressions.
+
+    python bench/bench_suite.py -o before.json
+    python bench/bench_suite.py --sizes 1000 10000 --only gcode validate -o after.json
+    python bench/bench_suite.py --compare before.json after.json --threshold 0.15
+"""
+
+SCHEMA = 1
+DENSITY = 10
+POINTS_PER_PIXEL = 4.4e-4 # roughly what make_image gives at DENSITY, used to size the images
+
+
+def make_path(n: int) -> list[Point]:
+    # a few random walk loops with contour like steps, linked into one path in id order
+    rng = random.Random(n)
+    points, x, y = [], 2000.0, 1500.0
+    for i in range(n):
+        if i % 5000 == 0:
+            x, y = rng.uniform(0, 4000), rng.uniform(0, 3000)
+        angle = rng.uniform(0, 2 * math.pi)
+        x, y = x + DENSITY * math.cos(angle), y + DENSITY * math.sin(angle)
+        points.append(Point(x, y))
+    for a, b in zip(points, points[1:]):
+        a._next, b._prev = b, a
+    return points
+
+
+def roundtrip(points: list[Point]) -> list[Point]:
+    # what a JSON project save and load does to every point
+    return Util.reconnect_points([Point.from_dict(p.to_dict(), False) for p in points])
+
+
+"""
+Every case is (name, what it's fed, setup). setup takes the data and returns the function to time.
+"""
+CASES = [
+    ("Util.get_path_points", "image", lambda img: lambda: Util.get_path_points(img, DENSITY)),
+    ("Util.clean_points", "path", lambda points: lambda: Util.clean_points(points, DENSITY)),
+    ("Util.connect_points", "path", lambda points: (lambda shuffled: lambda: Util.connect_points(shuffled))(random.Random(0).sample(points, len(points)))),
+    ("Util.copy_points", "path", lambda points: lambda: Util.copy_points(points)),
+    ("GCode.validate_path", "path", lambda points: lambda: GCode.validate_path(points)),
+    ("GCode.generate_gcode", "path", lambda points: lambda: GCode.generate_gcode(points, (4000, 3000), Origin.CENTER, ppin=50)),
+    ("Point.to_dict/from_dict", "path", lambda points: lambda: roundtrip(points)),
+    ("Motion.parse/simulate", "path", lambda points: (lambda gcode: lambda: Motion.simulate(Motion.parse(gcode)))(GCode.generate_gcode(points, (4000, 3000), Origin.CENTER, ppin=50))),
+]
+
+
+def quiet():
+    # the helpers log with print(), keep that out of the table
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def measure(func, repeat: int, memory: bool) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    # tracemalloc slows allocation down a lot, so memory comes from a run of its own
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds": min(times), "median": float(np.median(times)), "repeat": repeat, "peak_bytes": peak}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "schema": SCHEMA,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(args) -> dict:
+    cases = [c for c in CASES if not args.only or any(o.lower() in c[0].lower() for o in args.only)]
+    results = []
+    print(f"{'case':<26} {'n':>9} {'points':>9} {'seconds':>10} {'median':>10} {'peak MB':>9}")
+    for n in args.sizes:
+        # the data is made once per size and shared by the cases
+        data = {}
+        for name, kind, setup in cases:
+            if kind not in data:
+                if kind == "image":
+                    side = int(min(max(math.sqrt(n / POINTS_PER_PIXEL), 256), args.max_image_side))
+                    data[kind] = make_image(side)
+                else:
+                    data[kind] = make_path(n)
+            fed = data[kind]
+            with quiet():
+                points = len(fed) if kind == "path" else len(Util.get_path_points(fed, DENSITY))
+            if kind == "image" and any(r["case"] == name and r["points"] == points for r in results):
+                continue # the image size is capped, bigger sizes would only repeat the same run
+
+            repeat = args.repeat if n <= 100_000 else 1
+            with quiet():
+                result = {"case": name, "n": n, "points": points, **measure(setup(fed), repeat, not args.no_memory)}
+            if kind == "image":
+                result["image"] = list(fed.shape[1::-1])
+            results.append(result)
+            peak = f"{result['peak_bytes'] / 1e6:>9.1f}" if result["peak_bytes"] is not None else f"{'-':>9}"
+            print(f"{name:<26} {n:>9} {points:>9} {result['seconds']:>10.4f} {result['median']:>10.4f} {peak}")
+    return {"environment": environment(), "results": results}
+
+
+"""
+Lines the two runs up by case and size. A case regressed when it got slower (or, with memory in both runs, used
+more memory) by more than threshold, changes under min_seconds are noise and never count for time.
+"""
+def compare(old: dict, new: dict, threshold: float, min_seconds: float) -> int:
+    before = {(r["case"], r["n"]): r for r in old["results"]}
+    regressions = 0
+    print(f"{'case':<26} {'n':>9} {'old s':>10} {'new s':>10} {'time':>8} {'old MB':>9} {'new MB':>9} {'memory':>8}")
+    for r in new["results"]:
+        o = before.get((r["case"], r["n"]))
+        if o is None:
+            print(f"{r['case']:<26} {r['n']:>9} {'':>10} {r['seconds']:>10.4f} {'new':>8}")
+            continue
+
+        flags = []
+        time_ratio = r["seconds"] / o["seconds"] if o["seconds"] else 1.0
+        if time_ratio > 1 + threshold and r["seconds"] - o["seconds"] >= min_seconds:
+            flags.append("SLOWER")
+        memory = ""
+        if o.get("peak_bytes") and r.get("peak_bytes") is not None:
+            mem_ratio = r["peak_bytes"] / o["peak_bytes"]
+            memory = f"{o['peak_bytes'] / 1e6:>9.1f} {r['peak_bytes'] / 1e6:>9.1f} {mem_ratio:>7.2f}x"
+            if mem_ratio > 1 + threshold:
+                flags.append("MORE MEMORY")
+        if o.get("points") != r.get("points"):
+            flags.append(f"points {o.get('points')} -> {r.get('points')}")
+
+        regressions += any(f in ("SLOWER", "MORE MEMORY") for f in flags)
+        print(f"{r['case']:<26} {r['n']:>9} {o['seconds']:>10.4f} {r['seconds']:>10.4f} {time_ratio:>7.2f}x {memory:<28} {' '.join(flags)}")
+
+    print(f"[{'WARN' if regressions else 'INFO'}] {regressions} regression(s) over {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the geometry and export hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000], help="point counts to run every case at")
+    parser.add_argument("--only", nargs="+", default=None, help="only run cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs (sizes over 100k run once)")
+    parser.add_argument("--max-image-side", type=int, default=8000, help="biggest synthetic image for get_path_points, in pixels")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra run that measures peak memory")
+    parser.add_argument("-o", "--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None, help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown (or memory growth) that counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.001, help="ignore time differences smaller than this")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        return compare(old, new, args.threshold, args.min_seconds)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"[INFO] Wrote {len(report['results'])} results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
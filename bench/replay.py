@@ -0,0 +1,130 @@
+import os, sys, json, time, math, argparse
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# no window, no sound: the editor draws into SDL's dummy driver
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from ui.events import Message, Session, HeadlessBackend, WM_MOUSEMOVE, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_KEYDOWN, WM_KEYUP, WM_MOUSEWHEEL, MK_LBUTTON, WHEEL_DELTA
+from bench_contours import make_image
+
+"""
+Plays an editing session back through the editor on the SDL dummy driver and reports the frame times,
+so changes to the render loop can be compared on any machine.
+
+    python bench/replay.py --image scan.png
+    python bench/replay.py --size 3000 --session edit.jsonl -o frames.json
+
+Sessions are recorded with `python editor.py --record edit.jsonl`. Without one a synthetic session is played:
+hovering over the path, panning, dragging a point (and undoing it) and zooming in and out.
+"""
+
+
+def keys(*codes: int) -> list[list[Message]]:
+    return [[Message(WM_KEYDOWN, c) for c in codes], [Message(WM_KEYUP, c) for c in reversed(codes)]]
+
+
+def synthetic_session(points, frame_size: tuple[int, int], frames: int) -> list[list[Message]]:
+    w, h = frame_size
+    session: list[list[Message]] = []
+
+    # hover sweeps, several moves per frame like a fast mouse sends them
+    for i in range(frames):
+        t = i / frames
+        moves = [(int(w * ((t + k / 400) % 1)), int(h / 2 + h / 3 * math.sin(2 * math.pi * (t * 3 + k / 400)))) for k in range(4)]
+        session.append([Message(WM_MOUSEMOVE, 0, 0, p) for p in moves])
+
+    # pan from an empty corner of the view and back
+    start = (5, 5)
+    session.append([Message(WM_MOUSEMOVE, 0, 0, start), Message(WM_LBUTTONDOWN, MK_LBUTTON, 0, start)])
+    for i in range(1, frames // 2 + 1):
+        d = int(200 * math.sin(math.pi * i / (frames // 2)))
+        session.append([Message(WM_MOUSEMOVE, MK_LBUTTON, 0, (start[0] + d, start[1] + d // 2))])
+    session.append([Message(WM_LBUTTONUP, 0, 0, start)])
+    session += keys(67) # C, back to the unzoomed view so screen pixels are world pixels
+
+    # drag a point around and undo it
+    if points:
+        p = points[len(points) // 2]
+        grab = (int(p.x), int(p.y))
+        session.append([Message(WM_MOUSEMOVE, 0, 0, grab), Message(WM_LBUTTONDOWN, MK_LBUTTON, 0, grab)])
+        for i in range(frames // 2):
+            a = 2 * math.pi * i / (frames // 2)
+            session.append([Message(WM_MOUSEMOVE, MK_LBUTTON, 0, (int(grab[0] + 40 * math.cos(a)), int(grab[1] + 40 * math.sin(a))))])
+        session.append([Message(WM_LBUTTONUP, 0, 0, grab)])
+        session += keys(17, 90) # Ctrl + Z
+
+    # zoom in on the middle and back out, one notch per frame
+    center = (w // 2, h // 2)
+    for notch in [1] * (frames // 4) + [-1] * (frames // 4):
+        session.append([Message(WM_MOUSEWHEEL, ((WHEEL_DELTA * notch) & 0xFFFF) << 16, 0, center)])
+
+    # idle, nothing should be drawn
+    session += [[] for _ in range(frames // 2)]
+    return session
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay an editing session headless and time its frames")
+    parser.add_argument("--image", default=None, help="image to open, a synthetic one is made if not given")
+    parser.add_argument("--size", type=int, default=2000, help="side of the synthetic image in pixels")
+    parser.add_argument("--session", default=None, help="recorded session to play, a synthetic one if not given")
+    parser.add_argument("--frames", type=int, default=240, help="length of each part of the synthetic session")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the image's points")
+    parser.add_argument("-o", "--output", default=None, help="write the frame stats to this JSON file")
+    args = parser.parse_args()
+
+    path = args.image
+    if path is None:
+        path = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"replay-{args.size}.png")
+        if not os.path.exists(path):
+            cv2.imwrite(path, make_image(args.size))
+
+    import editor as E
+    pygame.init()
+    ed = E.Editor()
+    ed._image_path = path
+    ed._load_image()
+    deadline = time.time() + args.timeout
+    while not ed._points and time.time() < deadline:
+        ed._jobs.run_pending()
+        time.sleep(0.05)
+    if not ed._points:
+        print(f"[ERROR] No points from {path} after {args.timeout}s")
+        return 1
+
+    frame_size = (ed._editor_frame.get_width(), ed._editor_frame.get_height())
+    frames = Session.load(args.session) if args.session else synthetic_session(ed._points, frame_size, args.frames)
+    messages = sum(len(f) for f in frames)
+
+    # recorded rather than enabled, the overlay would redraw every frame
+    profiler = ed._profiler
+    profiler.reset()
+    profiler.recording = True
+    start = time.perf_counter()
+    ed.run(HeadlessBackend(frames))
+    wall = time.perf_counter() - start
+    profiler.recording = False
+
+    stats = {s.name: s for s in profiler.stats(recorded=True)}
+    print(f"[INFO] {len(frames)} frames, {messages} messages, {len(points := ed._points)} points in {wall:.2f}s")
+    print(f"{'phase':<10} {'count':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name in ("frame", "wait", "events", "draw", "flip"):
+        s = stats.get(name)
+        if s is not None:
+            print(f"{name:<10} {s.count:>6} {s.mean:>8.2f} {s.p50:>8.2f} {s.p95:>8.2f} {s.max:>8.2f}")
+
+    if args.output:
+        report = {"image": path, "frames": len(frames), "messages": messages, "points": len(points), "seconds": wall,
+                  "phases": {name: vars(s) for name, s in stats.items()}}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"[INFO] Wrote frame stats to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import argparse, os, sys, time, contextlib
+import cv2
+
+# helper.mutil pulls in pygame when it's installed, don't let its banner end up in the gcode on stdout
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from helper.mutil import Util, Origin
+from helper.project import Project
+from helper.pointstore import PointStore
+from helper.contours import Contours
+from helper.cache import ExtractionCache
+from gcode.p2code import GCode
+from gcode.toolpath import ToolPath
+from gcode.motion import Motion, MachineLimits
+
+"""
+Headless image/project -> gcode pipeline, no pygame window or win32 calls involved.
+
+    python cli.py picture.png -o picture.nc
+    python cli.py test.cncproj --timings > test.nc
+    python cli.py picture.png -o picture.nc --estimate --backplot picture-speed.png
+    python cli.py job.nc --max-feed 100 100 --accel 5 5
+"""
+
+ORIGINS = {"center": Origin.CENTER}
+PROGRAMS = (".nc", ".gcode", ".ngc", ".tap")
+
+
+class Tee:
+    """
+    Keeps what's written to sink, so the program can be simulated after it's streamed out
+    """
+    def __init__(self, sink) -> None:
+        self.sink = sink
+        self.chunks: list[str] = []
+
+    def write(self, text: str) -> None:
+        self.chunks.append(text)
+        self.sink.write(text)
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.stages: list[tuple[str, float]] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            # stages also end up in the trace when --trace is given
+            with Util.profiler.span(name):
+                yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def report(self, out) -> None:
+        for name, seconds in self.stages:
+            print(f"[TIME] {name:<10} {seconds * 1000:10.1f} ms", file=out)
+        print(f"[TIME] {'total':<10} {sum(s for _, s in self.stages) * 1000:10.1f} ms", file=out)
+
+
+def points_from_image(path: str, point_density: int, timings: Timings, tile_size: int | None = None, workers: int | None = None,
+                      cache: ExtractionCache | None = None) -> tuple[PointStore, tuple[int, int]]:
+    if cache is not None:
+        # read, trace and sample in one go, or just load the result when the image was extracted before
+        with timings.stage("extract"):
+            extraction = cache.extract(path, point_density, tile_size, workers)
+        with timings.stage("link"):
+            points = PointStore.from_paths(extraction.sampled())
+        print(f"[INFO] Extraction cache: {cache.refresh_stats().summary()}", file=sys.stderr)
+        return points, extraction.size
+
+    with timings.stage("read"):
+        img = cv2.imread(path)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image '{path}'")
+
+    # same as Util.get_path_points in the editor, but on arrays: the contours come out already linked
+    with timings.stage("extract"):
+        paths = Util.get_contour_paths(img, tile_size=tile_size, workers=workers)
+    with timings.stage("clean"):
+        points = PointStore.from_paths(paths.take(paths.sample(point_density)))
+    return points, (img.shape[1], img.shape[0])
+
+
+def points_from_project(path: str, size: tuple[int, int] | None, timings: Timings) -> tuple[PointStore, tuple[int, int], int, int]:
+    with timings.stage("load"):
+        project = Project.load(path)
+
+    if size is None:
+        image_path = project.resolve_image_path(path)
+        img = cv2.imread(image_path) if image_path else None
+        if img is None:
+            raise FileNotFoundError(f"Could not find the project's image '{project.image_path}', pass --size WxH instead")
+        size = (img.shape[1], img.shape[0])
+    return project.points, size, project.origin, project.point_density
+
+
+def estimate(source, limits: MachineLimits, timings: Timings, backplot: str | None = None) -> None:
+    with timings.stage("estimate"):
+        profile = Motion.simulate(Motion.parse(source), limits)
+    print(f"[INFO] Cycle time: {profile.summary()}", file=sys.stderr)
+    if backplot:
+        with timings.stage("backplot"):
+            cv2.imwrite(backplot, Motion.backplot(profile))
+        print(f"[INFO] Wrote the back-plot to {os.path.abspath(backplot)}", file=sys.stderr)
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    try:
+        w, h = text.lower().split("x")
+        return (int(w), int(h))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WxH, got '{text}'")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert an image or .cncproj file to gcode without the editor")
+    parser.add_argument("input", help=f"image (.png/.jpg/.bmp) or project (.cncproj), a program ({'/'.join(PROGRAMS)}) is only estimated")
+    parser.add_argument("-o", "--output", default="-", help="output file, '-' for stdout (default)")
+    parser.add_argument("--density", type=int, default=10, help="minimum distance between points in pixels (images only)")
+    parser.add_argument("--ppin", type=float, default=50, help="pixels per inch")
+    parser.add_argument("--feedrate", type=float, default=10.0)
+    parser.add_argument("--origin", choices=ORIGINS.keys(), default="center", help="machine origin (images only)")
+    parser.add_argument("--tiles", type=int, nargs="?", const=Contours.TILE_SIZE, default=None, metavar="SIZE",
+                        help=f"trace images bigger than SIZE pixels (default {Contours.TILE_SIZE}) in tiles on a process pool (images only)")
+    parser.add_argument("--workers", type=int, default=None, help="processes for --tiles (default: one per core)")
+    parser.add_argument("--no-cache", action="store_true", help="always trace the image instead of going through the extraction cache")
+    parser.add_argument("--cache-dir", default=None, help=f"where extracted images are cached (default {ExtractionCache.default_directory()})")
+    parser.add_argument("--size", type=parse_size, default=None, help="image size as WxH, overrides the project's image")
+    parser.add_argument("--upgrade", action="store_true", help="rewrite a JSON .cncproj input in the binary format first (keeps a .v1.bak copy)")
+    parser.add_argument("--optimize", type=float, nargs="?", const=1.0, default=None, metavar="SECONDS",
+                        help="reorder the path's segments to cut down on travel between them, optionally with a time budget (default 1s)")
+    parser.add_argument("--simplify", type=float, default=None, metavar="INCHES",
+                        help="drop points that are within this distance of the path the remaining points make")
+    parser.add_argument("--arcs", type=float, default=None, metavar="INCHES",
+                        help="replace runs of points that lie on a circle (within this distance) with G2/G3 arcs")
+    parser.add_argument("--validate", action="store_true", help="check the path's next/prev links and report problems on stderr")
+    parser.add_argument("--estimate", action="store_true", help="simulate the program on the machine and print its cycle time to stderr")
+    parser.add_argument("--backplot", default=None, metavar="FILE", help="draw the simulated program coloured by speed into this image (implies --estimate)")
+    limits = MachineLimits()
+    parser.add_argument("--max-feed", type=float, nargs=2, default=limits.max_feed, metavar=("X", "Y"), help="max feed per axis in in/min, for the estimate")
+    parser.add_argument("--accel", type=float, nargs=2, default=limits.acceleration, metavar=("X", "Y"), help="acceleration per axis in in/s^2, for the estimate")
+    parser.add_argument("--junction-deviation", type=float, default=limits.junction_deviation, metavar="INCHES", help="cornering tolerance, for the estimate")
+    parser.add_argument("--timings", action="store_true", help="print per stage timings to stderr")
+    parser.add_argument("--trace", default=None, metavar="FILE", help="write the stages (and what they're made of) as a Chrome trace JSON file")
+    args = parser.parse_args(argv)
+    Util.profiler.recording = args.trace is not None
+
+    timings = Timings()
+    to_stdout = args.output == "-"
+    limits = MachineLimits(tuple(args.max_feed), tuple(args.accel), args.junction_deviation)
+
+    if args.input.lower().endswith(PROGRAMS):
+        try:
+            with open(args.input) as f:
+                estimate(f, limits, timings, args.backplot)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+        if args.timings:
+            timings.report(sys.stderr)
+        return 0
+    simulate = args.estimate or args.backplot is not None
+
+    # the helpers log with print(), keep stdout clean when the gcode goes there
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        try:
+            if args.input.endswith(".cncproj"):
+                if args.upgrade and Project.upgrade_file(args.input):
+                    print(f"[INFO] Upgraded {args.input} to project version {Project.VERSION}", file=sys.stderr)
+                points, size, origin, density = points_from_project(args.input, args.size, timings)
+            else:
+                cache = None if args.no_cache else ExtractionCache(args.cache_dir)
+                points, size = points_from_image(args.input, args.density, timings, args.tiles, args.workers, cache)
+                size = args.size or size
+                origin = ORIGINS[args.origin]
+                density = args.density
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+
+        if len(points) < 2:
+            print("[ERROR] Not enough points to generate gcode", file=sys.stderr)
+            return 1
+
+        if args.optimize is not None:
+            with timings.stage("optimize"):
+                # points further apart than a few times the density are on different contours
+                rows, report = ToolPath.plan_order(points, 3 * density, args.optimize)
+                ToolPath.apply_order(points, rows)
+            print(f"[INFO] Ordered path: {report.summary(args.ppin)}", file=sys.stderr)
+
+        if args.simplify is not None:
+            with timings.stage("simplify"):
+                report = ToolPath.simplify(points, args.simplify, args.ppin)
+            print(f"[INFO] Simplified path: {report.summary()}", file=sys.stderr)
+
+        if args.validate:
+            with timings.stage("validate"):
+                diagnostics = GCode.validate_path(points)
+            print(f"[{'INFO' if diagnostics.ok else 'WARN'}] Path: {diagnostics.summary()}", file=sys.stderr)
+
+        with timings.stage("gcode"):
+            if to_stdout:
+                sink = Tee(sys.__stdout__) if simulate else sys.__stdout__
+                GCode.write_gcode(sink, points, size, origin, args.feedrate, args.ppin, arc_tolerance=args.arcs)
+                sys.__stdout__.flush()
+            else:
+                with open(args.output, "w") as f:
+                    sink = Tee(f) if simulate else f
+                    GCode.write_gcode(sink, points, size, origin, args.feedrate, args.ppin, arc_tolerance=args.arcs)
+
+        if simulate:
+            estimate(sink.chunks, limits, timings, args.backplot)
+
+    count = len(points.rows()) if isinstance(points, PointStore) else len(points)
+    print(f"[INFO] {count} points -> {'stdout' if to_stdout else os.path.abspath(args.output)}", file=sys.stderr)
+    if args.timings:
+        timings.report(sys.stderr)
+    if args.trace:
+        count = Util.profiler.export_chrome_trace(args.trace)
+        print(f"[INFO] Wrote {count} spans to {os.path.abspath(args.trace)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,26 @@
-import pygame, os, cv2, ctypes, ctypes.wintypes, debugpy, json
+import pygame, os, math, time, ctypes, debugpy
 from tkinter import filedialog
-from collections import deque
+from typing import Callable
 
 from header.h_editor import h_Editor
-from helper.mutil import Util, Point, Origin, Rect
+from helper.mutil import Util, Point, Origin, Rect, Viewport, Bounds
+from helper.spatial import SpatialIndex
+from helper.contours import Contours, ContourPaths
+from helper.project import Project
+from helper.journal import Journal, MovePoint, AddPoint, RemovePoint, PointState, SetDensity
+from helper.pointstore import PointStore
+from helper.cache import ExtractionCache
+from helper.profiler import Profiler
+from helper.jobs import JobScheduler, Job
 from gcode.p2code import GCode
+from gcode.toolpath import ToolPath
+from gcode.motion import Motion, MachineLimits, MotionProfile
 
 from ui.menubar import MenuBar
 from ui.component import Component
 from ui.button import Button
+from ui.layers import Layer
+from ui.events import EventBackend, Message
 
 """
 TODO
@@ -39,9 +51,11 @@ class Editor(h_Editor):
     _point_density: int
     _image: pygame.Surface | None
     _PPIN: int
-    _undo_stack: deque[list[Point]]
-    _redo_stack: deque[list[Point]]
+    _journal: Journal
     _menu_bar: MenuBar
+    _index: SpatialIndex
+
+    _LINK_REACH = 32 # lines longer than this (in either direction) are tracked in _long_links
 
     def __init__(self):
         super().__init__()
@@ -56,18 +70,22 @@ class Editor(h_Editor):
         self._grab_offset = (0, 0)
         self._tool_components: list[Component] = []
         self._hide_image = False
-        self._undo_stack = deque(maxlen=1000)
-        self._redo_stack = deque(maxlen=1000)
+        self._journal = Journal()
+        self._cache = ExtractionCache()
+        self._profiler = Util.profiler  # F3 shows the overlay, F4 records a trace
+        self._jobs = JobScheduler(profiler=self._profiler)  # results come back to the main loop, see run
+        self._hud_jobs: str | None = None  # job progress as last drawn
         self._editor_frame = pygame.Surface((self._screen.get_width() - 200, self._screen.get_height()))
         self._tool_frame = pygame.Surface((200, self._screen.get_height()))
         self._hud_font = pygame.font.SysFont("Arial", 20)
-        self._bounds: Rect = Rect(0, 0, 0, 0)
+        self._bounds = Bounds()  # of the points, in pixels, kept up to date by the edit helpers
         self._pressed_keys = {}
-        self._zoom_level = 1
-        self._zoom_focus = (self._editor_frame.get_width() / 2, self._editor_frame.get_height() / 2)
+        self._viewport = Viewport(self._editor_frame.get_size())
         self._dragging = False
         self._last_mouse_pos = (0, 0)
-        self._clock = pygame.time.Clock()
+        self._clock = pygame.time.Clock()  # replaced by the event backend's in run
+        self._mouse_pos: tuple[int, int] = (0, 0)  # window pixels, from the last message
+        self._menu_bar = None
         self._evaluated_mouse_pos: tuple[float, float] = None
         self._image_path: str = None
         self._open_project: str = None
@@ -76,6 +94,15 @@ class Editor(h_Editor):
         self._highlight_points: list[tuple[Point, tuple[int, int, int]]] = []
         self._current_conection_id = 0
 
+        # cached render layers, see _draw
+        self._layers = {
+            "image": Layer(self._editor_frame.get_size(), transparent=False),
+            "path": Layer(self._editor_frame.get_size()),
+            "overlay": Layer(self._editor_frame.get_size()),
+        }
+        self._frame_view = None
+        self._long_links: dict[int, Point] = {}
+
         self._setup_toolbar()
         self._setup_menubar()
 
@@ -85,101 +112,296 @@ class Editor(h_Editor):
         # Actual Path Code =============================
         self._PPIN = 50  # Pixels per Inch (for converting to gcode mostly)
         self._points: list[Point] = []
+        self._index = SpatialIndex(cell_size=16)
         self._point_density = 10
+        self._MAX_DENSITY = 100
+        self._contours: ContourPaths | None = None  # raw contours of the open image, density changes sample these again
+        self._contours_offset = (0, 0)
+        self._simplify_tolerance = 0.005  # inches
+        self._arc_tolerance: float | None = 0.001  # inches, fit G2/G3 arcs into the gcode (None writes only G1 moves)
+        self._machine = MachineLimits()
+        self._estimate: MotionProfile | None = None  # cycle time of the path as it was last exported/estimated
+        self._revision = 0  # bumped by every change to the path, results of background work on an older one are dropped
         self._image = None
 
         # Util =========================================
         Util._editor = self
-
-        # Callback for calculating bounds (running this every frame is a bit much)
-        Util.set_interval(
-            lambda: setattr(self, "_bounds", Util.calculate_bounds(self._points).scale(1 / self._PPIN).round(3)) if len(self._points) > 2 else None
-        , 1)
     
     def _draw(self) -> None:
         self._screen.fill((255, 255, 255))
-        self._editor_frame.fill((255, 255, 255))
 
-        # Draw Editor Frame ============================
-        if self._image and not self._hide_image:
-            self._editor_frame.blit(self._image, (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 - self._image.get_height() / 2))
-
-            # draw a frame around the image
-            pygame.draw.rect(self._editor_frame, (255, 0, 0), (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 - self._image.get_height() / 2, self._image.get_width(), self._image.get_height()), 2)
-
-        for i, p in enumerate(self._points):
-            sizeMod = 1 if p != self._hover_point else 1.2 if p == self._selected_point else 1.2
-
-            if p in [x[0] for x in self._highlight_points]:
-                color = [x[1] for x in self._highlight_points if x[0] == p][0]
-            elif p._locked:
-                color = (255, 0, 0)
-            elif p == self._selected_point:
-                color = (0, 0, 255) if not self._connect_mode else (255, 255, 0)
-            elif i == 0:
-                color = (0, 0, 255)
-            elif i == len(self._points) - 1:
-                color = (255, 0, 0)
-            elif p._id == -1:
-                color = (255, 0, 0)
-            else:
-                color = (0, 255, 0)
+        # Editor Frame =================================
+        # every layer keeps its surface until something it shows changes, an idle editor only blits
+        image, path, overlay = self._layers["image"], self._layers["path"], self._layers["overlay"]
+        self._sync_view()
+        self._check_layers()
 
-            pygame.draw.circle(self._editor_frame, color, (p.x, p.y), self._point_size * sizeMod)
+        if image.dirty or path.dirty or overlay.dirty:
+            with self._profiler.span("draw.image"):
+                image.redraw(self._draw_image_layer, lambda surface, rect: self._draw_image_layer(surface))
+            with self._profiler.span("draw.path"):
+                path.redraw(self._draw_path_layer, self._draw_path_rect)
+            with self._profiler.span("draw.overlay"):
+                overlay.redraw(self._draw_overlay_layer, lambda surface, rect: self._draw_overlay_layer(surface))
 
-        # draw connecting lines
-        for p in self._points:
-            if p.next():
-                color = (255, 0, 0) if p._locked and p.next()._locked else (0, 0, 0)
-                pygame.draw.line(self._editor_frame, color, (p.x, p.y), (p.next().x, p.next().y))
+            self._editor_frame.blit(image.surface, (0, 0))
+            self._editor_frame.blit(path.surface, (0, 0))
+            self._editor_frame.blit(overlay.surface, (0, 0))
 
         # Tool Frame ===================================
-        for c in self._tool_components:
-            c.draw(self._tool_frame)
-
-
-
-        # draw the bounds
-        if self._image and not self._hide_image:
-            text = self._hud_font.render(f"{round(self._bounds.w, 3)}in", True, (0, 0, 0))
-            # draw it in the middle horizontally, and at the bottom vertically + 10 pixels
-            self._editor_frame.blit(text, (self._editor_frame.get_width() / 2 - text.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10))
-            # draw a line from either side of the text to the end of the image and then draw a '|' at the end of each line
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 - text.get_width() / 2 - 10, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2), (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + text.get_width() / 2 + 10, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2 - 5), (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2 + 5))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2 - 5), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2 + 10 + text.get_height() / 2 + 5))
-
-            # now do the same thing for the height
-            text = self._hud_font.render(f"{round(self._bounds.h, 3)}in", True, (0, 0, 0))
-            text = pygame.transform.rotate(text, 90)
-            # draw it in the middle vertically, and at the right horizontally + 10 pixels
-            self._editor_frame.blit(text, (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10, self._editor_frame.get_height() / 2 - text.get_height() / 2))
-            # draw a line from either side of the text to the end of the image and then draw a '|' at the end of each line
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2, self._editor_frame.get_height() / 2 - text.get_height() / 2 - 10), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2, self._editor_frame.get_height() / 2 - self._image.get_height() / 2))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2, self._editor_frame.get_height() / 2 + text.get_height() / 2 + 10), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2, self._editor_frame.get_height() / 2 + self._image.get_height() / 2))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2 - 5, self._editor_frame.get_height() / 2 - self._image.get_height() / 2), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2 + 5, self._editor_frame.get_height() / 2 - self._image.get_height() / 2))
-            pygame.draw.line(self._editor_frame, (0, 0, 0), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2 - 5, self._editor_frame.get_height() / 2 + self._image.get_height() / 2), (self._editor_frame.get_width() / 2 + self._image.get_width() / 2 + 10 + text.get_width() / 2 + 5, self._editor_frame.get_height() / 2 + self._image.get_height() / 2))
-
-
-        Util.zoom_at_pos(self._editor_frame, self._zoom_focus, self._zoom_level)
+        with self._profiler.span("draw.tools"):
+            for c in self._tool_components:
+                c.draw(self._tool_frame)
 
         self._screen.blit(self._editor_frame, (0, 0))
         self._screen.blit(self._tool_frame, (self._screen.get_width() - 200, 0))
 
         # Draw HUD =====================================
         hud = {
-            "Mouse": self._calculate_machine_pos(Point(pygame.mouse.get_pos()[0], pygame.mouse.get_pos()[1])),
+            "Mouse": self._calculate_machine_pos(Point(*self._mouse_pos)),
             "Point Density": self._point_density,
-            "FPS": round(self._clock.get_fps()),
+            "FPS": round(fps) if math.isfinite(fps := self._clock.get_fps()) else 0, # infinite when frames take under 1ms (headless)
             "Point ID": self._hover_point._id if self._hover_point else None,
+            "Cycle Time": (Motion.format_seconds(self._estimate.seconds) + ("" if self._estimate.has_rapids else " (travel at feed, no G0)")) if self._estimate else None,
+            "Jobs": self._job_status(),
         }
+        self._hud_jobs = hud["Jobs"]
 
         for i, (k, v) in enumerate(hud.items()):
             if v:
                 text = self._hud_font.render(f"{k}: {v}", True, (0, 0, 0))
                 self._screen.blit(text, (10, 20 + (i-1) * 20))
 
+        if self._profiler.enabled:
+            self._draw_profiler()
+
+    """
+    Rolling per phase timings and a histogram of the frame times, drawn over the top right of the editor frame
+    """
+    def _draw_profiler(self) -> None:
+        stats = sorted(self._profiler.stats(), key=lambda s: s.name)
+        line = self._hud_font.get_linesize()
+        width, bar_height = 360, 60
+        panel = pygame.Surface((width, line * (len(stats) + 2) + bar_height + 20))
+        panel.set_alpha(220)
+        panel.fill((30, 30, 30))
+
+        # the font isn't monospaced, every column is right aligned on its own
+        columns = (200, 260, 320)
+        def row(y: int, cells: tuple, color: tuple[int, int, int]) -> None:
+            panel.blit(self._hud_font.render(cells[0], True, color), (10, y))
+            for x, cell in zip(columns, cells[1:]):
+                text = self._hud_font.render(cell, True, color)
+                panel.blit(text, (x - text.get_width(), y))
+
+        row(5, ("phase (ms)", "mean", "p95", "max"), (200, 200, 200))
+        for i, s in enumerate(stats):
+            row(5 + line * (i + 1), (s.name, f"{s.mean:.2f}", f"{s.p95:.2f}", f"{s.max:.2f}"), (255, 255, 255))
+
+        # frame times: one bar per bucket, the buckets past 16.7 ms (60 fps) in red
+        counts = self._profiler.histogram("frame")
+        top = 10 + line * (len(stats) + 1)
+        bar_width = (width - 20) / len(counts)
+        for i, count in enumerate(counts.tolist()):
+            h = bar_height * count / max(int(counts.max()), 1)
+            # bucket i starts at HISTOGRAM[i], from 16.7 ms on the frames miss 60 fps
+            color = (220, 80, 80) if Profiler.HISTOGRAM[i] >= 16.7 else (80, 200, 120)
+            pygame.draw.rect(panel, color, (10 + i * bar_width, top + bar_height - h, bar_width - 2, h))
+        label = self._hud_font.render(f"frames  {' | '.join(f'{e:g}' for e in Profiler.HISTOGRAM[1:])} ms", True, (200, 200, 200))
+        panel.blit(label, (10, top + bar_height + 2))
+        self._screen.blit(panel, (self._editor_frame.get_width() - width - 10, 10))
+
+    def _toggle_profiler(self) -> None:
+        self._profiler.enabled = not self._profiler.enabled
+        if not self._profiler.enabled:
+            self._profiler.reset()
+
+    """
+    First call starts recording every span, the second one writes them out as a Chrome trace (chrome://tracing, Perfetto)
+    """
+    def _toggle_trace(self) -> None:
+        if not self._profiler.recording:
+            self._profiler.recording = True
+            print("[INFO] Recording a trace, F4 again to save it")
+            return
+        self._profiler.recording = False
+        path = os.path.abspath(time.strftime("trace-%Y%m%d-%H%M%S.json"))
+        count = self._profiler.export_chrome_trace(path)
+        print(f"[INFO] Wrote {count} spans to {path}")
+
+    """
+    Invalidates the layers whose state changed since they were drawn, anything drawn over the path has to follow it
+    """
+    def _check_layers(self) -> None:
+        image, path, overlay = self._layers["image"], self._layers["path"], self._layers["overlay"]
+        size = self._path_size()
+        image.check_key((id(self._image), self._hide_image, size.w, size.h))
+        overlay.check_key(self._overlay_key())
+        if path.dirty:
+            overlay.invalidate()
+
+    """
+    Catches the layers up with the viewport. Dirty rects are in screen coordinates, so this has to run before
+    any rect is added under a view the layers haven't been moved to yet
+    """
+    def _sync_view(self) -> None:
+        view = self._viewport.key
+        if view == self._frame_view:
+            return
+
+        # panning only moves the path, zooming redraws it (only what's on screen is drawn)
+        if self._frame_view is not None and self._frame_view[0] == view[0]:
+            self._layers["path"].scroll(view[1][0] - self._frame_view[1][0], view[1][1] - self._frame_view[1][1])
+        else:
+            self._layers["path"].invalidate()
+        self._layers["image"].invalidate()
+        self._layers["overlay"].invalidate()
+        self._frame_view = view
+
+    """
+    Where the image sits in the world, it's centered in the editor frame
+    """
+    def _image_rect(self) -> Rect:
+        return Rect(self._editor_frame.get_width() // 2 - self._image.get_width() // 2, self._editor_frame.get_height() // 2 - self._image.get_height() // 2,
+                    self._image.get_width(), self._image.get_height())
+
+    """
+    Size of the path in inches
+    """
+    def _path_size(self) -> Rect:
+        return self._bounds.rect.scale(1 / self._PPIN).round(3)
+
+    def _draw_image_layer(self, surface: pygame.Surface) -> None:
+        if not self._image or self._hide_image:
+            return
+
+        # only the part of the image that's on screen gets scaled
+        world, visible = self._image_rect(), self._viewport.visible()
+        x0, y0 = max(world.x, math.floor(visible.x)), max(world.y, math.floor(visible.y))
+        x1, y1 = min(world.x + world.w, math.ceil(visible.x + visible.w)), min(world.y + world.h, math.ceil(visible.y + visible.h))
+        if x1 > x0 and y1 > y0:
+            part = self._image.subsurface((x0 - world.x, y0 - world.y, x1 - x0, y1 - y0))
+            scale = self._viewport.scale
+            if scale != 1:
+                part = pygame.transform.scale(part, (round((x1 - x0) * scale), round((y1 - y0) * scale)))
+            surface.blit(part, self._viewport.to_screen(x0, y0))
+
+        # draw a frame around the image
+        screen = self._viewport.rect_to_screen(world)
+        left, top, right, bottom = screen.x, screen.y, screen.x + screen.w, screen.y + screen.h
+        pygame.draw.rect(surface, (255, 0, 0), (left, top, screen.w, screen.h), 2)
+
+        # draw the bounds
+        size = self._path_size()
+        text = self._hud_font.render(f"{size.w}in", True, (0, 0, 0))
+        # draw it in the middle horizontally, and at the bottom vertically + 10 pixels
+        center, middle = (left + right) / 2, bottom + 10 + text.get_height() / 2
+        surface.blit(text, (center - text.get_width() / 2, bottom + 10))
+        # draw a line from either side of the text to the end of the image and then draw a '|' at the end of each line
+        pygame.draw.line(surface, (0, 0, 0), (center - text.get_width() / 2 - 10, middle), (left, middle))
+        pygame.draw.line(surface, (0, 0, 0), (center + text.get_width() / 2 + 10, middle), (right, middle))
+        pygame.draw.line(surface, (0, 0, 0), (left, middle - 5), (left, middle + 5))
+        pygame.draw.line(surface, (0, 0, 0), (right, middle - 5), (right, middle + 5))
+
+        # now do the same thing for the height
+        text = self._hud_font.render(f"{size.h}in", True, (0, 0, 0))
+        text = pygame.transform.rotate(text, 90)
+        # draw it in the middle vertically, and at the right horizontally + 10 pixels
+        center, middle = (top + bottom) / 2, right + 10 + text.get_width() / 2
+        surface.blit(text, (right + 10, center - text.get_height() / 2))
+        # draw a line from either side of the text to the end of the image and then draw a '|' at the end of each line
+        pygame.draw.line(surface, (0, 0, 0), (middle, center - text.get_height() / 2 - 10), (middle, top))
+        pygame.draw.line(surface, (0, 0, 0), (middle, center + text.get_height() / 2 + 10), (middle, bottom))
+        pygame.draw.line(surface, (0, 0, 0), (middle - 5, top), (middle + 5, top))
+        pygame.draw.line(surface, (0, 0, 0), (middle - 5, bottom), (middle + 5, bottom))
+
+    """
+    Colour of a point in the path layer, selection and highlights are drawn on top by the overlay
+    """
+    def _base_color(self, p: Point) -> tuple[int, int, int]:
+        if p._locked:
+            return (255, 0, 0)
+        elif p is self._points[0]:
+            return (0, 0, 255)
+        elif p is self._points[-1]:
+            return (255, 0, 0)
+        elif p._id == -1:
+            return (255, 0, 0)
+        return (0, 255, 0)
+
+    def _draw_path_layer(self, surface: pygame.Surface) -> None:
+        self._draw_path_rect(surface, surface.get_rect())
+
+    """
+    Draws the part of the path inside rect (screen coordinates). Only points and lines that can touch it are
+    drawn, they're found through the spatial index so what's off screen costs nothing
+    """
+    def _draw_path_rect(self, surface: pygame.Surface, rect: pygame.Rect) -> None:
+        view = self._viewport
+        world = view.rect_to_world(Rect(rect.x, rect.y, rect.w, rect.h))
+        size = self._point_size * view.scale
+        width = max(1, int(view.scale))
+
+        r = self._point_size + 1
+        for p in self._index.query_rect(world.x - r, world.y - r, world.w + 2 * r, world.h + 2 * r):
+            pygame.draw.circle(surface, self._base_color(p), view.to_screen(p.x, p.y), size)
+
+        # draw connecting lines
+        reach = Editor._LINK_REACH
+        left, top, right, bottom = world.x, world.y, world.x + world.w, world.y + world.h
+        near = self._index.query_rect(left - reach, top - reach, world.w + 2 * reach, world.h + 2 * reach)
+        for p in near + list(self._long_links.values()):
+            n = p.next()
+            # skip lines that can't touch the rect
+            if n is None or max(p.x, n.x) < left or min(p.x, n.x) > right or max(p.y, n.y) < top or min(p.y, n.y) > bottom:
+                continue
+            color = (255, 0, 0) if p._locked and n._locked else (0, 0, 0)
+            pygame.draw.line(surface, color, view.to_screen(p.x, p.y), view.to_screen(n.x, n.y), width)
+
+    def _draw_overlay_layer(self, surface: pygame.Surface) -> None:
+        highlights = {id(p): c for p, c in reversed(self._highlight_points)}
+        special = [p for p, _ in self._highlight_points] + [p for p in (self._selected_point, self._hover_point) if p is not None]
+        for p in special:
+            if id(p) in highlights:
+                color = highlights[id(p)]
+            elif p._locked or p is not self._selected_point:
+                color = self._base_color(p)
+            else:
+                color = (0, 0, 255) if not self._connect_mode else (255, 255, 0)
+            size = self._point_size * self._viewport.scale * (1.2 if p is self._hover_point else 1)
+            pygame.draw.circle(surface, color, self._viewport.to_screen(p.x, p.y), size)
+
+    def _overlay_key(self) -> tuple:
+        hover, selected = self._hover_point, self._selected_point
+        return (id(hover), hover and (hover.x, hover.y), id(selected), selected and (selected.x, selected.y),
+                self._connect_mode, id(self._highlight_points), len(self._highlight_points))
+
+    """
+    Lines longer than _LINK_REACH can't be found by looking around a dirty rect, they're kept in _long_links
+    """
+    def _track_link(self, p: Point) -> None:
+        self._estimate = None  # moves and link changes come through here
+        self._revision += 1
+        n = p.next()
+        if n is not None and max(abs(n.x - p.x), abs(n.y - p.y)) > Editor._LINK_REACH:
+            self._long_links[id(p)] = p
+        else:
+            self._long_links.pop(id(p), None)
+
+    """
+    Marks the area a point and the lines to its neighbours cover as dirty in the path layer
+    """
+    def _invalidate_point(self, p: Point) -> None:
+        self._sync_view()
+        xs, ys = [p.x], [p.y]
+        for q in (p.next(), p.prev()):
+            if q is not None:
+                xs.append(q.x)
+                ys.append(q.y)
+        r = self._point_size * 1.2 + 1
+        screen = self._viewport.rect_to_screen(Rect(min(xs) - r, min(ys) - r, max(xs) - min(xs) + 2 * r, max(ys) - min(ys) + 2 * r))
+        self._layers["path"].invalidate((math.floor(screen.x) - 1, math.floor(screen.y) - 1, math.ceil(screen.w) + 3, math.ceil(screen.h) + 3))
+
     def _keybind_open(self) -> None:
         path = filedialog.askopenfilename(initialdir=os.getcwd(), title="Select Image", filetypes=(("project/picture", "*.cncproj *.png *.jpg *.jpeg *.bmp"), ("all files", "*.*")))
         if not path.endswith(".cncproj"):
@@ -189,23 +411,225 @@ class Editor(h_Editor):
         else:
             self._load_project(path)
 
+    """
+    Read-only copy of the path for background jobs, the user can keep editing while they run
+    """
+    def _snapshot(self) -> PointStore:
+        return PointStore.from_points(self._points).snapshot()
+
+    def _job_status(self) -> str | None:
+        return ", ".join(f"{job.name} {job.fraction:.0%}" for job in self._jobs.active()) or None
+
+    """
+    Job work that writes the program and simulates it on the machine, returns both
+    """
+    def _gcode_job(self) -> Callable[[Job], tuple[str, MotionProfile]]:
+        snapshot, size, origin, ppin, arcs, machine = self._snapshot(), self._image.get_size(), self._origin, self._PPIN, self._arc_tolerance, self._machine
+
+        def work(job: Job) -> tuple[str, MotionProfile]:
+            gcode = GCode.generate_gcode(snapshot, size, origin, ppin=ppin, arc_tolerance=arcs)
+            job.progress(0.5)
+            profile = Motion.simulate(Motion.parse(gcode), machine)
+            print(f"[INFO] Cycle time: {profile.summary()}")
+            return gcode, profile
+        return work
+
+    def _btn_get_gcode(self) -> None:
+        revision = self._revision
+
+        def done(result: tuple[str, MotionProfile]) -> None:
+            if revision == self._revision:
+                self._estimate = result[1]
+            Util.open_notepad_with(result[0])
+        self._jobs.submit("G-code", self._gcode_job(), done, group="gcode")
+
+    def _btn_estimate(self) -> None:
+        revision = self._revision
+
+        def done(result: tuple[str, MotionProfile]) -> None:
+            if revision != self._revision:
+                print("[WARN] The path changed while its cycle time was being estimated, try again")
+                return
+            self._estimate = result[1]
+        self._jobs.submit("Estimate", self._gcode_job(), done, group="estimate")
+
     def _btn_validate_path(self) -> None:
         if len(self._highlight_points) > 0:
             self._highlight_points = []
             return
         
-        error_points = GCode.validate_path(self._points)
-        self._highlight_points = [(p, (255, 0, 0)) for p in error_points]
+        # snapshot rows line up with the list at the time of the click
+        live, snapshot, revision = list(self._points), self._snapshot(), self._revision
+
+        def validate(job: Job) -> list[tuple[Point, tuple[int, int, int]]]:
+            diagnostics = GCode.validate_path(snapshot)
+            print(f"[{'INFO' if diagnostics.ok else 'WARN'}] Validated path: {diagnostics.summary()}")
+            # contour ends are left alone, every traced contour has them
+            highlights = [(live[i], (255, 0, 0)) for i in diagnostics.dangling.tolist()]
+            highlights += [(live[i], (255, 0, 255)) for i in diagnostics.multiple_predecessors.tolist()]
+            highlights += [(live[i], (255, 128, 0)) for i in diagnostics.asymmetric.tolist()]
+            highlights += [(live[i], (128, 0, 255)) for cycle in diagnostics.cycles for i in cycle.tolist()]
+            return highlights
+
+        def done(highlights: list[tuple[Point, tuple[int, int, int]]]) -> None:
+            # the highlighted points might not be in the path anymore
+            if revision != self._revision:
+                print("[WARN] The path changed while it was being validated, try again")
+                return
+            self._highlight_points = highlights
+        self._jobs.submit("Validate", validate, done, group="validate")
+
+    def _btn_optimize_order(self) -> None:
+        # rows of the plan line up with the list at the time of the click
+        live, snapshot, revision = list(self._points), self._snapshot(), self._revision
+
+        # only the planning runs on the worker, the order is applied on the main thread. Any edit in between
+        # (a move or relink keeps the point count) makes the plan wrong, it's dropped instead of applied
+        def apply(result) -> None:
+            rows, report = result
+            if revision != self._revision:
+                print("[WARN] The path changed while it was being ordered, the new order was dropped, try again")
+                return
+            before = PointState(live)
+            ToolPath.apply_order(live, rows)
+            self._set_points(live)
+            self._journal.record(before.diff("Optimize Order", live))
+            self._saved = False
+            print(f"[INFO] Ordered path: {report.summary(self._PPIN)}")
+
+        gap = 3 * self._point_density
+        self._jobs.submit("Optimize", lambda job: ToolPath.plan_order(snapshot, gap), apply, group="optimize")
+
+    def _btn_simplify_path(self) -> None:
+        before = PointState(self._points)
+        report = ToolPath.simplify(self._points, self._simplify_tolerance, self._PPIN)
+        self._set_points(self._points)
+        self._journal.record(before.diff("Simplify Path", self._points))
+        self._saved = False
+        print(f"[INFO] Simplified path: {report.summary()}")
+
+    """
+    Samples the open image's contours again at another density, only the sampling runs again (no edge detection).
+    Without contours (nothing or a project is open) only the density for the next image changes.
+    """
+    def _set_point_density(self, density: int) -> None:
+        density = max(1, min(density, self._MAX_DENSITY))
+        if density == self._point_density:
+            return
+        old, self._point_density = self._point_density, density
+        if self._contours is None:
+            return
+
+        paths = self._contours.take(self._contours.sample(density))
+        paths.translate(*self._contours_offset)
+        before = self._points
+        self._set_points(Util.points_from_paths(paths))
+        self._journal.record(SetDensity(before, list(self._points), old, density))
+        self._saved = False
+
+    """
+    Runs an edit that takes the point list and returns the new one, recorded as a single undo step
+    """
+    def _bulk_edit(self, name: str, edit: Callable[[list[Point]], list[Point]]) -> None:
+        before = PointState(self._points)
+        self._set_points(edit(self._points))
+        self._journal.record(before.diff(name, self._points))
+        self._saved = False
+
+    """
+    Every change to the point list has to go through these so the spatial index stays in sync
+    """
+    def _set_points(self, points: list[Point]) -> None:
+        self._points = points
+        self._estimate = None
+        self._revision += 1
+        if self._hover_point is not None and not any(p is self._hover_point for p in points):
+            self._hover_point = None
+        self._index.rebuild(points)
+        self._bounds.reset(points)
+        # same test as _track_link, inlined since it runs for every point
+        reach = Editor._LINK_REACH
+        self._long_links = {id(p): p for p in points if (n := p._next) is not None and max(abs(n.x - p.x), abs(n.y - p.y)) > reach}
+        self._layers["path"].invalidate()
+
+    def _add_point(self, p: Point, index: int | None = None) -> None:
+        # the old last point changes colour
+        if self._points:
+            self._invalidate_point(self._points[-1])
+        self._points.insert(len(self._points) if index is None else index, p)
+        self._estimate = None
+        self._revision += 1
+        self._index.insert(p)
+        self._bounds.add(p.x, p.y)
+        self._invalidate_point(p)
+
+    """
+    Returns where p was in the list, None if it isn't in it
+    """
+    def _remove_point(self, p: Point) -> int | None:
+        # list.remove would match any point at the same position
+        index = next((i for i, q in enumerate(self._points) if q is p), None)
+        if index is None:
+            return None
+        self._invalidate_point(p)
+        ends = self._points[0] is p or self._points[-1] is p
+        del self._points[index]
+        if self._hover_point is p:
+            self._hover_point = None
+        self._estimate = None
+        self._revision += 1
+        self._index.remove(p)
+        self._bounds.remove(p.x, p.y)
+        self._long_links.pop(id(p), None)
+        if ends and self._points:
+            self._invalidate_point(self._points[0])
+            self._invalidate_point(self._points[-1])
+        return index
+
+    def _move_point(self, p: Point, x: float, y: float) -> None:
+        self._invalidate_point(p)
+        self._bounds.move((p.x, p.y), (x, y))
+        p.set_pos(x, y)
+        self._index.update(p)
+        self._track_link(p)
+        if p.prev() is not None:
+            self._track_link(p.prev())
+        self._invalidate_point(p)
 
     def _load_image(self) -> None:
         if self._image_path:
-            img = cv2.imread(self._image_path)
-            self._image = pygame.image.load(self._image_path)
-            Util.async_task((
-                lambda: setattr(self, "_points", Util.get_path_points(img, self._point_density, (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 - self._image.get_height() / 2))),
-                lambda: setattr(self, "_points", Util.clean_points(self._points)),
-                lambda: setattr(self, "_points", Util.connect_points(self._points))
-            ))
+            path, density = self._image_path, self._point_density
+            self._image = pygame.image.load(path)
+            # whatever still runs on the old path is stale now, the density control waits for the new contours
+            self._jobs.cancel("validate", "optimize", "estimate")
+            self._contours = None
+            offset = (self._editor_frame.get_width() / 2 - self._image.get_width() / 2, self._editor_frame.get_height() / 2 - self._image.get_height() / 2)
+            # tracing in tiles does more work in total, it's only worth it with cores to spread it over
+            tile_size = Contours.TILE_SIZE if (os.cpu_count() or 1) >= 3 else None
+
+            # the points come out thinned and linked contour by contour, no clean/connect pass afterwards.
+            # An image that was opened before comes straight from the cache without being decoded or traced
+            def extract(job: Job) -> tuple[ContourPaths, list[Point]]:
+                extraction = self._cache.extract(path, density, tile_size, progress=job.progress)
+                with self._profiler.span("extract.points"):
+                    points = Util.points_from_paths(extraction.sampled(offset))
+                print(f"[INFO] Extraction cache: {self._cache.refresh_stats().summary()}")
+                return extraction.paths, points
+
+            def done(result: tuple[ContourPaths, list[Point]]) -> None:
+                contours, points = result
+                self._contours, self._contours_offset = contours, offset
+                # the density was changed while the image was extracting
+                if self._point_density != density:
+                    paths = contours.take(contours.sample(self._point_density))
+                    paths.translate(*offset)
+                    points = Util.points_from_paths(paths)
+                with self._profiler.span("extract.set_points"):
+                    self._set_points(points)
+                self._journal.clear()
+
+            # opening another image supersedes this one
+            self._jobs.submit("Extract", extract, done, group="image")
 
     """
     Calculate the position of the mouse relative to the machine's origin
@@ -215,6 +639,9 @@ class Editor(h_Editor):
             return (p.x - self._editor_frame.get_width() / 2, p.y - self._editor_frame.get_height() / 2)
 
     def _setup_menubar(self) -> None:
+        # the menu bar is a native win32 one, elsewhere the same actions only have their keys
+        if os.name != "nt":
+            return
         hwnd = pygame.display.get_wm_info()['window']
         menu_definition = [
         {'text': 'File', 'id': 101, 'sub_menu': [
@@ -227,6 +654,10 @@ class Editor(h_Editor):
         {'text': 'Edit', 'id': 102, 'sub_menu': [
             {'text': 'Undo', 'id': 301, 'callback': self._undo},
             {'text': 'Redo', 'id': 302, 'callback': self._redo}
+        ]},
+        {'text': 'Debug', 'id': 103, 'sub_menu': [
+            {'text': 'Profiler Overlay (F3)', 'id': 401, 'callback': self._toggle_profiler},
+            {'text': 'Record Trace (F4)', 'id': 402, 'callback': self._toggle_trace}
         ]}
         # Add more menu items/submenus as needed
     ]
@@ -236,12 +667,12 @@ class Editor(h_Editor):
     
     def _setup_toolbar(self) -> None:
         self._tool_components.append(_GCodeButton := Button(location=(10, 10), size=(180, 30), text="Get GCODE", font=self._hud_font,
-                                            callback=lambda: GCode.generate_gcode(self._points, self._image.get_size(), self._origin),
+                                            callback=self._btn_get_gcode,
                                             true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
         _GCodeButton.draw = Util.wrap_function(_GCodeButton.draw, lambda: _GCodeButton.set_disabled(len(self._points) < 2), 'pre')
 
         self._tool_components.append(_ConnectPointsButton := Button(location=(10, 50), size=(180, 30), text="Recalc Path", font=self._hud_font,
-                                            callback=lambda: setattr(self, "_points", Util.connect_points(self._points)),
+                                            callback=lambda: self._bulk_edit("Recalc Path", Util.connect_points),
                                             true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
         _ConnectPointsButton.draw = Util.wrap_function(_ConnectPointsButton.draw, lambda: _ConnectPointsButton.set_disabled(len(self._points) < 2), 'pre')
 
@@ -262,37 +693,66 @@ class Editor(h_Editor):
         _HideImageButton.draw = Util.wrap_function(_HideImageButton.draw, lambda: _HideImageButton.set_text("Hide Image" + (" (ON)" if self._hide_image else " (OFF)")), 'pre')
 
         self._tool_components.append(_ClearnConnectionsButton := Button(location=(10, 210), size=(180, 30), text="Clear Connections", font=self._hud_font,
-                                                                        callback=lambda: Util.reconnect_points(self._points),
+                                                                        callback=lambda: self._bulk_edit("Clear Connections", Util.reconnect_points),
                                                                         true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
         _ClearnConnectionsButton.draw = Util.wrap_function(_ClearnConnectionsButton.draw, lambda: _ClearnConnectionsButton.set_disabled(len(self._points) < 2), 'pre')
 
         self._tool_components.append(_ClearPointMetaDataButton := Button(location=(10, 250), size=(180, 30), text="Clear Point MetaData", font=self._hud_font,
-                                                                        callback=lambda: Util.clear_point_metadata(self._points),
+                                                                        callback=lambda: self._bulk_edit("Clear Point MetaData", Util.clear_point_metadata),
                                                                         true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
         _ClearPointMetaDataButton.draw = Util.wrap_function(_ClearPointMetaDataButton.draw, lambda: _ClearPointMetaDataButton.set_disabled(len(self._points) < 2), 'pre')
 
+        self._tool_components.append(_OptimizeOrderButton := Button(location=(10, 290), size=(180, 30), text="Optimize Order", font=self._hud_font,
+                                                                    callback=self._btn_optimize_order,
+                                                                    true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _OptimizeOrderButton.draw = Util.wrap_function(_OptimizeOrderButton.draw, lambda: _OptimizeOrderButton.set_disabled(len(self._points) < 2), 'pre')
+
+        self._tool_components.append(_SimplifyPathButton := Button(location=(10, 330), size=(180, 30), text="Simplify Path", font=self._hud_font,
+                                                                   callback=self._btn_simplify_path,
+                                                                   true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _SimplifyPathButton.draw = Util.wrap_function(_SimplifyPathButton.draw, lambda: _SimplifyPathButton.set_disabled(len(self._points) < 3), 'pre')
+
+        # point density: - [density] +, the middle is just a label
+        self._tool_components.append(_DensityDownButton := Button(location=(10, 370), size=(40, 30), text="-", font=self._hud_font,
+                                                                  callback=lambda: self._set_point_density(self._point_density - 1),
+                                                                  true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _DensityDownButton.draw = Util.wrap_function(_DensityDownButton.draw, lambda: _DensityDownButton.set_disabled(self._point_density <= 1), 'pre')
+
+        self._tool_components.append(_DensityLabel := Button(location=(55, 370), size=(90, 30), text="", font=self._hud_font, callback=None,
+                                                             true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _DensityLabel.draw = Util.wrap_function(_DensityLabel.draw, lambda: (_DensityLabel.set_text(f"{self._point_density} px"), _DensityLabel.set_disabled(True)), 'pre')
+
+        self._tool_components.append(_DensityUpButton := Button(location=(150, 370), size=(40, 30), text="+", font=self._hud_font,
+                                                                callback=lambda: self._set_point_density(self._point_density + 1),
+                                                                true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _DensityUpButton.draw = Util.wrap_function(_DensityUpButton.draw, lambda: _DensityUpButton.set_disabled(self._point_density >= self._MAX_DENSITY), 'pre')
+
+        self._tool_components.append(_EstimateButton := Button(location=(10, 410), size=(180, 30), text="Estimate Time", font=self._hud_font,
+                                                               callback=self._btn_estimate,
+                                                               true_conversion=lambda x, y: (x - self._screen.get_width() + 200, y)))
+        _EstimateButton.draw = Util.wrap_function(_EstimateButton.draw, lambda: _EstimateButton.set_disabled(len(self._points) < 2), 'pre')
+
     
-    # TODO: test this
     def _save_project(self, path: str) -> None:
-        with open(path, 'w') as f:
-            f.write(json.dumps({
-                'points': [p.to_dict() for p in self._points],
-                'origin': self._origin,
-                'point_density': self._point_density,
-                'image_path': self._image_path
-            }))
+        # same as Project.upgrade_file, an older file is kept instead of silently replaced
+        if backup := Project.backup_older(path):
+            print(f"[INFO] Upgrading {path} to version {Project.VERSION}, the old file is kept as {backup}")
+        Project(self._points, self._origin, self._point_density, self._image_path).save(path)
     
-    # TODO: test this
     def _load_project(self, path: str) -> None:
-        with open(path, 'r') as f:
-            data = json.loads(f.read())
-            self._points = [Point.from_dict(p) for p in data['points']]
-            Util.reconnect_points(self._points)
-            self._origin = data['origin']
-            self._point_density = data['point_density']
-            self._image_path = data['image_path']
-            self._image = pygame.image.load(self._image_path)
-            self._open_project = path
+        if (version := Project.version_of(path)) < Project.VERSION:
+            print(f"[INFO] {path} is an older project file, it will be upgraded to version {Project.VERSION} when it's saved (the original is kept as {path}.v{version}.bak)")
+
+        project = Project.load(path, progress=lambda f: print(f"[INFO] Loading {path}: {f:.0%}"))
+        self._jobs.cancel("image", "validate", "optimize", "estimate")
+        self._set_points(project.points.to_points())
+        self._journal.clear()
+        self._contours = None
+        self._origin = project.origin
+        self._point_density = project.point_density
+        self._image_path = project.image_path
+        self._image = pygame.image.load(self._image_path)
+        self._open_project = path
 
     def _keybind_save(self, save_as: bool) -> None:
         if save_as or not self._open_project:
@@ -306,197 +766,244 @@ class Editor(h_Editor):
         self._saved = True
 
     def _undo(self) -> None:
-        if len(self._undo_stack) > 0:
-            action = self._undo_stack.pop()
-            self._redo_stack.append(action)
-            if action['action'] == 'add':
-                self._points.remove(action['point'])
-            elif action['action'] == 'move':
-                action['point'].set_pos(action['old'][0], action['old'][1])
-            elif action['action'] == 'remove':
-                self._points.append(action['point'])
-            elif action['action'] == 'lock':
-                action['point']._locked = not action['point']._locked
+        # the points under the cursor might not be in the path anymore, the next mouse move finds them again
+        self._selected_point = None
+        self._hover_point = None
+        if entry := self._journal.undo(self):
+            print(f"[INFO] Undid {entry.name}")
+            self._saved = False
 
     def _redo(self) -> None:
-        if len(self._redo_stack) > 0:
-            action = self._redo_stack.pop()
-            self._undo_stack.append(action)
-            if action['action'] == 'add':
-                self._points.append(action['point'])
-            elif action['action'] == 'move':
-                action['point'].set_pos(action['old'][0], action['old'][1])
-
-    def run(self) -> None:
-        # event code needs to be moved over to ctypes because pygame drains the message queue before we can get to it
+        self._selected_point = None
+        self._hover_point = None
+        if entry := self._journal.redo(self):
+            print(f"[INFO] Redid {entry.name}")
+            self._saved = False
 
+    """
+    Runs until the window is closed. Every frame takes all the input the backend has (see EventBackend.poll),
+    and only draws when that input or anything else (a background task, an undo) changed what's on screen.
+    """
+    def run(self, backend: EventBackend | None = None) -> None:
+        backend = backend or EventBackend.default()
+        profiler = self._profiler
+        self._clock = backend.clock
+        caption = None
+        drawn = False
         while self._running:
-            self._clock.tick(60)
-
-            msg = ctypes.wintypes.MSG()
-            ret = ctypes.windll.user32.GetMessageW(ctypes.byref(msg), None, 0, 0)
-
-            ctypes.windll.user32.TranslateMessage(ctypes.byref(msg))
-            ctypes.windll.user32.DispatchMessageW(ctypes.byref(msg))
-
-            self._draw()
+            # phases of every pass: wait (frame cap and draining the input), events, draw and flip
+            frame = profiler.begin()
+            messages = backend.poll()
+            profiler.end("wait", frame)
+
+            events = profiler.begin()
+            # results of finished background jobs come in before the input, both only ever run here
+            finished = self._jobs.run_pending()
+            for msg in messages:
+                self._handle_message(msg)
+            title = f"Path Editor - [{self._open_project if self._open_project else 'Untitled'}{'' if self._saved else '*'}]"
+            if title != caption:
+                pygame.display.set_caption(title)
+                caption = title
+            profiler.end("events", events)
+
+            if messages or finished or not drawn or self._needs_redraw():
+                with profiler.span("draw"):
+                    self._draw()
+                with profiler.span("flip"):
+                    pygame.display.flip()
+                drawn = True
+            profiler.end("frame", frame)
+
+        self._jobs.shutdown()
+        pygame.quit()
 
+    """
+    Whether anything on screen changed without any input, the FPS in the HUD doesn't count
+    """
+    def _needs_redraw(self) -> bool:
+        if self._profiler.enabled or self._job_status() != self._hud_jobs:
+            return True
+        self._check_layers()
+        return self._viewport.key != self._frame_view or any(layer.dirty for layer in self._layers.values())
+
+    def _handle_message(self, msg: Message) -> None:
+        if self._menu_bar is not None:
             self._menu_bar.handle_message(msg)
-            Util.apply([x.event for x in self._tool_components], event=msg)
-
-            # Window events ==============================
-            if msg.message == 161: # Seems to be interaction with the windowbar
-                if msg.wParam == 20: # 'X' button
-                    self._running = False
-                elif msg.wParam == 8: ... # minimize
-
-            elif msg.message == 512: # Mouse Motion
-                # account for zoom in pos using focus_point and zoom_level
-                old = (pygame.mouse.get_pos()[0] - self._zoom_focus[0]) / self._zoom_level + self._zoom_focus[0], (pygame.mouse.get_pos()[1] - self._zoom_focus[1]) / self._zoom_level + self._zoom_focus[1]
-                self._evaluated_mouse_pos = Util.get_zoomed_mouse_pos(pygame.mouse.get_pos(), self._zoom_level)
-
-                if self._selected_point and not self._connect_mode:
-                    self._selected_point.set_pos(self._evaluated_mouse_pos[0] + self._grab_offset[0], self._evaluated_mouse_pos[1] + self._grab_offset[1])
-                    self._saved = False
-                elif self._dragging:
-                    dX, dY = old[0] - self._last_mouse_pos[0], old[1] - self._last_mouse_pos[1]
-                    self._last_mouse_pos = old
-                    self._zoom_focus = (self._zoom_focus[0] - dX, self._zoom_focus[1] - dY)
-                else:
-                    for p in self._points:
-                        if abs(p.x - self._evaluated_mouse_pos[0]) < self._point_size and abs(p.y - self._evaluated_mouse_pos[1]) < self._point_size:
-                            self._hover_point = p
-                            break
-                        else:
-                            self._hover_point = None
-            
-            elif msg.message == 513: # Mouse Button Down
-                if msg.wParam == 1:
-                    canDrag = True
-                    pointFound = False
-                    for p in self._points:
-                        if abs(p.x - self._evaluated_mouse_pos[0]) < self._point_size and abs(p.y - self._evaluated_mouse_pos[1]) < self._point_size:
-                            pointFound = True
-                            if not p._locked and not self._connect_mode:
-                                self._selected_point = p
-                                self._grab_offset = (p.x - self._evaluated_mouse_pos[0], p.y - self._evaluated_mouse_pos[1])
-                                self._undo_stack.append({'action': 'move', 'old': (p.x, p.y), 'point': p})
-                                self._saved = False
-                                canDrag = False
-
-                            if not p._locked and self._connect_mode:
-                                if self._selected_point is not None and self._selected_point != p:
-                                    self._selected_point._id = self._current_conection_id
-                                    print(f"[INFO] Set point's ID to {self._selected_point._id}/{self._current_conection_id}")
-                                    self._current_conection_id += 1
-                                    self._saved = False
-                                    self._points = Util.connect_points(self._points)
-                                self._selected_point = p
-                                self._last_point = p
-                    
-                    if not pointFound:
-                        self._selected_point = None
-
-                    if not self._dragging and canDrag:
-                        self._last_mouse_pos = (pygame.mouse.get_pos()[0] - self._zoom_focus[0]) / self._zoom_level + self._zoom_focus[0], (pygame.mouse.get_pos()[1] - self._zoom_focus[1]) / self._zoom_level + self._zoom_focus[1]
-                        self._dragging = True
-
-            elif msg.message == 514: # left click up
-                if not self._connect_mode:
+        Util.apply([x.event for x in self._tool_components], event=msg)
+        self._mouse_pos = msg.pos
+
+        # Window events ==============================
+        if msg.message == 16: # WM_CLOSE, the window closed outside of win32 (pygame, end of a replayed session)
+            self._running = False
+
+        elif msg.message == 161: # Seems to be interaction with the windowbar
+            if msg.wParam == 20: # 'X' button
+                self._running = False
+            elif msg.wParam == 8: ... # minimize
+
+        elif msg.message == 512: # Mouse Motion
+            # mouse position in the world (where the points are), accounting for zoom and pan
+            self._evaluated_mouse_pos = Util.get_zoomed_mouse_pos(msg.pos, self._viewport)
+
+            if self._selected_point and not self._connect_mode:
+                p = self._selected_point
+                old = (p.x, p.y)
+                self._move_point(p, self._evaluated_mouse_pos[0] + self._grab_offset[0], self._evaluated_mouse_pos[1] + self._grab_offset[1])
+                # the moves of one drag are merged into a single entry, see the left click up
+                self._journal.record(MovePoint(p, old, (p.x, p.y)))
+                self._saved = False
+            elif self._dragging:
+                mouse = msg.pos
+                self._viewport.pan(mouse[0] - self._last_mouse_pos[0], mouse[1] - self._last_mouse_pos[1])
+                self._last_mouse_pos = mouse
+            else:
+                self._hover_point = self._index.nearest(self._evaluated_mouse_pos[0], self._evaluated_mouse_pos[1], self._point_size)
+
+        elif msg.message == 513: # Mouse Button Down
+            if msg.wParam == 1:
+                canDrag = True
+                pointFound = False
+                p = self._index.nearest(self._evaluated_mouse_pos[0], self._evaluated_mouse_pos[1], self._point_size)
+                if p is not None:
+                    pointFound = True
+                    if not p._locked and not self._connect_mode:
+                        self._selected_point = p
+                        self._grab_offset = (p.x - self._evaluated_mouse_pos[0], p.y - self._evaluated_mouse_pos[1])
+                        canDrag = False
+
+                    if not p._locked and self._connect_mode:
+                        if self._selected_point is not None and self._selected_point is not p:
+                            before = PointState(self._points)
+                            self._selected_point._id = self._current_conection_id
+                            print(f"[INFO] Set point's ID to {self._selected_point._id}/{self._current_conection_id}")
+                            self._current_conection_id += 1
+                            self._saved = False
+                            self._set_points(Util.connect_points(self._points))
+                            self._journal.record(before.diff("Connect", self._points))
+                        self._selected_point = p
+                        self._last_point = p
+
+                if not pointFound:
                     self._selected_point = None
-                self._dragging = False
-            
-            elif msg.message == 516: # right click down
-                if not self._selected_point and self._image and not self._hide_image and not self._connect_mode:
-                    self._points.append(Point(self._evaluated_mouse_pos[0], self._evaluated_mouse_pos[1]))
-                    self._undo_stack.append({'action': 'add', 'point': self._points[-1]})
-                    self._saved = False
-                
-                elif self._connect_mode and self._hover_point:
-                    self._hover_point._next = None
+
+                if not self._dragging and canDrag:
+                    self._last_mouse_pos = msg.pos
+                    self._dragging = True
+
+        elif msg.message == 514: # left click up
+            self._journal.seal()
+            if not self._connect_mode:
+                self._selected_point = None
+            self._dragging = False
+
+        elif msg.message == 516: # right click down
+            if not self._selected_point and self._image and not self._hide_image and not self._connect_mode:
+                self._add_point(Point(self._evaluated_mouse_pos[0], self._evaluated_mouse_pos[1]))
+                self._journal.record(AddPoint(self._points[-1], len(self._points) - 1))
+                self._saved = False
+
+            elif self._connect_mode and self._hover_point:
+                before = PointState([self._hover_point], order=False)
+                self._invalidate_point(self._hover_point)
+                self._hover_point._next = None
+                self._track_link(self._hover_point)
+                self._journal.record(before.diff("Unlink"))
+                self._saved = False
+
+        elif msg.message == 517: # right click up
+            ...
+
+        elif msg.message == 256: # Key Down
+            self._pressed_keys[msg.wParam] = True
+            if msg.wParam == 79 and self._pressed_keys.get(17, False): # Ctrl + O
+                self._keybind_open()
+
+            elif msg.wParam == 90 and self._pressed_keys.get(17, False) and self._pressed_keys.get(16, False): # Ctrl + Shift + Z
+                self._redo()
+
+            elif msg.wParam == 90 and self._pressed_keys.get(17, False): # Ctrl + Z
+                self._undo()
+
+            elif msg.wParam == 83 and self._pressed_keys.get(17, False): # Ctrl + S
+                self._keybind_save(False)
+
+            elif msg.wParam == 83 and self._pressed_keys.get(17, False) and self._pressed_keys.get(16, False): # Ctrl + Shift + S
+                self._keybind_save(True)
+
+
+            elif msg.wParam == 76: # L
+                if self._hover_point is not None:
+                    before = PointState([self._hover_point], order=False)
+                    self._hover_point._locked = not self._hover_point._locked
+                    self._invalidate_point(self._hover_point)
+                    self._journal.record(before.diff("Lock"))
                     self._saved = False
 
-            elif msg.message == 517: # right click up
-                ...
+            elif msg.wParam == 67: # C
+                self._viewport.reset()
 
-            elif msg.message == 256: # Key Down
-                self._pressed_keys[msg.wParam] = True
-                if msg.wParam == 79 and self._pressed_keys.get(17, False): # Ctrl + O
-                    self._keybind_open()
+            elif msg.wParam == 70: # F
+                if debugpy.is_client_connected():
+                    debugpy.breakpoint()
+                else:
+                    print("Debugger not connected")
 
-                elif msg.wParam == 90 and self._pressed_keys.get(17, False) and self._pressed_keys.get(16, False): # Ctrl + Shift + Z
-                    self._redo()
+            elif msg.wParam == 114: # F3
+                self._toggle_profiler()
 
-                elif msg.wParam == 90 and self._pressed_keys.get(17, False): # Ctrl + Z
-                    self._undo()
+            elif msg.wParam == 115: # F4
+                self._toggle_trace()
 
-                elif msg.wParam == 83 and self._pressed_keys.get(17, False): # Ctrl + S
-                    self._keybind_save(False)
-                
-                elif msg.wParam == 83 and self._pressed_keys.get(17, False) and self._pressed_keys.get(16, False): # Ctrl + Shift + S
-                    self._keybind_save(True)
+            elif msg.wParam == 46: # Delete
+                if self._hover_point and (index := self._remove_point(self._hover_point)) is not None:
+                    self._journal.record(RemovePoint(self._hover_point, index))
+                    self._hover_point = None
+                    self._saved = False
 
+        elif msg.message == 257: # Key Up
+            self._pressed_keys[msg.wParam] = False
 
-                elif msg.wParam == 76: # L
-                    if self._hover_point is not None:
-                        self._hover_point._locked = not self._hover_point._locked
-                        self._saved = False
-                        self._undo_stack.append({'action': 'lock', 'point': self._hover_point})
-                
-                elif msg.wParam == 67: # C
-                    self._zoom_focus = (self._editor_frame.get_width() / 2, self._editor_frame.get_height() / 2)
-                    self._zoom_level = 1
-                
-                elif msg.wParam == 70: # F
-                    if debugpy.is_client_connected():
-                        debugpy.breakpoint()
-                    else:
-                        print("Debugger not connected")
-
-                elif msg.wParam == 46: # Delete
-                    if self._hover_point:
-                        self._undo_stack.append({'action': 'remove', 'point': self._hover_point})
-                        self._points.remove(self._hover_point)
-                        self._hover_point = None
-                        self._saved = False
-
-            elif msg.message == 257: # Key Up
-                self._pressed_keys[msg.wParam] = False
-
-            elif msg.message == 275: # corse scroll
-                direction = ctypes.c_int16(msg.wParam).value
-            
-            elif msg.message == 522: # fine scroll
-                direction = -1 if 420_000_000_0 > msg.wParam else 1 # TODO: this line is bad fix it later
-                self._zoom_level = min(max(self._zoom_level + (direction * 0.2), 1), 5)
-
-            elif msg.message == 258: # num-key 8/2 basically up/down
-                if msg.wParam == 56:
-                    self._current_conection_id += 1
-                    print(f"[INFO] Current Connection ID: {self._current_conection_id}")
-                elif msg.wParam == 50:
-                    self._current_conection_id -= 1
-                    print(f"[INFO] Current Connection ID: {self._current_conection_id}")
+        elif msg.message == 275: # corse scroll
+            direction = ctypes.c_int16(msg.wParam).value
 
-            else:
-                pass
-                # print(msg.message, msg.wParam, msg.lParam)
+        elif msg.message == 522: # fine scroll
+            direction = -1 if ctypes.c_int16(msg.wParam >> 16).value > 0 else 1 # wheel delta is the signed high word
+            scale = min(max(self._viewport.scale + (direction * 0.2), 1), 5)
+            with self._profiler.span("zoom"):
+                self._viewport.zoom_at((self._editor_frame.get_width() / 2, self._editor_frame.get_height() / 2), scale)
 
-            if not self._saved:
-                pygame.display.set_caption(f"Path Editor - [{self._open_project if self._open_project else 'Untitled'}*]")
-            else:
-                pygame.display.set_caption(f"Path Editor - [{self._open_project if self._open_project else 'Untitled'}]")
+        elif msg.message == 258: # num-key 8/2 basically up/down
+            if msg.wParam == 56:
+                self._current_conection_id += 1
+                print(f"[INFO] Current Connection ID: {self._current_conection_id}")
+            elif msg.wParam == 50:
+                self._current_conection_id -= 1
+                print(f"[INFO] Current Connection ID: {self._current_conection_id}")
 
-            self._draw()
-            pygame.display.flip()
+        else:
+            pass
+            # print(msg.message, msg.wParam, msg.lParam)
 
-        pygame.quit()
 
 
 
                 
 if __name__ == "__main__":
+    import argparse
+    from ui.events import HeadlessBackend, RecordingBackend
+    parser = argparse.ArgumentParser(description="Path Editor")
+    parser.add_argument("--record", default=None, help="save the session's input to this file on exit")
+    parser.add_argument("--replay", default=None, help="play back a recorded session instead of taking input")
+    args = parser.parse_args()
+
     pygame.init()
     pygame.display.set_caption("Path Editor")
     editor = Editor()
-    editor.run()
\ No newline at end of file
+    backend = HeadlessBackend.load(args.replay) if args.replay else EventBackend.default()
+    if args.record:
+        backend = RecordingBackend(backend)
+    editor.run(backend)
+    if args.record:
+        backend.save(args.record)
+        print(f"[INFO] Recorded {len(backend.frames)} frames to {args.record}")
\ No newline at end of file
@@ -0,0 +1,376 @@
+import math
+import numpy as np
+from typing import Iterable
+from dataclasses import dataclass
+
+
+@dataclass
+class MachineLimits:
+    """
+    What the machine can do, in inches (programs in mm are simulated with these converted)
+    """
+    max_feed: tuple[float, float] = (200.0, 200.0)     # in/min per axis, G0 moves run at these
+    acceleration: tuple[float, float] = (10.0, 10.0)   # in/s^2 per axis
+    junction_deviation: float = 0.0005                 # in, how far corners may be rounded off (grbl's $11)
+
+
+@dataclass
+class Program:
+    """
+    The moves of a parsed program, one row per move that goes somewhere. Coordinates are in the program's units.
+    """
+    start: np.ndarray   # (n, 2) where every move starts
+    end: np.ndarray     # (n, 2)
+    mode: np.ndarray    # 0 rapid (G0), 1 line (G1), 2/3 clockwise/counter-clockwise arc (G2/G3)
+    feed: np.ndarray    # units/min, nan for rapids
+    center: np.ndarray  # (n, 2) arc centers, nan for G0/G1
+    lines: np.ndarray   # program line of every move, 0 based
+    units: str          # "in" (G20, the default) or "mm" (G21)
+    line_count: int
+
+    def __len__(self) -> int:
+        return len(self.mode)
+
+
+@dataclass
+class MotionProfile:
+    """
+    Result of Motion.simulate. Every move is a trapezoid (or triangle) velocity profile: it starts at entry,
+    speeds up at accel to peak, holds it and slows down to exit. Speeds are in units/s.
+    """
+    program: Program
+    length: np.ndarray
+    accel: np.ndarray
+    entry: np.ndarray
+    peak: np.ndarray
+    exit: np.ndarray
+    duration: np.ndarray    # seconds
+
+    @property
+    def seconds(self) -> float:
+        return float(self.duration.sum())
+
+    @property
+    def cut_distance(self) -> float:
+        return float(self.length[self.program.mode != 0].sum())
+
+    @property
+    def rapid_distance(self) -> float:
+        return float(self.length[self.program.mode == 0].sum())
+
+    @property
+    def has_rapids(self) -> bool:
+        return bool((self.program.mode == 0).any())
+
+    @property
+    def rapid_seconds(self) -> float:
+        return float(self.duration[self.program.mode == 0].sum())
+
+    """
+    Speed of the given moves at distance along them
+    """
+    def speed(self, rows: np.ndarray, distance: np.ndarray) -> np.ndarray:
+        a = self.accel[rows]
+        up = np.sqrt(self.entry[rows] ** 2 + 2 * a * distance)
+        down = np.sqrt(self.exit[rows] ** 2 + 2 * a * np.maximum(self.length[rows] - distance, 0))
+        return np.minimum(np.minimum(up, down), self.peak[rows])
+
+    def summary(self) -> str:
+        units = self.program.units
+        rapid = self.rapid_seconds
+        text = (f"{Motion.format_seconds(self.seconds)} for {len(self.program)} moves: {self.cut_distance:.1f}{units} cut in "
+                f"{Motion.format_seconds(self.seconds - rapid)}, {self.rapid_distance:.1f}{units} rapid in {Motion.format_seconds(rapid)}")
+        if len(self.program) and not self.has_rapids:
+            # GCode.generate_gcode writes every move as G1/G2/G3, the travel between contours runs at the feedrate
+            text += " (no G0 moves, travel between paths is counted as cut)"
+        return text
+
+
+class Motion:
+    """
+    Cycle time estimates of G-code programs. parse() reads a program into arrays and simulate() runs the
+    moves through a motion planner like grbl's: every move accelerates and decelerates within the per axis
+    limits, corners are taken as fast as the junction deviation allows and arcs no faster than their radius
+    allows. Both are vectorized, the planner's forward and backward passes are cumulative minimums over
+    squared speeds (v_exit^2 <= v_entry^2 + 2*a*length), so millions of moves take a few seconds.
+    Positions are absolute (G90), the Z axis isn't simulated.
+    """
+    _CHUNK = 1 << 22 # bytes of program parsed at once
+    _POW10 = 10.0 ** np.arange(64)
+    _AXES = {"X": 0, "Y": 1, "I": 2, "J": 3, "F": 4}
+
+    @staticmethod
+    def format_seconds(seconds: float) -> str:
+        if seconds < 60:
+            return f"{seconds:.1f}s"
+        minutes, s = divmod(int(round(seconds)), 60)
+        hours, m = divmod(minutes, 60)
+        return f"{hours}h {m:02d}m {s:02d}s" if hours else f"{m}m {s:02d}s"
+
+    """
+    Reads a program from a string or any iterable of pieces of one (file objects, GCode.iter_gcode).
+    Raises ValueError for feed moves without a feedrate and for relative positioning (G91).
+    """
+    @staticmethod
+    def parse(source: str | Iterable[str]) -> Program:
+        words = [[] for _ in Motion._AXES] # per line values of every axis word, chunk by chunk
+        motion = []
+        units = "in"
+        lines = 0
+        for chunk in Motion._chunks(source):
+            values, g, chunk_units = Motion._parse_chunk(chunk)
+            for column, value in zip(words, values):
+                column.append(value)
+            motion.append(g)
+            lines += len(g)
+            units = chunk_units or units
+
+        if not motion:
+            empty = np.empty((0, 2))
+            return Program(empty, empty, np.empty(0, np.int8), np.empty(0), empty, np.empty(0, np.int64), units, 0)
+        x, y, i, j, f = (np.concatenate(column) for column in words)
+        g = np.concatenate(motion)
+
+        # words are modal: a line without one keeps the last value given
+        moves = ~np.isnan(x) | ~np.isnan(y)
+        rows = np.flatnonzero(moves)
+        mode = Motion._fill(g, 0)[rows].astype(np.int8)
+        end = np.column_stack((Motion._fill(x, 0)[rows], Motion._fill(y, 0)[rows]))
+        feed = Motion._fill(f, np.nan)[rows]
+        start = np.vstack((np.zeros((1, 2)), end[:-1]))
+
+        offset = np.nan_to_num(np.column_stack((i[rows], j[rows])))
+        arc = mode >= 2
+        # an arc without a center offset has no circle to follow, it's cut as a line
+        mode[arc & ~offset.any(axis=1)] = 1
+        arc = mode >= 2
+        center = np.where(arc[:, None], start + offset, np.nan)
+
+        # moves that end where they start do nothing (unless they're full circles)
+        keep = arc | (end != start).any(axis=1)
+        start, end, mode, feed, center, rows = start[keep], end[keep], mode[keep], feed[keep], center[keep], rows[keep]
+        feed[mode == 0] = np.nan
+
+        missing = np.flatnonzero((mode != 0) & ~(feed > 0))
+        if len(missing):
+            raise ValueError(f"Line {rows[missing[0]] + 1}: feed move without a feedrate")
+        return Program(start, end, mode, feed, center, rows, units, lines)
+
+    @staticmethod
+    def _chunks(source: str | Iterable[str]) -> Iterable[bytes]:
+        # pieces of about _CHUNK bytes that end on a line break, however the source was split up
+        def joined() -> Iterable[bytes]:
+            pending, size = [], 0
+            for piece in ((source,) if isinstance(source, str) else source):
+                pending.append(piece)
+                size += len(piece)
+                if size >= Motion._CHUNK:
+                    yield "".join(pending).encode("ascii", "replace")
+                    pending, size = [], 0
+            yield "".join(pending).encode("ascii", "replace")
+
+        rest = b""
+        for data in joined():
+            data, pos = rest + data, 0
+            while len(data) - pos >= Motion._CHUNK:
+                cut = data.rfind(b"\n", pos, pos + Motion._CHUNK) + 1
+                if cut <= pos: # a line longer than a chunk
+                    cut = data.find(b"\n", pos) + 1
+                    if not cut:
+                        break
+                yield data[pos:cut]
+                pos = cut
+            rest = data[pos:]
+        if rest:
+            yield rest if rest.endswith(b"\n") else rest + b"\n"
+
+    """
+    One chunk of whole lines to per line arrays of the X, Y, I, J and F words (nan where a line has none),
+    the line's motion G code and the units set by the chunk (None if it doesn't). Works on the bytes: every
+    letter (and every line break) starts a word, the digits up to the next one are its number. A number is
+    read as an integer of all its digits over a power of ten, which rounds exactly like float() does.
+    """
+    @staticmethod
+    def _parse_chunk(data: bytes) -> tuple[list[np.ndarray], np.ndarray, str | None]:
+        b = np.frombuffer(data, np.uint8)
+        newline = b == 10
+        folded = b | 32 # lower case
+        letter = (folded >= 97) & (folded <= 122)
+        digit = (b >= 48) & (b <= 57)
+        dot, minus = b == 46, b == 45
+        if b"(" in data or b";" in data:
+            # (comments) end at the closing bracket or the end of the line, ;comments at the end of the line
+            line = np.cumsum(newline, dtype=np.int32) - newline
+            starts = np.concatenate(([0], np.flatnonzero(newline)[:-1] + 1))
+            opened, closed, semicolon = b == 40, b == 41, b == 59
+            depth = np.cumsum(opened, dtype=np.int32) - np.cumsum(closed, dtype=np.int32)
+            depth -= (depth - opened + closed)[starts][line] # as it was where the line starts
+            semicolons = np.cumsum(semicolon, dtype=np.int32)
+            text = ~((depth > 0) | closed | (semicolons - (semicolons - semicolon)[starts][line] > 0))
+            letter &= text
+            digit &= text
+            dot &= text
+            minus &= text
+
+        marks = letter | newline
+        at = np.flatnonzero(marks)
+        word = np.cumsum(marks, dtype=np.int32) - 1
+        code = folded[at]
+        where = np.cumsum(code == (10 | 32)) # line of every word, line breaks are words of their own
+        line_count = int(where[-1])
+        count = len(at)
+
+        digits = np.flatnonzero(digit)
+        of = word[digits]
+        per_word = np.bincount(of, minlength=count)
+        ends = np.cumsum(per_word) # one past the last digit of every word
+        place = np.minimum(ends[of] - np.arange(1, len(digits) + 1), 63)
+        mantissa = np.bincount(of, weights=(b[digits] - 48) * Motion._POW10[place], minlength=count)
+        # digits after the dot: from the first digit past it to the end of the word's digits
+        dots = np.flatnonzero(dot)
+        fraction = np.zeros(count, np.int64)
+        fraction[word[dots]] = ends[word[dots]] - np.searchsorted(digits, dots)
+        value = mantissa / Motion._POW10[np.minimum(fraction, 63)]
+        value[word[np.flatnonzero(minus)]] *= -1
+        valid = per_word > 0
+
+        values = []
+        for name in Motion._AXES:
+            column = np.full(line_count, np.nan)
+            found = valid & (code == ord(name.lower()))
+            column[where[found]] = value[found]
+            values.append(column)
+
+        g = valid & (code == ord("g"))
+        if np.any(value[g] == 91):
+            raise ValueError("Relative positioning (G91) isn't supported")
+        motion = np.full(line_count, np.nan)
+        modal = g & np.isin(value, (0, 1, 2, 3))
+        motion[where[modal]] = value[modal]
+        unit_codes = value[g & np.isin(value, (20, 21))]
+        units = None if not len(unit_codes) else ("mm" if unit_codes[-1] == 21 else "in")
+        return values, motion, units
+
+    @staticmethod
+    def _fill(values: np.ndarray, initial: float) -> np.ndarray:
+        # forward fill of the nan gaps, initial before the first value
+        index = np.where(np.isnan(values), 0, np.arange(1, len(values) + 1))
+        np.maximum.accumulate(index, out=index)
+        return np.concatenate(([initial], values))[index]
+
+    @staticmethod
+    def simulate(program: Program, limits: MachineLimits | None = None) -> MotionProfile:
+        limits = limits or MachineLimits()
+        scale = 25.4 if program.units == "mm" else 1.0
+        max_speed = np.array(limits.max_feed, dtype=np.float64) * scale / 60
+        max_accel = np.array(limits.acceleration, dtype=np.float64) * scale
+        deviation = limits.junction_deviation * scale
+
+        start, end, mode = program.start, program.end, program.mode
+        n = len(mode)
+        chord = end - start
+        length = np.hypot(chord[:, 0], chord[:, 1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            into = chord / length[:, None]
+        out = into.copy()
+        radius = np.full(n, np.inf)
+
+        arc = mode >= 2
+        if arc.any():
+            center = program.center[arc]
+            a, b = start[arc] - center, end[arc] - center
+            r = np.hypot(a[:, 0], a[:, 1])
+            a0, a1 = np.arctan2(a[:, 1], a[:, 0]), np.arctan2(b[:, 1], b[:, 0])
+            ccw = mode[arc] == 3
+            sweep = np.where(ccw, a1 - a0, a0 - a1) % (2 * np.pi)
+            sweep[sweep < 1e-9] = 2 * np.pi # back where it started, a full circle
+            length[arc] = r * sweep
+            radius[arc] = r
+            turn = np.where(ccw, 1.0, -1.0)[:, None]
+            into[arc] = turn * np.column_stack((-np.sin(a0), np.cos(a0)))
+            out[arc] = turn * np.column_stack((-np.sin(a1), np.cos(a1)))
+
+        # limits along every move: a line is held back by the axis that has to move fastest for it,
+        # an arc turns through every direction so it gets the lower of the axis limits
+        share = np.where(arc[:, None], 1.0, np.abs(into))
+        with np.errstate(divide="ignore"):
+            speed_limit = np.min(max_speed / share, axis=1)
+            accel = np.min(max_accel / share, axis=1)
+        peak = np.minimum(np.where(mode == 0, np.inf, program.feed / 60), speed_limit)
+        peak = np.minimum(peak, np.sqrt(accel * radius)) # centripetal acceleration on arcs
+
+        # squared speed limits at the n + 1 move boundaries: stopped at both ends, in between whatever the
+        # junction deviation allows for the angle between the moves (grbl's formula) and both moves allow
+        cos_theta = -np.einsum("ij,ij->i", out[:-1], into[1:])
+        sin_half = np.sqrt(np.clip(0.5 * (1 - cos_theta), 0, 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            junction = np.minimum(accel[:-1], accel[1:]) * deviation * sin_half / (1 - sin_half)
+        junction = np.minimum(np.nan_to_num(junction, nan=np.inf), np.minimum(peak[:-1], peak[1:]) ** 2)
+        limit = np.concatenate(([0.0], junction, [0.0]))
+
+        # the backward pass keeps every move able to slow down to the next boundary's speed, the forward pass
+        # keeps it able to get up to it. With P the running sum of 2*a*length both are a cumulative minimum:
+        # backward w[i] = min(limit[k] + P[k], k >= i) - P[i], forward w[i] = min(w[k] - P[k], k <= i) + P[i]
+        reach = 2 * accel * length
+        P = np.concatenate(([0.0], np.cumsum(reach)))
+        w = np.minimum.accumulate((limit + P)[::-1])[::-1] - P
+        w = np.maximum(np.minimum.accumulate(w - P) + P, 0)
+
+        entry, exit = np.sqrt(w[:-1]), np.sqrt(w[1:])
+        top = np.minimum(np.sqrt((reach + w[:-1] + w[1:]) / 2), peak)
+        top = np.maximum(top, np.maximum(entry, exit)) # rounding, a move never has to be slower than its ends
+        speeding = (top ** 2 - w[:-1]) / (2 * accel)
+        slowing = (top ** 2 - w[1:]) / (2 * accel)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cruise = np.nan_to_num(np.maximum(length - speeding - slowing, 0) / top)
+        duration = (top - entry) / accel + (top - exit) / accel + cruise
+        return MotionProfile(program, length, accel, entry, top, exit, duration)
+
+    """
+    Draws the simulated moves into a size x size (long side) BGR image: feed moves coloured by their speed
+    from blue (stopped) to red (fastest in the program), rapids grey. The moves are sampled about once per pixel.
+    """
+    @staticmethod
+    def backplot(profile: MotionProfile, size: int = 2048, max_samples: int = 1 << 25) -> np.ndarray:
+        import cv2
+        program = profile.program
+        image = np.full((size, size, 3), 255, dtype=np.uint8)
+        if not len(program):
+            return image
+
+        corners = np.vstack((program.start, program.end))
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        margin = 8
+        scale = (size - 2 * margin) / max(float((high - low).max()), 1e-9)
+        height = int(math.ceil((high[1] - low[1]) * scale)) + 2 * margin
+        width = int(math.ceil((high[0] - low[0]) * scale)) + 2 * margin
+        image = image[:height, :width].copy()
+
+        samples = np.maximum(np.ceil(profile.length * scale), 1)
+        if samples.sum() > max_samples:
+            samples = np.maximum(np.ceil(samples * max_samples / samples.sum()), 1)
+        samples = samples.astype(np.int64)
+        rows = np.repeat(np.arange(len(program)), samples)
+        t = (np.arange(len(rows)) - np.repeat(np.cumsum(samples) - samples, samples) + 0.5) / samples[rows]
+
+        xy = program.start[rows] + t[:, None] * (program.end[rows] - program.start[rows])
+        arc = program.mode[rows] >= 2
+        if arc.any():
+            arc_rows = rows[arc]
+            center = program.center[arc_rows]
+            a = program.start[arc_rows] - center
+            r = np.hypot(a[:, 0], a[:, 1])
+            angle = np.arctan2(a[:, 1], a[:, 0]) + np.where(program.mode[arc_rows] == 3, 1, -1) * t[arc] * profile.length[arc_rows] / r
+            xy[arc] = center + r[:, None] * np.column_stack((np.cos(angle), np.sin(angle)))
+
+        px = np.clip(np.rint((xy[:, 0] - low[0]) * scale) + margin, 0, width - 1).astype(np.int64)
+        py = np.clip(np.rint((high[1] - xy[:, 1]) * scale) + margin, 0, height - 1).astype(np.int64) # machine Y points up
+
+        speed = profile.speed(rows, t * profile.length[rows])
+        cutting = program.mode[rows] != 0
+        fastest = float(profile.peak[program.mode != 0].max()) if (program.mode != 0).any() else 1.0
+        palette = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), cv2.COLORMAP_JET).reshape(-1, 3)
+        colors = np.full((len(rows), 3), 170, dtype=np.uint8)
+        colors[cutting] = palette[np.clip(speed[cutting] / fastest * 255, 0, 255).astype(np.int64)]
+        image[py, px] = colors
+        return image
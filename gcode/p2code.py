@@ -1,73 +1,351 @@
+import math
+import numpy as np
+from typing import Iterator
+from dataclasses import dataclass
+
 from header.h_point import h_Point
 
 try:
     from ..helper.mutil import Origin, Util
+    from ..helper.pointstore import PointStore
 except ImportError:
     from helper.mutil import Origin, Util
+    from helper.pointstore import PointStore
+
+@dataclass
+class PathDiagnostics:
+    """
+    Result of GCode.validate_path. Everything is expressed as row numbers into `points`
+    (list indices, or PointStore rows when a store was validated).
+    """
+    points: list[h_Point] | PointStore
+    rows: np.ndarray                    # row of every validated point
+    labels: np.ndarray                  # connected component of every point (indices into rows)
+    cycles: list[np.ndarray]            # points that lie on each cycle
+    dangling: np.ndarray                # ends of broken off pieces that have other problems too
+    multiple_predecessors: np.ndarray   # points that are the next point of more than one point
+    asymmetric: np.ndarray              # a.next is b but b.prev isn't a (or the other way around)
+    contour_ends: np.ndarray            # ends of the other clean chains, every traced contour is one so these are expected
+
+    @property
+    def component_count(self) -> int:
+        return len(np.unique(self.labels))
+
+    @property
+    def components(self) -> list[np.ndarray]:
+        order = np.argsort(self.labels, kind="stable")
+        splits = np.flatnonzero(np.diff(self.labels[order])) + 1
+        return [self.rows[c] for c in np.split(order, splits)] if len(order) else []
+
+    """
+    Separate contours aren't a problem, the path is fine as long as every one of them is a clean chain
+    """
+    @property
+    def ok(self) -> bool:
+        return not self.cycles and len(self.dangling) == 0 and len(self.multiple_predecessors) == 0 and len(self.asymmetric) == 0
+
+    def error_rows(self) -> np.ndarray:
+        return np.unique(np.concatenate([self.dangling, self.multiple_predecessors, self.asymmetric, *self.cycles]).astype(np.int64))
+
+    def error_points(self) -> list[h_Point]:
+        if isinstance(self.points, PointStore):
+            return [self.points.view(row) for row in self.error_rows().tolist()]
+        return [self.points[row] for row in self.error_rows().tolist()]
+
+    def summary(self) -> str:
+        return (f"{len(self.rows)} points, {self.component_count} components ({len(self.contour_ends)} other contours), "
+                f"{len(self.cycles)} cycles, {len(self.dangling)} dangling ends, {len(self.multiple_predecessors)} branches, "
+                f"{len(self.asymmetric)} asymmetric links")
+
 
 class GCode:
+    """
+    Checks the next/prev graph of the path. Works on index arrays only: components and cycles are found by
+    pointer jumping along the next links (log2(n) vectorized passes), so it's cheap enough to run after every edit
+    """
     @staticmethod
-    def validate_path(points: list[h_Point]) -> list[h_Point]:
-        points = Util.copy_points(points)
-        points_sorted = []
-        errors = []
+    def validate_path(points: list[h_Point] | PointStore) -> PathDiagnostics:
+        if isinstance(points, PointStore):
+            rows = points.rows()
+            remap = np.full(len(points), -1, dtype=np.int64)
+            remap[rows] = np.arange(len(rows))
+            nxt, prv = points.next[rows].astype(np.int64), points.prev[rows].astype(np.int64)
+            nxt = np.where(nxt >= 0, remap[np.maximum(nxt, 0)], -1)
+            prv = np.where(prv >= 0, remap[np.maximum(prv, 0)], -1)
+        else:
+            rows = np.arange(len(points))
+            index = {id(p): i for i, p in enumerate(points)}
+            # links to points that aren't in the list count as missing
+            nxt = np.fromiter((index.get(id(p._next), -1) for p in points), np.int64, len(points))
+            prv = np.fromiter((index.get(id(p._prev), -1) for p in points), np.int64, len(points))
 
-        current = points.pop(0)
+        n = len(rows)
+        empty = np.empty(0, dtype=np.int64)
+        if n == 0:
+            return PathDiagnostics(points, rows, empty, [], empty, empty, empty, empty)
 
-        while len(points) > 0:
-            if current._next is None:
-                errors.append(current)
-                current = points.pop(0)
-                continue
-            
-            if current._next not in points:
-                errors.append(current)
-                current = points.pop(0)
-                continue
+        # every point follows its next link, ends point at themselves. After enough doublings every point
+        # has landed on the end or cycle its chain runs into, and `lowest` holds the smallest index seen on the way
+        nodes = np.arange(n)
+        jump = np.where(nxt >= 0, nxt, nodes)
+        lowest = np.minimum(nodes, jump)
+        for _ in range(max(1, int(n - 1).bit_length())):
+            lowest = np.minimum(lowest, lowest[jump])
+            jump = jump[jump]
+        labels = lowest[jump]
+
+        # only ends and cycle members can be reached after n steps
+        sinks = np.zeros(n, dtype=bool)
+        sinks[jump] = True
+        on_cycle = np.flatnonzero(sinks & (nxt >= 0))
+        cycles = []
+        if len(on_cycle):
+            order = on_cycle[np.argsort(labels[on_cycle], kind="stable")]
+            splits = np.flatnonzero(np.diff(labels[order])) + 1
+            cycles = [rows[c] for c in np.split(order, splits)]
 
-            i = points.index(current._next)
-            if i > len(points) - 1:
-                break
-            current = points.pop(i)
-            points_sorted.append(current)
+        linked = nxt >= 0
+        predecessors = np.bincount(nxt[linked], minlength=n)
+        multiple = np.flatnonzero(predecessors > 1)
 
-        return errors
+        bad_next = np.flatnonzero(linked & (prv[np.maximum(nxt, 0)] != nodes))
+        has_prev = prv >= 0
+        bad_prev = np.flatnonzero(has_prev & (nxt[np.maximum(prv, 0)] != nodes))
+        asymmetric = np.union1d(bad_next, bad_prev)
 
+        # the end of the biggest component is the end of the path, every other end is a break. Tracing leaves
+        # every contour as its own chain, so a break only counts as a problem when its piece has other problems
+        ends = np.flatnonzero(~linked)
+        main = np.argmax(np.bincount(labels))
+        ends = ends[labels[ends] != main]
+        broken = np.zeros(n, dtype=bool)
+        broken[labels[np.concatenate((on_cycle, multiple, asymmetric)).astype(np.int64)]] = True
+        dangling, contour_ends = ends[broken[labels[ends]]], ends[~broken[labels[ends]]]
+
+        return PathDiagnostics(points, rows, labels, cycles, rows[dangling], rows[multiple], rows[asymmetric], rows[contour_ends])
+
+    _CHUNK = 1 << 16
+    _FRACTIONS = [f"{i:03d}".rstrip("0") or "0" for i in range(1000)]
+
+    """
+    Formats coordinates exactly like str(round(v, 3)) does (under 1e15), without going through float repr for
+    every value. values * 1000 isn't exact, values that land close to a half thousandth go through round() itself.
+    """
     @staticmethod
-    def generate_gcode(points: list[h_Point], size: tuple[float, float], origin: int, feedrate: float = 10.0) -> None:
-        points = Util.copy_points(points)
+    def _format_coords(values: np.ndarray) -> list[str]:
+        scaled = values * 1000
+        thousandths = np.rint(scaled).astype(np.int64)
+        ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-9 * np.maximum(np.abs(scaled), 1))
+        for i in ties.tolist():
+            thousandths[i] = int(round(round(float(values[i]), 3) * 1000))
+        whole = np.abs(thousandths)
+        # round() keeps the sign of small negative values, str(-0.0) is "-0.0"
+        signs = np.where(np.signbit(values), "-", "").tolist()
+        return [f"{s}{i}.{GCode._FRACTIONS[f]}" for s, i, f in zip(signs, (whole // 1000).tolist(), (whole % 1000).tolist())]
 
-        points = sorted(points, key=lambda p: p._id)
+    """
+    Coordinates of the path in _id order (the order the program is cut in), in chunks of _CHUNK points
+    """
+    @staticmethod
+    def _ordered_xy(points: list[h_Point] | PointStore) -> Iterator[np.ndarray]:
+        if isinstance(points, PointStore):
+            rows = points.rows()
+            ordered = rows[np.argsort(points.ids[rows], kind="stable")]
+            for start in range(0, len(ordered), GCode._CHUNK):
+                yield points.xy[ordered[start:start + GCode._CHUNK]]
+            return
 
+        ordered = sorted(points, key=lambda p: p._id)
+        for start in range(0, len(ordered), GCode._CHUNK):
+            chunk = ordered[start:start + GCode._CHUNK]
+            xy = np.empty((len(chunk), 2), dtype=np.float64)
+            xy[:, 0] = np.fromiter((p.x for p in chunk), np.float64, len(chunk))
+            xy[:, 1] = np.fromiter((p.y for p in chunk), np.float64, len(chunk))
+            yield xy
 
-        # points = Util.Transform.shift(points, (-230, -250))
-        points = Util.Transform.hflip(points)
+    @staticmethod
+    def iter_gcode(points: list[h_Point] | PointStore, size: tuple[float, float], origin: int, feedrate: float = 10.0, ppin: float | None = None,
+                   arc_tolerance: float | None = None) -> Iterator[str]:
+        if ppin is None:
+            ppin = Util.get_editor()._PPIN
 
         if origin not in [Origin.CENTER]:
             raise ValueError("Invalid Origin")
-        
-        translated: list[float, float] = []
-        for p in points:
-            if origin == Origin.CENTER:
-                x, y = (p.x - size[0] / 2, p.y - size[1] / 2)
-            
-            # convert to inches & add to list
-            translated.append((x / Util.get_editor()._PPIN, y / Util.get_editor()._PPIN))
-
-        code = "(Generated by PyCNC)\n"
-
-        for p in points:
-            index = points.index(p)
-            # round to three decimal places, if the number is a integer add a decimal point
-            x = str(round(translated[index][0], 3))
-            if x[-2:] == ".0":
-                x = x[:-2] + "." + x[-1]
-            y = str(round(translated[index][1], 3))
-            if y[-2:] == ".0":
-                y = y[:-2] + "." + y[-1]
-            feedrate = str(feedrate)
-            if feedrate[-2:] == ".0":
-                feedrate = feedrate[:-2] + "." + feedrate[-1]
-            code += f"G1 X{x} Y{y} F{feedrate}\n"
-        
-        Util._async(lambda: Util.open_notepad_with(code))
\ No newline at end of file
+
+        feedrate = str(feedrate)
+        half_w, half_h = size[0] / 2, size[1] / 2
+
+        yield "(Generated by PyCNC)\n"
+
+        # the tool's position at the end of the previous chunk, arcs start from there
+        last = None
+
+        # work through the path in fixed size chunks so memory stays flat no matter how long it is
+        for xy in GCode._ordered_xy(points):
+            # flip horizontally, move to the origin and convert to inches
+            xs = (-xy[:, 0] - half_w) / ppin
+            ys = (xy[:, 1] - half_h) / ppin
+
+            if arc_tolerance is None:
+                for x, y in zip(GCode._format_coords(xs), GCode._format_coords(ys)):
+                    yield f"G1 X{x} Y{y} F{feedrate}\n"
+                continue
+
+            # fit on the coordinates as they'll be written, so arc ends sit exactly on the circle
+            machine = np.round(np.column_stack((xs, ys)), 3)
+            if last is None:
+                x, y = GCode._format_coords(machine[0])
+                yield f"G1 X{x} Y{y} F{feedrate}\n"
+            else:
+                machine = np.vstack((last, machine))
+            last = machine[-1:]
+
+            moves = GCode._fit_arcs(machine, arc_tolerance)
+            ends = machine[[move[0] for move in moves]]
+            for (end, direction, i, j), x, y in zip(moves, GCode._format_coords(ends[:, 0]), GCode._format_coords(ends[:, 1])):
+                if direction == 0:
+                    yield f"G1 X{x} Y{y} F{feedrate}\n"
+                else:
+                    yield f"G{direction} X{x} Y{y} I{i:.4f} J{j:.4f} F{feedrate}\n"
+
+    _MAX_ARC_RADIUS = 100.0 # inches, anything flatter is left as lines
+
+    """
+    Greedy arc fitting along xy (xy[0] is where the tool already is). Every move is (end, direction, i, j):
+    direction 0 is a G1 to xy[end], 2/3 a G2/G3 (clockwise/counter-clockwise) to xy[end] whose center is
+    (i, j) away from where it starts. Runs are grown by doubling and then bisected back to the longest that fits,
+    short runs that fit but hardly bend keep growing but are only used once they bend by more than the tolerance.
+    """
+    @staticmethod
+    def _fit_arcs(xy: np.ndarray, tolerance: float) -> list[tuple[int, int, float, float]]:
+        moves = []
+        n = len(xy)
+        possible = GCode._arc_possible(xy, tolerance)
+        s = 0
+        while s < n - 1:
+            # most points of a jagged path can't even start an arc, don't go through _fit_arc for those
+            if s >= len(possible) or not possible[s]:
+                moves.append((s + 1, 0, 0.0, 0.0))
+                s += 1
+                continue
+
+            best = None
+            good, bad = 1, n - s # a single step is always fine (as a line)
+            length = 2
+            while s + length < n:
+                arc = GCode._fit_arc(xy, s, s + length, tolerance)
+                if arc is None:
+                    bad = length
+                    break
+                if arc[3] > tolerance:
+                    best = (s + length, arc)
+                good = length
+                length *= 2
+            while bad - good > 1:
+                length = (good + bad) // 2
+                arc = GCode._fit_arc(xy, s, s + length, tolerance)
+                if arc is None:
+                    bad = length
+                else:
+                    if arc[3] > tolerance:
+                        best = (s + length, arc)
+                    good = length
+
+            if best is None:
+                moves.append((s + 1, 0, 0.0, 0.0))
+                s += 1
+            else:
+                end, (direction, i, j, _) = best
+                moves.append((end, direction, i, j))
+                s = end
+        return moves
+
+    """
+    Vectorized version of the cheap part of _fit_arc for every run of three points: is there a circle through
+    xy[s], xy[s + 1] and xy[s + 2] that isn't too big and doesn't bulge out too far from either step
+    """
+    @staticmethod
+    def _arc_possible(xy: np.ndarray, tolerance: float) -> np.ndarray:
+        a, m, b = xy[:-2], xy[1:-1], xy[2:]
+        d = 2 * (a[:, 0] * (m[:, 1] - b[:, 1]) + m[:, 0] * (b[:, 1] - a[:, 1]) + b[:, 0] * (a[:, 1] - m[:, 1]))
+        a2, m2, b2 = (a * a).sum(axis=1), (m * m).sum(axis=1), (b * b).sum(axis=1)
+        safe = np.where(np.abs(d) < 1e-12, 1, d)
+        cx = (a2 * (m[:, 1] - b[:, 1]) + m2 * (b[:, 1] - a[:, 1]) + b2 * (a[:, 1] - m[:, 1])) / safe
+        cy = (a2 * (b[:, 0] - m[:, 0]) + m2 * (a[:, 0] - b[:, 0]) + b2 * (m[:, 0] - a[:, 0])) / safe
+        r = np.hypot(a[:, 0] - cx, a[:, 1] - cy)
+
+        possible = (np.abs(d) >= 1e-12) & (r <= GCode._MAX_ARC_RADIUS)
+        for p, q in ((a, m), (m, b)):
+            half = np.hypot(*(q - p).T) / 2
+            possible &= r - np.sqrt(np.maximum(r * r - half * half, 0)) <= tolerance
+        return possible
+
+    """
+    Circle through the first, middle and last point of xy[s..e] if every point is within tolerance of it,
+    the points go round it one way only and the arc doesn't stray more than tolerance from the lines between them.
+    Returns (direction, i, j, bulge) or None, bulge is how far the arc is from the straight line between its ends.
+    """
+    @staticmethod
+    def _fit_arc(xy: np.ndarray, s: int, e: int, tolerance: float) -> tuple[int, float, float, float] | None:
+        (ax, ay), (mx, my), (bx, by) = xy[s].tolist(), xy[(s + e) // 2].tolist(), xy[e].tolist()
+        d = 2 * (ax * (my - by) + mx * (by - ay) + bx * (ay - my))
+        if abs(d) < 1e-12:
+            return None
+        a2, m2, b2 = ax * ax + ay * ay, mx * mx + my * my, bx * bx + by * by
+        cx = (a2 * (my - by) + m2 * (by - ay) + b2 * (ay - my)) / d
+        cy = (a2 * (bx - mx) + m2 * (ax - bx) + b2 * (mx - ax)) / d
+        r = math.hypot(ax - cx, ay - cy)
+        if r > GCode._MAX_ARC_RADIUS:
+            return None
+
+        rel = xy[s:e + 1] - (cx, cy)
+        if np.max(np.abs(np.hypot(rel[:, 0], rel[:, 1]) - r)) > tolerance:
+            return None
+
+        steps = np.diff(np.arctan2(rel[:, 1], rel[:, 0]))
+        steps = (steps + np.pi) % (2 * np.pi) - np.pi
+        ccw = (mx - ax) * (by - my) - (my - ay) * (bx - mx) > 0
+        if not (np.all(steps > 0) if ccw else np.all(steps < 0)):
+            return None
+
+        # a full circle is ambiguous
+        sweep = abs(float(steps.sum()))
+        if sweep >= 2 * np.pi - 1e-6:
+            return None
+        # how far the arc bulges out from the straight lines it replaces
+        if r * (1 - math.cos(float(np.max(np.abs(steps))) / 2)) > tolerance:
+            return None
+        return (3 if ccw else 2, cx - ax, cy - ay, r * (1 - math.cos(min(sweep, np.pi) / 2)))
+
+    """
+    Streams the program into anything with a write() (files, stdout, io buffers) or sendall() (sockets)
+    in chunks of about buffer_size characters. Returns the number of lines written.
+    """
+    @staticmethod
+    def write_gcode(sink, points: list[h_Point] | PointStore, size: tuple[float, float], origin: int, feedrate: float = 10.0,
+                    ppin: float | None = None, buffer_size: int = 1 << 16, arc_tolerance: float | None = None) -> int:
+        if hasattr(sink, "sendall"):
+            write = lambda chunk: sink.sendall(chunk.encode())
+        else:
+            write = sink.write
+
+        lines = 0
+        buffer: list[str] = []
+        buffered = 0
+        for line in GCode.iter_gcode(points, size, origin, feedrate, ppin, arc_tolerance):
+            buffer.append(line)
+            buffered += len(line)
+            lines += 1
+            if buffered >= buffer_size:
+                write("".join(buffer))
+                buffer.clear()
+                buffered = 0
+
+        if buffer:
+            write("".join(buffer))
+        return lines
+
+    @staticmethod
+    def generate_gcode(points: list[h_Point] | PointStore, size: tuple[float, float], origin: int, feedrate: float = 10.0, ppin: float | None = None,
+                       arc_tolerance: float | None = None) -> str:
+        return "".join(GCode.iter_gcode(points, size, origin, feedrate, ppin, arc_tolerance))
@@ -0,0 +1,365 @@
+import math, time
+import numpy as np
+from dataclasses import dataclass
+
+from header.h_point import h_Point
+
+try:
+    from ..helper.mutil import Util
+    from ..helper.pointstore import PointStore
+    from ..helper.spatial import SpatialIndex
+except ImportError:
+    from helper.mutil import Util
+    from helper.pointstore import PointStore
+    from helper.spatial import SpatialIndex
+
+
+@dataclass
+class OrderReport:
+    """
+    Result of ToolPath.plan_order. Travel is the length of all the jumps between segments, in pixels
+    """
+    segments: int
+    travel_before: float
+    travel_after: float
+    moves: int          # improving 2-opt / Or-opt moves applied after the nearest neighbour pass
+    seconds: float
+
+    def summary(self, ppin: float | None = None) -> str:
+        unit, scale = ("in", 1 / ppin) if ppin else ("px", 1)
+        saved = 1 - self.travel_after / self.travel_before if self.travel_before else 0
+        return (f"{self.segments} segments, air travel {self.travel_before * scale:.2f}{unit} -> "
+                f"{self.travel_after * scale:.2f}{unit} ({saved:.0%} less), {self.moves} refinements in {self.seconds * 1000:.0f} ms")
+
+
+@dataclass
+class SimplifyReport:
+    """
+    Result of ToolPath.simplify, every point on the path is one G1 line
+    """
+    points_before: int
+    points_after: int
+    tolerance: float    # inches
+    seconds: float
+
+    def summary(self) -> str:
+        saved = 1 - self.points_after / self.points_before if self.points_before else 0
+        return (f"{self.points_before} -> {self.points_after} G1 lines ({saved:.0%} fewer) "
+                f"at {self.tolerance}in tolerance in {self.seconds * 1000:.0f} ms")
+
+
+class _End:
+    __slots__ = ("x", "y", "segment")
+
+    def __init__(self, x: float, y: float, segment: int) -> None:
+        self.x, self.y, self.segment = x, y, segment
+
+
+class ToolPath:
+    _NEIGHBOURS = 8
+
+    """
+    Splits the path (in _id order, the order it's cut in) into segments: runs of linked points without a jump
+    longer than `gap` in them. Points with an _id of -1 aren't part of the path, the same as in connect_points
+    """
+    @staticmethod
+    def segments(store: PointStore, gap: float) -> list[np.ndarray]:
+        rows = store.rows()
+        rows = rows[store.ids[rows] != -1]
+        order = rows[np.argsort(store.ids[rows], kind="stable")]
+        if len(order) == 0:
+            return []
+
+        step = np.hypot(*np.diff(store.xy[order], axis=0).T)
+        linked = store.next[order[:-1]] == order[1:]
+        return np.split(order, np.flatnonzero(~linked | (step > gap)) + 1)
+
+    """
+    Chooses the order and direction every segment is cut in so the jumps between them are as short as possible:
+    a nearest neighbour tour over a spatial index of the segment ends, then 2-opt and Or-opt moves between
+    neighbouring ends until nothing improves or time_budget (seconds) runs out.
+    The first segment stays first and keeps its direction, that's where the machine starts.
+    Returns the rows in their new cutting order.
+    """
+    @staticmethod
+    def plan_order(store: PointStore, gap: float, time_budget: float = 1.0) -> tuple[np.ndarray, OrderReport]:
+        start_time = time.perf_counter()
+        segments = ToolPath.segments(store, gap)
+        m = len(segments)
+        if m == 0:
+            return np.empty(0, dtype=np.int64), OrderReport(0, 0.0, 0.0, 0, time.perf_counter() - start_time)
+
+        starts = [tuple(p) for p in store.xy[[s[0] for s in segments]].tolist()]
+        ends = [tuple(p) for p in store.xy[[s[-1] for s in segments]].tolist()]
+        before = sum(math.dist(ends[s], starts[s + 1]) for s in range(m - 1))
+
+        order, flipped = ToolPath._nearest_neighbour(starts, ends)
+        order, flipped, moves = ToolPath._refine(starts, ends, order, flipped, start_time + time_budget)
+
+        entry = lambda s: ends[s] if flipped[s] else starts[s]
+        exit = lambda s: starts[s] if flipped[s] else ends[s]
+        after = sum(math.dist(exit(a), entry(b)) for a, b in zip(order, order[1:]))
+
+        rows = np.concatenate([segments[s][::-1] if flipped[s] else segments[s] for s in order])
+        return rows, OrderReport(m, before, after, moves, time.perf_counter() - start_time)
+
+    @staticmethod
+    def _index(starts: list[tuple[float, float]], ends: list[tuple[float, float]]) -> SpatialIndex:
+        xy = np.array(starts + ends)
+        extent = float(np.max(xy.max(axis=0) - xy.min(axis=0)))
+        # about one segment end per cell
+        index = SpatialIndex(cell_size=max(extent / math.sqrt(len(xy)), 1.0))
+        return index
+
+    @staticmethod
+    def _nearest_neighbour(starts: list[tuple[float, float]], ends: list[tuple[float, float]]) -> tuple[list[int], list[bool]]:
+        m = len(starts)
+        index = ToolPath._index(starts, ends)
+        handles = []
+        for s in range(m):
+            handles.append((_End(*starts[s], s), _End(*ends[s], s)))
+            if s:
+                index.insert(handles[s][0])
+                index.insert(handles[s][1])
+
+        order, flipped = [0], [False] * m
+        x, y = ends[0]
+        for _ in range(m - 1):
+            nearest = index.nearest(x, y)
+            s = nearest.segment
+            # entering a segment through its end means cutting it backwards
+            flipped[s] = nearest is handles[s][1]
+            index.remove(handles[s][0])
+            index.remove(handles[s][1])
+            order.append(s)
+            x, y = starts[s] if flipped[s] else ends[s]
+        return order, flipped
+
+    """
+    Neighbour list 2-opt (reverse a run of segments, which also flips each of them) and Or-opt (move a run of
+    up to 3 segments somewhere else, either way round). Only ends close to each other are tried as new jumps.
+    """
+    @staticmethod
+    def _refine(starts: list[tuple[float, float]], ends: list[tuple[float, float]], order: list[int], flipped: list[bool],
+                deadline: float) -> tuple[list[int], list[bool], int]:
+        m = len(order)
+        if m < 3:
+            return order, flipped, 0
+
+        index = ToolPath._index(starts, ends)
+        for s in range(m):
+            index.insert(_End(*starts[s], s))
+            index.insert(_End(*ends[s], s))
+        radius = index._cell_size * 3
+        neighbours = []
+        for s in range(m):
+            near = {}
+            for x, y in (starts[s], ends[s]):
+                found = [(math.hypot(e.x - x, e.y - y), e.segment) for e in index.query_radius(x, y, radius) if e.segment != s]
+                for d, t in sorted(found)[:ToolPath._NEIGHBOURS]:
+                    near[t] = min(near.get(t, d), d)
+            neighbours.append(sorted(near, key=near.get))
+
+        pos = [0] * m
+        for p, s in enumerate(order):
+            pos[s] = p
+
+        dist = math.dist
+        entry = lambda s: ends[s] if flipped[s] else starts[s]
+        exit = lambda s: starts[s] if flipped[s] else ends[s]
+        gap = lambda p: dist(exit(order[p]), entry(order[p + 1])) if 0 <= p < m - 1 else 0.0
+
+        def reverse(i: int, j: int) -> None:
+            order[i:j + 1] = order[i:j + 1][::-1]
+            for p in range(i, j + 1):
+                s = order[p]
+                flipped[s] = not flipped[s]
+                pos[s] = p
+
+        def two_opt(i: int, j: int) -> float:
+            # reverse positions i..j: exit(i-1) -> exit(j) and entry(i) -> entry(j+1)
+            old = gap(i - 1) + gap(j)
+            new = dist(exit(order[i - 1]), exit(order[j])) + (dist(entry(order[i]), entry(order[j + 1])) if j < m - 1 else 0.0)
+            return old - new
+
+        def or_opt(i: int, length: int, k: int, backwards: bool) -> float:
+            # take positions i..i+length-1 out and put them between k and k+1
+            last = i + length - 1
+            a, b = (exit(order[last]), entry(order[i])) if backwards else (entry(order[i]), exit(order[last]))
+            removed = gap(i - 1) + gap(last) - (dist(exit(order[i - 1]), entry(order[last + 1])) if last < m - 1 else 0.0)
+            added = dist(exit(order[k]), a) + (dist(b, entry(order[k + 1])) if k < m - 1 else 0.0) - gap(k)
+            return removed - added
+
+        def move(i: int, length: int, k: int, backwards: bool) -> None:
+            block = order[i:i + length]
+            if backwards:
+                block.reverse()
+                for s in block:
+                    flipped[s] = not flipped[s]
+            del order[i:i + length]
+            at = k + 1 - (length if k > i else 0)
+            order[at:at] = block
+            for p in range(min(i, at), max(i + length, at + length)):
+                pos[order[p]] = p
+
+        moves = 0
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for i in range(1, m):
+                if time.perf_counter() >= deadline:
+                    break
+                for t in neighbours[order[i - 1]]:
+                    j = pos[t]
+                    if j >= i and two_opt(i, j) > 1e-9:
+                        reverse(i, j)
+                    elif j < i - 1 and two_opt(j + 1, i - 1) > 1e-9:
+                        reverse(j + 1, i - 1)
+                    else:
+                        continue
+                    moves += 1
+                    improved = True
+                    break
+
+                for length in (1, 2, 3):
+                    if i + length > m:
+                        break
+                    done = False
+                    for t in neighbours[order[i]]:
+                        k = pos[t]
+                        if i - 1 <= k < i + length:
+                            continue
+                        for backwards in (False, True):
+                            if or_opt(i, length, k, backwards) > 1e-9:
+                                move(i, length, k, backwards)
+                                moves += 1
+                                improved = done = True
+                                break
+                        if done:
+                            break
+                    if done:
+                        break
+        return order, flipped, moves
+
+    """
+    Puts the points in the cutting order from plan_order: ids are handed out again in that order
+    (reusing the same set of ids) and the whole order is linked into one chain, like connect_points does.
+    `rows` index the list (or store) the plan was made for. Lists are reordered in place.
+    """
+    @staticmethod
+    def apply_order(points: list[h_Point] | PointStore, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+
+        if isinstance(points, PointStore):
+            points._own()
+            points.ids[rows] = np.sort(points.ids[rows])
+            points.next[rows[:-1]] = rows[1:]
+            points.next[rows[-1]] = -1
+            points.prev[rows[1:]] = rows[:-1]
+            points.prev[rows[0]] = -1
+            return
+
+        path = [points[r] for r in rows.tolist()]
+        for p, i in zip(path, sorted(p._id for p in path)):
+            p._id = i
+        for a, b in zip(path, path[1:]):
+            a._next, b._prev = b, a
+        path[0]._prev = path[-1]._next = None
+
+        # points that aren't part of the path keep their place at the end
+        on_path = set(rows.tolist())
+        points[:] = path + [p for i, p in enumerate(points) if i not in on_path]
+
+    """
+    plan_order + apply_order in one go
+    """
+    @staticmethod
+    def optimize_order(points: list[h_Point] | PointStore, gap: float, time_budget: float = 1.0) -> OrderReport:
+        store = points if isinstance(points, PointStore) else PointStore.from_points(points)
+        rows, report = ToolPath.plan_order(store, gap, time_budget)
+        ToolPath.apply_order(points, rows)
+        print(f"[INFO] Ordered path: {report.summary()}")
+        return report
+
+
+    """
+    Douglas-Peucker over every segment of the path: drops points that are within `tolerance` (inches) of the
+    line the kept points around them make. Segment ends and locked points are always kept.
+    All the open ranges are split in the same numpy pass, so it takes one pass per level of the recursion.
+    """
+    @staticmethod
+    def simplify(points: list[h_Point] | PointStore, tolerance: float, ppin: float | None = None) -> SimplifyReport:
+        if ppin is None:
+            ppin = Util.get_editor()._PPIN
+
+        start_time = time.perf_counter()
+        store = points if isinstance(points, PointStore) else PointStore.from_points(points)
+        segments = ToolPath.segments(store, math.inf)
+        if not segments:
+            return SimplifyReport(0, 0, tolerance, time.perf_counter() - start_time)
+
+        order = np.concatenate(segments)
+        lengths = np.array([len(s) for s in segments])
+        fixed = np.zeros(len(order), dtype=bool)
+        fixed[np.cumsum(lengths) - lengths] = True
+        fixed[np.cumsum(lengths) - 1] = True
+        fixed |= (store.flags[order] & PointStore.LOCKED) != 0
+
+        keep = ToolPath._douglas_peucker(store.xy[order], np.flatnonzero(fixed), tolerance * ppin)
+
+        # link the kept points of every segment to each other, segment ends keep the links they had
+        segment_of = np.repeat(np.arange(len(segments)), lengths)[keep]
+        kept = order[keep]
+        same = segment_of[:-1] == segment_of[1:]
+        store._own()
+        store.next[kept[:-1][same]] = kept[1:][same]
+        store.prev[kept[1:][same]] = kept[:-1][same]
+        store.remove_rows(order[~keep])
+
+        if not isinstance(points, PointStore):
+            removed = set(order[~keep].tolist())
+            for row, (n, p) in enumerate(zip(store.next.tolist(), store.prev.tolist())):
+                if row not in removed:
+                    points[row]._next = points[n] if n >= 0 else None
+                    points[row]._prev = points[p] if p >= 0 else None
+            points[:] = [p for row, p in enumerate(points) if row not in removed]
+
+        return SimplifyReport(len(order), len(kept), tolerance, time.perf_counter() - start_time)
+
+    @staticmethod
+    def _douglas_peucker(xy: np.ndarray, fixed: np.ndarray, tolerance: float) -> np.ndarray:
+        keep = np.zeros(len(xy), dtype=bool)
+        keep[fixed] = True
+        a, b = fixed[:-1], fixed[1:]
+        t2 = tolerance * tolerance
+
+        while True:
+            open_ = b - a > 1
+            a, b = a[open_], b[open_]
+            if len(a) == 0:
+                return keep
+
+            # every point strictly inside every range, tagged with the range it belongs to
+            counts = b - a - 1
+            offsets = np.cumsum(counts) - counts
+            group = np.repeat(np.arange(len(a)), counts)
+            inner = np.arange(counts.sum()) - offsets[group] + a[group] + 1
+
+            # squared distance to the chord, clamped to its ends so closed loops (a == b) work too
+            pa, pb, p = xy[a][group], xy[b][group], xy[inner]
+            ab = pb - pa
+            length2 = np.einsum("ij,ij->i", ab, ab)
+            t = np.clip(np.einsum("ij,ij->i", p - pa, ab) / np.where(length2 > 0, length2, 1), 0, 1)
+            d = p - (pa + t[:, None] * ab)
+            d2 = np.einsum("ij,ij->i", d, d)
+
+            worst = np.maximum.reduceat(d2, offsets)
+            split = worst > t2
+            # first point of every range that reaches its range's maximum
+            at_max = np.flatnonzero(d2 == worst[group])
+            first = at_max[np.unique(group[at_max], return_index=True)[1]]
+            k = inner[first][split]
+
+            keep[k] = True
+            a, b = np.concatenate([a[split], k]), np.concatenate([k, b[split]])
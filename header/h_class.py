@@ -1,6 +1,8 @@
 import inspect
 
 class HeaderClass:
+    __slots__ = () # subclasses that declare slots stay without a __dict__
+
     def __init__(self, header: type):
         self._b_header: type = header
         self._b_child: type = self.__class__
@@ -14,6 +16,9 @@ class HeaderClass:
                 raise AttributeError(f"Attribute '{attr}' in the child class is not the same type as in the header class")
 
         for item in header.__dict__:
+            # only there because the header has no __slots__, the child inherits them
+            if item in ("__dict__", "__weakref__"):
+                continue
             if item not in self._b_child.__dict__:
                 raise AttributeError(f"Attribute '{item}' is not in the child class")
             elif inspect.isfunction(header.__dict__[item]):
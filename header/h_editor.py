@@ -1,5 +1,4 @@
 import pygame
-from collections import deque
 
 try:
     from h_class import HeaderClass
@@ -7,11 +6,15 @@ try:
     from h_menubar import h_MenuBar
     from ..ui.component import Component
     from ..ui.menubar import MenuBar
+    from ..helper.journal import Journal
+    from ..ui.events import EventBackend
 except ImportError:
     from header.h_class import HeaderClass
     from header.h_point import h_Point
     from header.h_menubar import h_MenuBar
     from ui.component import Component
+    from helper.journal import Journal
+    from ui.events import EventBackend
 
 
 
@@ -39,8 +42,7 @@ class h_Editor(HeaderClass):
     _image: pygame.Surface | None
 
     _PPIN: int
-    _undo_stack: deque[list[h_Point]]
-    _redo_stack: deque[list[h_Point]]
+    _journal: Journal
 
     def __init__(self):
         super().__init__(h_Editor)
@@ -49,4 +51,4 @@ class h_Editor(HeaderClass):
     def _keybind_open(self) -> None: ...
     def _calculate_machine_pos(self, p: 'h_Point') -> tuple[int, int]: ...
     def _setup_toolbar(self) -> None: ...
-    def run(self) -> None: ...
\ No newline at end of file
+    def run(self, backend: EventBackend | None = None) -> None: ...
\ No newline at end of file
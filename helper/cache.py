@@ -0,0 +1,198 @@
+import hashlib, json, os, zipfile
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable
+
+try:
+    from ..helper.mutil import Util
+    from ..helper.contours import Contours, ContourPaths
+except ImportError:
+    from helper.mutil import Util
+    from helper.contours import Contours, ContourPaths
+
+
+@dataclass
+class Extraction:
+    """
+    What extracting an image gives: the raw contours (in image pixels, no offset), the rows of their points
+    sampled at the point density and the image size
+    """
+    paths: ContourPaths
+    keep: np.ndarray
+    size: tuple[int, int]
+
+    def sampled(self, offset: tuple[float, float] = (0, 0)) -> ContourPaths:
+        paths = self.paths.take(self.keep)
+        paths.translate(*offset)
+        return paths
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    nbytes: int = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.evictions} evicted, "
+                f"{self.entries} entries using {self.nbytes / (1 << 20):.1f} MB")
+
+
+class ExtractionCache:
+    """
+    On-disk cache of image extractions. Entries are keyed by a hash of the image file's bytes and the
+    extraction parameters, so a renamed or re-saved copy of the same image still hits and an edited one misses.
+    Every entry is one compressed .npz file of the raw contours, their starts and parents and the sampled rows.
+    Contour points are stored as steps from the previous point, which are almost all -1, 0 or 1 and compress well. A file's mtime is its last use, the least recently used entries go once the cache is over max_bytes.
+    """
+    VERSION = 4 # bump when the extraction changes in a way that makes old entries wrong
+    SUFFIX = ".npz"
+
+    def __init__(self, directory: str | None = None, max_bytes: int = 256 << 20) -> None:
+        self.directory = directory or ExtractionCache.default_directory()
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+
+    @staticmethod
+    def default_directory() -> str:
+        if os.environ.get("PYCNC_CACHE_DIR"):
+            return os.environ["PYCNC_CACHE_DIR"]
+        base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        return os.path.join(base, "PyCNC", "extraction")
+
+    @staticmethod
+    def key(data: bytes, point_density: int) -> str:
+        params = json.dumps({"version": ExtractionCache.VERSION, "canny": Contours.CANNY, "density": point_density})
+        h = hashlib.blake2b(data, digest_size=20)
+        h.update(params.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ExtractionCache.SUFFIX)
+
+    """
+    Reads the image at path through the cache, only decodes and traces it on a miss.
+    progress is called with the fraction done before the slow steps, a job's progress stops a superseded
+    extraction there (a finished trace is still stored).
+    Raises FileNotFoundError if the file can't be read as an image.
+    """
+    def extract(self, path: str, point_density: int, tile_size: int | None = None, workers: int | None = None,
+                progress: Callable[[float], None] | None = None) -> Extraction:
+        profiler = Util.profiler
+        progress = progress or (lambda f: None)
+        with profiler.span("extract.read"):
+            with open(path, 'rb') as f:
+                data = f.read()
+            key = ExtractionCache.key(data, point_density)
+        progress(0.05)
+        with profiler.span("extract.cache"):
+            found = self.get(key)
+        if found is not None:
+            progress(1.0)
+            return found
+
+        with profiler.span("extract.decode"):
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise FileNotFoundError(f"Could not read image '{path}'")
+        progress(0.1)
+        with profiler.span("extract.contours"):
+            paths = Util.get_contour_paths(img, tile_size=tile_size, workers=workers)
+        with profiler.span("extract.sample"):
+            extraction = Extraction(paths, paths.sample(point_density), (img.shape[1], img.shape[0]))
+        with profiler.span("extract.store"):
+            self.put(key, extraction)
+        progress(1.0)
+        return extraction
+
+    def get(self, key: str) -> Extraction | None:
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                paths = ContourPaths(np.cumsum(f["steps"], axis=0, dtype=np.int64).astype(np.float64), f["starts"].astype(np.int64), f["parents"].astype(np.int64))
+                extraction = Extraction(paths, f["keep"].astype(np.int64), tuple(f["size"].tolist()))
+            os.utime(path)
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            # a half written or foreign file, trace again and let put replace it
+            print(f"[WARN] Dropping unreadable cache entry {key}: {e}")
+            self._remove(path)
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return extraction
+
+    def put(self, key: str, extraction: Extraction) -> None:
+        paths = extraction.paths
+        # the contours come out of findContours as pixel coordinates, int32 is lossless
+        arrays = {
+            "steps": np.diff(paths.xy.astype(np.int32), axis=0, prepend=np.zeros((1, 2), dtype=np.int32)),
+            "starts": paths.starts.astype(np.int32),
+            "parents": paths.parents.astype(np.int32),
+            "keep": extraction.keep.astype(np.int32),
+            "size": np.array(extraction.size, dtype=np.int64),
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write next to the entry and swap it in, readers never see a half written file
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            print(f"[WARN] Could not write to the extraction cache: {e}")
+            return
+        self.evict()
+
+    """
+    Removes the least recently used entries until the cache fits in max_bytes
+    """
+    def evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        for _, path, _ in self._entries():
+            self._remove(path)
+
+    def refresh_stats(self) -> CacheStats:
+        entries = self._entries()
+        self.stats.entries = len(entries)
+        self.stats.nbytes = sum(size for _, _, size in entries)
+        return self.stats
+
+    def _entries(self) -> list[tuple[float, str, int]]:
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(ExtractionCache.SUFFIX):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
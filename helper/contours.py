@@ -0,0 +1,409 @@
+import os, contextlib
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+try:
+    from ..helper.spatial import SpatialIndex
+except ImportError:
+    from helper.spatial import SpatialIndex
+
+
+class Contours:
+    """
+    Edge detection and contour tracing. Images above a few thousand pixels per side can be split into
+    tiles that are traced on a process pool, the result is the same contours the whole image gives.
+
+    Contours come back as (n, 2) int32 arrays plus an array with every contour's parent (the contour it's
+    nested in, -1 for none), the parents from cv2's RETR_TREE hierarchy.
+    """
+    CANNY = (100, 200)
+    TILE_SIZE = 2048
+    MARGIN = 8 # extra pixels around every tile so Canny sees the same neighbourhood it would on the whole image
+
+    @staticmethod
+    def edges(img) -> np.ndarray:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return cv2.Canny(gray, *Contours.CANNY)
+
+    @staticmethod
+    def trace(edges: np.ndarray) -> tuple[list[np.ndarray], np.ndarray]:
+        contours, hierarchy = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_TC89_KCOS)
+        if len(contours) == 0:
+            return [], np.empty(0, dtype=np.int64)
+        return [c.reshape(-1, 2) for c in contours], hierarchy[0, :, 3].astype(np.int64)
+
+    """
+    Uses tiles when the image is bigger than tile_size in either direction, workers defaults to every core.
+    Tiling does about 1.5x the work of one pass over the whole image, it pays off from about 2-3 cores.
+    """
+    @staticmethod
+    def find(img, tile_size: int | None = None, workers: int | None = None) -> tuple[list[np.ndarray], np.ndarray]:
+        h, w = img.shape[:2]
+        if tile_size is None or (w <= tile_size and h <= tile_size):
+            return Contours._raster_order(*Contours.trace(Contours.edges(img)))
+        return Contours.find_tiled(img, tile_size, workers)
+
+    @staticmethod
+    def tiles(size: tuple[int, int], tile_size: int) -> list[tuple[int, int, int, int]]:
+        w, h = size
+        return [(x, y, min(tile_size, w - x), min(tile_size, h - y)) for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+
+    """
+    Every tile is traced on its own. Edges that reach a seam between tiles can't be finished there, their
+    pixels are sent back instead, joined up with the pieces from the neighbouring tiles and traced here.
+    """
+    @staticmethod
+    def find_tiled(img, tile_size: int = TILE_SIZE, workers: int | None = None) -> tuple[list[np.ndarray], np.ndarray]:
+        h, w = img.shape[:2]
+        m = Contours.MARGIN
+        tiles = Contours.tiles((w, h), tile_size)
+        jobs = []
+        for x, y, tw, th in tiles:
+            x0, y0 = max(x - m, 0), max(y - m, 0)
+            x1, y1 = min(x + tw + m, w), min(y + th + m, h)
+            # which sides of the tile have a neighbour, only those are seams
+            seams = (x > 0, y > 0, x + tw < w, y + th < h)
+            jobs.append((img[y0:y1, x0:x1], (x - x0, y - y0, tw, th), (x, y), seams))
+
+        contours: list[np.ndarray] = []
+        parents: list[np.ndarray] = []
+        pieces = _Pieces((w, h))
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        # a single worker doesn't need a pool, the tiles still keep the memory down
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else contextlib.nullcontext() as pool:
+            results = (pool.map if pool else map)(Contours._trace_tile, *zip(*jobs))
+            for tile, (found, found_parents, *seam) in zip(tiles, results):
+                Contours._append(contours, parents, found, found_parents)
+                pieces.add(tile, *seam)
+
+        edge = [-1] * len(contours)
+        for i, pixels in enumerate(pieces.edges()):
+            # a canvas just big enough for the edge, with a pixel of room (findContours ignores the outermost pixels)
+            lo = pixels.min(axis=0) - 1
+            hi = pixels.max(axis=0) + 1
+            canvas = np.zeros((hi[1] - lo[1] + 1, hi[0] - lo[0] + 1), dtype=np.uint8)
+            canvas[pixels[:, 1] - lo[1], pixels[:, 0] - lo[0]] = 255
+            found, found_parents = Contours.trace(canvas)
+            Contours._append(contours, parents, [c + lo for c in found], found_parents)
+            edge += [i] * len(found)
+
+        parents = np.concatenate(parents) if parents else np.empty(0, dtype=np.int64)
+        return Contours._raster_order(contours, Contours._adopt(contours, parents, np.array(edge, dtype=np.int64)))
+
+    """
+    Tiles and seam edges are traced apart, so a contour in the hole of another edge that crosses a seam doesn't
+    know it's nested. edge says which seam edge every contour came from (-1 for none). The innermost contour of
+    another seam edge around a top level contour's first point is its parent.
+    """
+    @staticmethod
+    def _adopt(contours: list[np.ndarray], parents: np.ndarray, edge: np.ndarray) -> np.ndarray:
+        around = np.flatnonzero(edge >= 0)
+        if len(around) == 0:
+            return parents
+        depth = np.zeros(len(contours), dtype=np.int64)
+        for j in around.tolist():
+            k = parents[j]
+            while k >= 0:
+                depth[j] += 1
+                k = parents[k]
+        area = np.array([abs(cv2.contourArea(contours[j])) for j in around.tolist()])
+        boxes = np.array([cv2.boundingRect(contours[j]) for j in around.tolist()], dtype=np.int64).reshape(-1, 4)
+
+        parents = parents.copy()
+        for i in np.flatnonzero(parents < 0).tolist():
+            x, y = contours[i][0].tolist()
+            inside = (boxes[:, 0] < x) & (x < boxes[:, 0] + boxes[:, 2]) & (boxes[:, 1] < y) & (y < boxes[:, 1] + boxes[:, 3]) & (edge[around] != edge[i])
+            hits = [k for k in np.flatnonzero(inside).tolist() if cv2.pointPolygonTest(contours[around[k]], (x, y), False) > 0]
+            if hits:
+                # the smallest edge around it is the innermost, within that edge the deepest contour (a hole's
+                # polygon can come out a bit bigger than the outline around it)
+                nearest = edge[around[min(hits, key=lambda k: area[k])]]
+                parents[i] = max((around[k] for k in hits if edge[around[k]] == nearest), key=lambda j: depth[j])
+        return parents
+
+    @staticmethod
+    def _append(contours: list[np.ndarray], parents: list[np.ndarray], found: list[np.ndarray], found_parents: np.ndarray) -> None:
+        base = len(contours)
+        contours.extend(found)
+        parents.append(np.where(found_parents >= 0, found_parents + base, -1))
+
+    """
+    findContours' order depends on what else is in the image, so contours are always put in the same order
+    no matter how they were traced: the one that starts furthest down (then right, then the longest) first,
+    which is close to what findContours gives. Parents are renumbered to match.
+    """
+    @staticmethod
+    def _raster_order(contours: list[np.ndarray], parents: np.ndarray) -> tuple[list[np.ndarray], np.ndarray]:
+        if not contours:
+            return [], parents
+        starts = np.array([c[0] for c in contours], dtype=np.int64)
+        lengths = np.fromiter((len(c) for c in contours), np.int64, len(contours))
+        order = np.lexsort((-lengths, -starts[:, 0], -starts[:, 1]))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        parents = parents[order]
+        return [contours[i] for i in order.tolist()], np.where(parents >= 0, rank[np.maximum(parents, 0)], -1)
+
+    """
+    Canny's gradient magnitude (3x3 Sobel, |dx| + |dy|, replicated border) at the given pixels only
+    """
+    @staticmethod
+    def _gradient(gray: np.ndarray, px: np.ndarray, py: np.ndarray) -> np.ndarray:
+        h, w = gray.shape
+        xm, xp = np.clip(px - 1, 0, w - 1), np.clip(px + 1, 0, w - 1)
+        ym, yp = np.clip(py - 1, 0, h - 1), np.clip(py + 1, 0, h - 1)
+        g = lambda xs, ys: gray[ys, xs].astype(np.int32)
+        dx = g(xp, ym) + 2 * g(xp, py) + g(xp, yp) - g(xm, ym) - 2 * g(xm, py) - g(xm, yp)
+        dy = g(xm, yp) + 2 * g(px, yp) + g(xp, yp) - g(xm, ym) - 2 * g(px, ym) - g(xp, ym)
+        return np.abs(dx) + np.abs(dy)
+
+    """
+    Runs in a worker process. tile includes the margin, core is (x, y, w, h) of the tile itself inside it
+    and origin where the core sits in the image. Returns the contours that stay clear of the seams (in image
+    coordinates) with their parents, and the pieces of edges that reach a seam (see _Pieces.add).
+    """
+    @staticmethod
+    def _trace_tile(tile: np.ndarray, core: tuple[int, int, int, int], origin: tuple[int, int], seams: tuple[bool, bool, bool, bool]) -> tuple:
+        x, y, w, h = core
+        gray = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+        low, high = Contours.CANNY
+        edges = np.ascontiguousarray(cv2.Canny(gray, low, high)[y:y + h, x:x + w])
+
+        # Canny's hysteresis keeps edge candidates connected to a strong pixel however far away it is, so edges
+        # that reach a seam aren't final yet. The candidates (Canny with both thresholds low) are, they only
+        # depend on the pixels right around them: 8-connected groups of them are what an edge can grow into.
+        # Only the groups that reach a seam matter, they're flood filled from the seam instead of labelling the
+        # whole tile (1 marks the group being filled, 2 the ones that are done)
+        candidates = np.ascontiguousarray(cv2.Canny(gray, low, low)[y:y + h, x:x + w])
+        left, top, right, bottom = seams
+        seeds = [(0, i) for i in np.flatnonzero(candidates[:, 0]).tolist()] if left else []
+        seeds += [(i, 0) for i in np.flatnonzero(candidates[0]).tolist()] if top else []
+        seeds += [(w - 1, i) for i in np.flatnonzero(candidates[:, -1]).tolist()] if right else []
+        seeds += [(i, h - 1) for i in np.flatnonzero(candidates[-1]).tolist()] if bottom else []
+        groups = []
+        # without a mask of its own floodFill clears a new one the size of the tile on every call
+        mask = np.zeros((h + 2, w + 2), dtype=np.uint8) if seeds else None
+        for sx, sy in seeds:
+            if candidates[sy, sx] != 255:
+                continue
+            _, _, _, (rx, ry, rw, rh) = cv2.floodFill(candidates, mask, (sx, sy), 1, flags=8)
+            window = candidates[ry:ry + rh, rx:rx + rw]
+            gy, gx = np.nonzero(window == 1)
+            window[gy, gx] = 2
+            groups.append(np.column_stack((gx + rx, gy + ry)).astype(np.int32))
+        # numbered in raster order of their first pixel, the way connected component labels are
+        groups.sort(key=lambda g: (int(g[0, 1]), int(g[0, 0])))
+
+        # the groups that reach a seam are numbered 0.. and their pixels handed back sorted by that number
+        xy = np.concatenate(groups) if groups else np.empty((0, 2), dtype=np.int32)
+        sizes = np.array([len(g) for g in groups], dtype=np.int64)
+        edges[xy[:, 1], xy[:, 0]] = 0
+        found, parents = Contours.trace(edges)
+        offset = np.array(origin, dtype=np.int32)
+
+        # a group with a strong pixel in it is part of an edge, if the strong pixel is in another tile the pieces
+        # get joined up with it. Canny's edges can't tell: its hysteresis also follows the candidates out into the
+        # margin, where the gradient at the tile's border makes up strong pixels the whole image doesn't have
+        strong = np.zeros(len(groups), dtype=bool)
+        if groups:
+            above = Contours._gradient(gray, xy[:, 0] + x, xy[:, 1] + y) > high
+            strong = np.add.reduceat(above, np.concatenate(([0], np.cumsum(sizes)[:-1]))) > 0
+
+        # along every seam the number of the group each pixel belongs to (-1 for none)
+        borders = [np.full(h, -1, dtype=np.int32), np.full(w, -1, dtype=np.int32), np.full(h, -1, dtype=np.int32), np.full(w, -1, dtype=np.int32)]
+        for i, g in enumerate(groups):
+            for border, axis, at in zip(borders, (0, 1, 0, 1), (0, 0, w - 1, h - 1)):
+                border[g[g[:, axis] == at, 1 - axis]] = i
+        return [c + offset for c in found], parents, xy + offset, sizes, strong, [b if side else None for side, b in zip(seams, borders)]
+
+
+@dataclass
+class ContourPaths:
+    """
+    The path graph of an image: one polyline per contour, all of them back to back in xy, contour i is
+    xy[starts[i]:starts[i + 1]]. parents keeps the nesting (the contour each one lies in, -1 for none).
+    """
+    xy: np.ndarray      # (n, 2) float64
+    starts: np.ndarray  # (contours + 1,) int64
+    parents: np.ndarray # (contours,) int64
+
+    @staticmethod
+    def from_contours(contours: list[np.ndarray], parents: np.ndarray, offset: tuple[float, float] = (0, 0)) -> 'ContourPaths':
+        sizes = np.fromiter((len(c) for c in contours), np.int64, len(contours))
+        starts = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        xy = np.concatenate(contours).astype(np.float64) + offset if contours else np.empty((0, 2), dtype=np.float64)
+        return ContourPaths(xy, starts, np.asarray(parents, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.starts)
+
+    def contour(self, i: int) -> np.ndarray:
+        return self.xy[self.starts[i]:self.starts[i + 1]]
+
+    """
+    Which contour every point belongs to
+    """
+    def labels(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    """
+    How deep every contour is nested, 0 for the outermost ones
+    """
+    def depth(self) -> np.ndarray:
+        depth = np.zeros(len(self), dtype=np.int64)
+        up = self.parents.copy()
+        while (inside := up >= 0).any():
+            depth += inside
+            up = np.where(inside, self.parents[np.maximum(up, 0)], -1)
+        return depth
+
+    """
+    Keeps only the given points (indices into xy, ascending), every contour keeps whatever is left of it
+    so the contour numbering and the nesting stay the same. Used with SpatialIndex.thin.
+    """
+    def take(self, rows: np.ndarray) -> 'ContourPaths':
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = np.bincount(self.labels()[rows], minlength=len(self))
+        return ContourPaths(self.xy[rows], np.concatenate(([0], np.cumsum(counts))).astype(np.int64), self.parents)
+
+    """
+    Picks about one point every `spacing` pixels along each contour: the first traced point in every stretch of
+    `spacing` arc length, and the contour's last point. Only traced points are picked, straight runs that tracing
+    already left as two points don't get any added. Thin edges are traced out and back and neighbouring contours
+    run side by side, so afterwards the picked points are thinned with SpatialIndex.thin: no two kept points, on
+    the same contour or not, are closer than `spacing`. Returns the rows to keep, ascending (see take).
+    Everything is array operations over all contours at once, cheap enough to redo on every density change.
+    """
+    def sample(self, spacing: float) -> np.ndarray:
+        n = len(self.xy)
+        if n == 0 or spacing <= 0:
+            return np.arange(n)
+
+        # arc length along every contour, steps into the first point of a contour don't count
+        labels = self.labels()
+        firsts = self.starts[:-1][self.sizes > 0]
+        step = np.zeros(n)
+        step[1:] = np.hypot(*np.diff(self.xy, axis=0).T)
+        step[firsts] = 0
+        arc = np.cumsum(step)
+        stretch = np.floor((arc - arc[self.starts[labels]]) / spacing).astype(np.int64)
+
+        keep = np.ones(n, dtype=bool)
+        keep[1:] = (stretch[1:] != stretch[:-1]) | (labels[1:] != labels[:-1])
+        keep[self.starts[1:][self.sizes > 0] - 1] = True
+        rows = np.flatnonzero(keep)
+
+        return rows[SpatialIndex.thin(self.xy[rows], spacing)]
+
+    def translate(self, dx: float, dy: float) -> None:
+        self.xy = self.xy + (dx, dy)
+
+    """
+    next/prev of every point as indices into xy (-1 for none): each contour is one chain and contours aren't
+    linked to each other
+    """
+    def links(self) -> tuple[np.ndarray, np.ndarray]:
+        n = len(self.xy)
+        index = np.arange(n, dtype=np.int64)
+        first = np.zeros(n, dtype=bool)
+        first[self.starts[:-1][self.sizes > 0]] = True
+        last = np.zeros(n, dtype=bool)
+        last[self.starts[1:][self.sizes > 0] - 1] = True
+        return np.where(last, -1, index + 1), np.where(first, -1, index - 1)
+
+
+class _Pieces:
+    """
+    Collects the pieces of edges that reached a seam and joins the ones that touch across it into whole edges
+    """
+    def __init__(self, size: tuple[int, int]) -> None:
+        self._size = size
+        self._pixels: list[np.ndarray] = []
+        self._sizes: list[np.ndarray] = []
+        self._strong: list[np.ndarray] = []
+        self._count = 0
+        # seam position -> piece numbers along the side before and after it, for vertical (x) and horizontal (y) seams
+        self._columns: dict[int, list[np.ndarray]] = {}
+        self._rows: dict[int, list[np.ndarray]] = {}
+
+    @staticmethod
+    def _strip(seams: dict[int, list[np.ndarray]], at: int, length: int) -> list[np.ndarray]:
+        if at not in seams:
+            seams[at] = [np.full(length, -1, dtype=np.int64), np.full(length, -1, dtype=np.int64)]
+        return seams[at]
+
+    """
+    pixels are sorted by piece and sizes says how many belong to each, strong which pieces have a strong pixel
+    and borders the piece numbers along the left, top, right and bottom side of the tile (None if it's no seam)
+    """
+    def add(self, tile: tuple[int, int, int, int], pixels: np.ndarray, sizes: np.ndarray, strong: np.ndarray, borders: list) -> None:
+        x, y, tw, th = tile
+        w, h = self._size
+        base = self._count
+        self._pixels.append(pixels)
+        self._sizes.append(sizes)
+        self._strong.append(strong)
+        self._count += len(sizes)
+
+        left, top, right, bottom = (np.where(b >= 0, b + base, -1) if b is not None else None for b in borders)
+        if left is not None:
+            _Pieces._strip(self._columns, x, h)[1][y:y + th] = left
+        if right is not None:
+            _Pieces._strip(self._columns, x + tw, h)[0][y:y + th] = right
+        if top is not None:
+            _Pieces._strip(self._rows, y, w)[1][x:x + tw] = top
+        if bottom is not None:
+            _Pieces._strip(self._rows, y + th, w)[0][x:x + tw] = bottom
+
+    """
+    Pixel arrays of every whole edge the pieces make up, edges without a strong pixel aren't edges and are left out
+    """
+    def edges(self):
+        if self._count == 0:
+            return
+        # pieces on either side of a seam belong together when their pixels are 8-neighbours
+        pairs = [np.empty((0, 2), dtype=np.int64)]
+        for before, after in (*self._columns.values(), *self._rows.values()):
+            for d in (-1, 0, 1):
+                a = before[max(-d, 0):len(before) - max(d, 0)]
+                b = after[max(d, 0):len(after) - max(-d, 0)]
+                both = (a >= 0) & (b >= 0)
+                pairs.append(np.column_stack((a[both], b[both])))
+        edge = _Pieces._join(self._count, np.unique(np.concatenate(pairs), axis=0))
+
+        strong = np.zeros(self._count, dtype=bool)
+        np.logical_or.at(strong, edge, np.concatenate(self._strong))
+
+        # every piece's pixels are one slice, gather the slices edge by edge
+        pixels = np.concatenate(self._pixels)
+        sizes = np.concatenate(self._sizes)
+        ends = np.cumsum(sizes)
+        starts = ends - sizes
+        order = np.argsort(edge, kind="stable")
+        for group in np.split(order, np.flatnonzero(np.diff(edge[order])) + 1):
+            if strong[edge[group[0]]]:
+                yield np.concatenate([pixels[starts[i]:ends[i]] for i in group.tolist()])
+
+    """
+    Connected components of a graph with count nodes and the given edges, every node gets the smallest node of its component
+    """
+    @staticmethod
+    def _join(count: int, pairs: np.ndarray) -> np.ndarray:
+        root = np.arange(count, dtype=np.int64)
+        while len(pairs):
+            a, b = root[pairs[:, 0]], root[pairs[:, 1]]
+            if np.array_equal(a, b):
+                break
+            low = np.minimum(a, b)
+            np.minimum.at(root, a, low)
+            np.minimum.at(root, b, low)
+            # pointer jumping so long chains collapse in a few steps
+            while not np.array_equal(jumped := root[root], root):
+                root = jumped
+        return root
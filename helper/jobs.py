@@ -0,0 +1,128 @@
+import threading, queue
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable
+
+try:
+    from ..helper.profiler import Profiler
+except ImportError:
+    from helper.profiler import Profiler
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    One piece of background work and its cancellation token. The work gets the job and calls job.progress()
+    between its steps, which records how far it got and raises JobCancelled once the job is cancelled, so
+    superseded work stops at the next step instead of running to the end.
+    """
+    def __init__(self, name: str, group: str | None = None) -> None:
+        self.name = name
+        self.group = group
+        self.fraction = 0.0
+        self.done = False # set on the main thread once the job's outcome was taken off the handoff queue
+        self._cancelled = threading.Event()
+        self._future: Future | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        if self._future is not None:
+            self._future.cancel() # only does anything if it hasn't started yet
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelled(self.name)
+
+    def progress(self, fraction: float) -> None:
+        self.fraction = fraction
+        self.check()
+
+
+class JobScheduler:
+    """
+    Runs jobs on a bounded pool of worker threads. Workers never touch the editor: a job's work returns
+    a value and its on_done/on_error callbacks are queued for the main loop, which runs them in run_pending().
+    Jobs submitted with a group cancel the group's earlier jobs, a cancelled job's callbacks never run.
+    """
+    WORKERS = 2
+
+    def __init__(self, workers: int = WORKERS, profiler: Profiler | None = None) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._profiler = profiler
+        # every job ends with exactly one entry here, the callback is None when there's nothing to run
+        self._handoff: queue.SimpleQueue[tuple[Job, Callable | None, Any]] = queue.SimpleQueue()
+        self._jobs: list[Job] = [] # main thread only
+
+    """
+    Starts work(job) on a worker. on_done(result) or on_error(exception) run later on the main thread,
+    an error without on_error is printed.
+    """
+    def submit(self, name: str, work: Callable[[Job], Any], on_done: Callable[[Any], None] | None = None,
+               on_error: Callable[[Exception], None] | None = None, group: str | None = None) -> Job:
+        if group is not None:
+            self.cancel(group)
+        job = Job(name, group)
+
+        def run() -> None:
+            if job.cancelled:
+                self._handoff.put((job, None, None))
+                return
+            try:
+                if self._profiler is not None:
+                    with self._profiler.span(f"job.{name}"):
+                        result = work(job)
+                else:
+                    result = work(job)
+            except JobCancelled:
+                self._handoff.put((job, None, None))
+                return
+            except Exception as e:
+                self._handoff.put((job, on_error or (lambda e: print(f"[ERROR] {name} failed: {e}")), e))
+                return
+            self._handoff.put((job, on_done or (lambda _: None), result))
+
+        self._jobs.append(job)
+        job._future = self._pool.submit(run)
+        # a job cancelled before it started never runs, it still has to leave its entry
+        job._future.add_done_callback(lambda f: self._handoff.put((job, None, None)) if f.cancelled() else None)
+        return job
+
+    """
+    Cancels the running and queued jobs of the given groups, or all of them without any
+    """
+    def cancel(self, *groups: str) -> None:
+        for job in self._jobs:
+            if not groups or job.group in groups:
+                job.cancel()
+
+    """
+    Runs the callbacks of finished jobs, returns how many ran. Call it from the main loop once per frame.
+    A job is only forgotten once its entry was taken off the queue, until then cancel() still reaches it
+    even if its worker is already done.
+    """
+    def run_pending(self) -> int:
+        count = 0
+        while True:
+            try:
+                job, callback, value = self._handoff.get_nowait()
+            except queue.Empty:
+                break
+            job.done = True
+            if callback is not None and not job.cancelled:
+                callback(value)
+                count += 1
+        self._jobs = [job for job in self._jobs if not job.done]
+        return count
+
+    def active(self) -> list[Job]:
+        return [job for job in self._jobs if not job.done and not job.cancelled]
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
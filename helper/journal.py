@@ -0,0 +1,252 @@
+import operator
+import numpy as np
+from typing import TYPE_CHECKING
+from collections import deque
+
+if TYPE_CHECKING:
+    from header.h_editor import h_Editor
+from header.h_point import h_Point
+
+
+class Entry:
+    """
+    One step of the undo history. Entries only hold what the edit changed, undo/redo put it back
+    through the editor's edit helpers so the index, bounds and layers follow along.
+    """
+    _OVERHEAD = 128 # rough size of the entry object itself
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    @property
+    def nbytes(self) -> int:
+        return Entry._OVERHEAD
+
+    """
+    Folds a later entry into this one, returns False if they can't be combined
+    """
+    def merge(self, entry: 'Entry') -> bool:
+        return False
+
+    def undo(self, editor: 'h_Editor') -> None: ...
+    def redo(self, editor: 'h_Editor') -> None: ...
+
+
+class MovePoint(Entry):
+    def __init__(self, point: h_Point, old: tuple[float, float], new: tuple[float, float]) -> None:
+        super().__init__("Move")
+        self.point, self.old, self.new = point, old, new
+
+    def merge(self, entry: Entry) -> bool:
+        # every mouse motion of a drag ends up as one move from where the point was grabbed
+        if isinstance(entry, MovePoint) and entry.point is self.point:
+            self.new = entry.new
+            return True
+        return False
+
+    def undo(self, editor: 'h_Editor') -> None:
+        editor._move_point(self.point, *self.old)
+
+    def redo(self, editor: 'h_Editor') -> None:
+        editor._move_point(self.point, *self.new)
+
+
+class AddPoint(Entry):
+    def __init__(self, point: h_Point, index: int) -> None:
+        super().__init__("Add")
+        self.point, self.index = point, index
+
+    def undo(self, editor: 'h_Editor') -> None:
+        editor._remove_point(self.point)
+
+    def redo(self, editor: 'h_Editor') -> None:
+        editor._add_point(self.point, self.index)
+
+
+class RemovePoint(AddPoint):
+    def __init__(self, point: h_Point, index: int) -> None:
+        super().__init__(point, index)
+        self.name = "Remove"
+
+    def undo(self, editor: 'h_Editor') -> None:
+        super().redo(editor)
+
+    def redo(self, editor: 'h_Editor') -> None:
+        super().undo(editor)
+
+
+class PointState:
+    """
+    Fields of a set of points (and optionally the order of the list they're in) at one moment, as arrays.
+    Take one before an edit and diff it afterwards, only the points whose fields differ end up in the entry.
+    """
+    def __init__(self, points: list[h_Point], order: bool = True) -> None:
+        self.points = list(points)
+        self.order = order
+        self.xy, self.ids, self.locked, self.next, self.prev = PointState._read(self.points)
+
+    @staticmethod
+    def _read(points: list[h_Point]) -> tuple[np.ndarray, np.ndarray, np.ndarray, list, list]:
+        n = len(points)
+        xy = np.fromiter((c for p in points for c in (p.x, p.y)), np.float64, 2 * n).reshape(n, 2)
+        ids = np.fromiter((p._id for p in points), np.int64, n)
+        locked = np.fromiter((p._locked for p in points), bool, n)
+        return xy, ids, locked, [p._next for p in points], [p._prev for p in points]
+
+    """
+    Compares the points as they are now against the state, points is the list after the edit (only looked at
+    when the order is tracked). Returns None if nothing changed.
+    """
+    def diff(self, name: str, points: list[h_Point] | None = None) -> 'PointChange | None':
+        xy, ids, locked, nexts, prevs = PointState._read(self.points)
+        changed = (self.xy != xy).any(axis=1) | (self.ids != ids) | (self.locked != locked)
+        n = len(self.points)
+        changed |= np.fromiter(map(operator.is_not, self.next, nexts), bool, n)
+        changed |= np.fromiter(map(operator.is_not, self.prev, prevs), bool, n)
+        rows = np.flatnonzero(changed)
+
+        order = None
+        if self.order and points is not None:
+            if len(points) != len(self.points) or any(map(operator.is_not, points, self.points)):
+                order = (self.points, list(points))
+
+        if len(rows) == 0 and order is None:
+            return None
+        pick = rows.tolist()
+        before = (self.xy[rows], self.ids[rows], self.locked[rows], [self.next[i] for i in pick], [self.prev[i] for i in pick])
+        after = (xy[rows], ids[rows], locked[rows], [nexts[i] for i in pick], [prevs[i] for i in pick])
+        return PointChange(name, [self.points[i] for i in pick], before, after, order)
+
+
+class PointChange(Entry):
+    """
+    Field changes of some points (array diffs from PointState.diff), and the whole list order if that changed
+    """
+    def __init__(self, name: str, points: list[h_Point], before: tuple, after: tuple, order: tuple[list, list] | None) -> None:
+        super().__init__(name)
+        self.points, self.before, self.after, self.order = points, before, after, order
+
+    @property
+    def nbytes(self) -> int:
+        size = Entry._OVERHEAD + 8 * len(self.points)
+        for state in (self.before, self.after):
+            # the arrays plus the two lists of link references
+            size += state[0].nbytes + state[1].nbytes + state[2].nbytes + 16 * len(self.points)
+        if self.order is not None:
+            size += 8 * (len(self.order[0]) + len(self.order[1]))
+        return size
+
+    def _apply(self, editor: 'h_Editor', state: tuple, order: list[h_Point] | None) -> None:
+        xy, ids, locked, nexts, prevs = state
+        # a big change is cheaper to hand over as a whole than point by point
+        bulk = order is not None or 4 * len(self.points) > len(editor._points)
+        for p, (x, y), ident, lock, nxt, prv in zip(self.points, xy.tolist(), ids.tolist(), locked.tolist(), nexts, prevs):
+            if not bulk:
+                editor._invalidate_point(p)
+            p._id, p._locked, p._next, p._prev = ident, lock, nxt, prv
+            if bulk:
+                p.set_pos(x, y)
+            else:
+                editor._move_point(p, x, y)
+
+        if bulk:
+            editor._set_points(list(order) if order is not None else editor._points)
+
+    def undo(self, editor: 'h_Editor') -> None:
+        self._apply(editor, self.before, self.order[0] if self.order else None)
+
+    def redo(self, editor: 'h_Editor') -> None:
+        self._apply(editor, self.after, self.order[1] if self.order else None)
+
+
+class SetDensity(Entry):
+    """
+    The path sampled again at another point density. None of the points change, the whole list is swapped
+    for a new one, so both lists and both densities are all there is to keep.
+    """
+    def __init__(self, before: list[h_Point], after: list[h_Point], old: int, new: int) -> None:
+        super().__init__("Point Density")
+        self.before, self.after, self.old, self.new = before, after, old, new
+
+    @property
+    def nbytes(self) -> int:
+        return Entry._OVERHEAD + 8 * (len(self.before) + len(self.after))
+
+    def undo(self, editor: 'h_Editor') -> None:
+        editor._point_density = self.old
+        editor._set_points(list(self.before))
+
+    def redo(self, editor: 'h_Editor') -> None:
+        editor._point_density = self.new
+        editor._set_points(list(self.after))
+
+
+class Journal:
+    """
+    Undo/redo history with a memory budget instead of an entry count, the oldest entries are
+    dropped once the entries together take more than budget bytes. The newest entry is always kept.
+    """
+    def __init__(self, budget: int = 32 << 20) -> None:
+        self.budget = budget
+        self._undo: deque[Entry] = deque()
+        self._redo: deque[Entry] = deque()
+        self._open = False # the last entry can still take merges
+        self._nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def can_undo(self) -> bool:
+        return len(self._undo) > 0
+
+    def can_redo(self) -> bool:
+        return len(self._redo) > 0
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+        self._open = False
+        self._nbytes = 0
+
+    def record(self, entry: Entry | None) -> None:
+        if entry is None:
+            return
+        for old in self._redo:
+            self._nbytes -= old.nbytes
+        self._redo.clear()
+
+        if self._open and self._undo and self._undo[-1].merge(entry):
+            return
+        self._undo.append(entry)
+        self._nbytes += entry.nbytes
+        self._open = True
+        while self._nbytes > self.budget and len(self._undo) > 1:
+            self._nbytes -= self._undo.popleft().nbytes
+
+    """
+    Ends the last entry, whatever is recorded next starts a new one (call it when a drag is over)
+    """
+    def seal(self) -> None:
+        self._open = False
+
+    def undo(self, editor: 'h_Editor') -> Entry | None:
+        self.seal()
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        entry.undo(editor)
+        self._redo.append(entry)
+        return entry
+
+    def redo(self, editor: 'h_Editor') -> Entry | None:
+        self.seal()
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        entry.redo(editor)
+        self._undo.append(entry)
+        return entry
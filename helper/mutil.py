@@ -1,18 +1,29 @@
-import tempfile, os, time, cv2, threading, pygame
-from typing import Any, Callable
+import tempfile, os, subprocess
+import numpy as np
+from typing import Any, Callable, TYPE_CHECKING
 from dataclasses import dataclass
 
-from header.h_editor import h_Editor
+# pygame is only needed by the editor, the headless pipeline (cli.py) runs without it
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+if TYPE_CHECKING:
+    from header.h_editor import h_Editor
 from header.h_point import h_Point
+from helper.spatial import SpatialIndex
+from helper.contours import Contours, ContourPaths
+from helper.profiler import Profiler
 
 
 class Util:
-    _editor: h_Editor = None
-    _editor_center: tuple[int, int] = None
+    _editor: 'h_Editor' = None
     _id_counter: int = 0 # used to give anything a unique id
+    profiler: Profiler = Profiler() # shared by the editor, the background tasks and the cli
 
     @staticmethod
-    def get_editor() -> h_Editor:
+    def get_editor() -> 'h_Editor':
         if Util._editor is None:
             raise RuntimeError("Editor not initialized")
         return Util._editor
@@ -23,38 +34,53 @@ class Util:
         return Util._id_counter
 
     @staticmethod
-    def get_path_points(img, point_density: int, offset: tuple[int, int] = (0, 0)) -> list[tuple[int, int]]:
-        path: list['Point'] = []
+    def get_unique_ids(count: int) -> np.ndarray:
+        ids = np.arange(Util._id_counter + 1, Util._id_counter + count + 1, dtype=np.int64)
+        Util._id_counter += count
+        return ids
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 100, 200)
+    """
+    Every raw contour point of the image's edges as one (n, 2) array, nothing is sampled yet.
+    With a tile_size big images are traced in tiles on a process pool (see Contours.find).
+    """
+    @staticmethod
+    def get_contour_paths(img, offset: tuple[int, int] = (0, 0), tile_size: int | None = None, workers: int | None = None) -> ContourPaths:
+        contours, parents = Contours.find(img, tile_size, workers)
+        return ContourPaths.from_contours(contours, parents, offset)
 
-        contours, hierarchy = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_TC89_KCOS)
+    @staticmethod
+    def get_contour_xy(img, offset: tuple[int, int] = (0, 0), tile_size: int | None = None, workers: int | None = None) -> np.ndarray:
+        return Util.get_contour_paths(img, offset, tile_size, workers).xy
 
-        # add all points to the path making sure their all connected
-        for c in contours:
-            for p in c:
-                path.append(Point(p[0][0] + offset[0], p[0][1] + offset[1]))
+    """
+    One linked polyline of Points per contour, sampled at point_density (see ContourPaths.sample). Ids follow the contours so the cut order
+    is contour by contour, contours aren't linked to each other.
+    """
+    @staticmethod
+    def get_path_points(img, point_density: int, offset: tuple[int, int] = (0, 0), tile_size: int | None = None) -> list['Point']:
+        # sample the raw contour points before any Point objects get created, in image coordinates so
+        # the same image always keeps the same points wherever it's placed
+        paths = Util.get_contour_paths(img, tile_size=tile_size)
+        paths = paths.take(paths.sample(point_density))
+        paths.translate(*offset)
+        return Util.points_from_paths(paths)
+
+    @staticmethod
+    def points_from_paths(paths: ContourPaths) -> list['Point']:
+        points = [Point(x, y) for x, y in paths.xy.tolist()]
+        for start, end in zip(paths.starts[:-1].tolist(), paths.starts[1:].tolist()):
+            for a, b in zip(points[start:end - 1], points[start + 1:end]):
+                a._next, b._prev = b, a
+        return points
 
-        # remove points that are too close to each other
-        for p in path:
-            for p2 in path:
-                if p == p2:
-                    continue
-                if p.distance(p2) < point_density:
-                    path.remove(p2)
-
-        return path
-    
     @staticmethod
     def connect_points(points: list['Point']) -> list['Point']:
         points = sorted(points, key=lambda p: p._id)
         connected = 0
-        for p in [p for p in points if p._id != -1]:
+        for i, p in enumerate(points):
             if p._id == -1: continue
 
             connected += 1
-            i = points.index(p)
             if i == 0:
                 p._prev = None
             else:
@@ -68,25 +94,10 @@ class Util:
         return points
 
     @staticmethod
-    def clean_points(points: list['Point']) -> list['Point']:
+    def clean_points(points: list['Point'], min_distance: float = 10) -> list['Point']:
         # remove points that are too close to each other
-        for p in points:
-            for p2 in points:
-                if p == p2:
-                    continue
-                if p.distance(p2) < 10:
-                    points.remove(p2)
-        return points
-
-    @staticmethod
-    def _async(func: callable) -> threading.Thread:
-        t = threading.Thread(target=func, daemon=True)
-        t.start()
-        return t
-    
-    @staticmethod
-    def async_task(funcs: list[callable]) -> None:
-        Util._async(lambda: [f for f in funcs if (lambda: (t:=Util._async(f), t.join()))()])
+        keep = SpatialIndex.thin([(p.x, p.y) for p in points], min_distance)
+        return [points[i] for i in keep.tolist()]
 
     @staticmethod
     def apply(funcs: list[Callable], *args, **kwargs) -> list[Any]:
@@ -99,7 +110,11 @@ class Util:
         tmp.flush()
         tmp.close()
 
-        os.system(f"notepad.exe {tmp.name}")
+        # not waited on, the editor keeps running while notepad is open
+        try:
+            subprocess.Popen(["notepad.exe", tmp.name])
+        except OSError as e:
+            print(f"[WARN] Could not open notepad ({e}), the text is in {tmp.name}")
     
     @staticmethod
     def wrap_function(func: Callable, callback: Callable, position: str = 'pre', ) -> Callable:
@@ -111,14 +126,6 @@ class Util:
                 callback()
         return wrapper
 
-    @staticmethod
-    def set_interval(func: Callable, interval: float) -> None:
-        def wrapper():
-            func()
-            time.sleep(interval)
-            Util.set_interval(func, interval)
-        threading.Thread(target=wrapper, daemon=True).start()
-                
     @staticmethod
     def calculate_bounds(points: list[h_Point]) -> 'Rect':
         min_x = 99999999
@@ -138,32 +145,12 @@ class Util:
 
         return Rect(min_x, min_y, max_x - min_x, max_y - min_y)
 
+    """
+    Where a position on the editor frame is in the world (the coordinates points are stored in)
+    """
     @staticmethod
-    def zoom_at_pos(screen: pygame.Surface, pos: tuple[float | int, float | int], scale: float | int) -> None:
-        # Get the current mouse position
-        x, y = pos
-
-        # Create a new surface that is a copy of the original surface but scaled by the zoom factor
-        zoomed_surface = pygame.transform.scale(screen, (int(screen.get_width() * scale), int(screen.get_height() * scale)))
-
-        # Calculate the new position of the mouse on the zoomed surface
-        zoomed_mouse_pos = x * scale, y * scale
-
-        # Create a new surface that is the size of the screen
-        new_surface = pygame.Surface((screen.get_width(), screen.get_height()))
-        new_surface.fill((255, 255, 255))
-
-        # Blit the zoomed surface onto this new surface at a position such that the new mouse position is at the center of the screen
-        new_surface.blit(zoomed_surface, (screen.get_width() / 2 - zoomed_mouse_pos[0], screen.get_height() / 2 - zoomed_mouse_pos[1]))
-
-        Util._editor_center = (screen.get_width() / 2 - zoomed_mouse_pos[0], screen.get_height() / 2 - zoomed_mouse_pos[1])
-
-        # Replace the original surface with the new surface
-        screen.blit(new_surface, (0, 0))
-    
-    @staticmethod
-    def get_zoomed_mouse_pos(pos: tuple[float | int, float | int], zoom: float | int) -> tuple[float | int, float | int]:
-        return (pos[0] - Util._editor_center[0]) / zoom, (pos[1] - Util._editor_center[1]) / zoom
+    def get_zoomed_mouse_pos(pos: tuple[float | int, float | int], viewport: 'Viewport') -> tuple[float | int, float | int]:
+        return viewport.to_world(pos[0], pos[1])
     
     @staticmethod
     def convertorigin(point: 'Point', _from: int, _to: int) -> 'Point':
@@ -183,14 +170,16 @@ class Util:
         for p in points:
             new_points.append(Point(p.x, p.y))
 
-        # copy over the next and prev pointers by finding the new points they point to
-        for i in range(len(points)):
-            if points[i]._next is not None:
-                new_points[i]._next = new_points[points.index(points[i]._next)]
-            if points[i]._prev is not None:
-                new_points[i]._prev = new_points[points.index(points[i]._prev)]
-            new_points[i]._id = points[i]._id
-            new_points[i]._locked = points[i]._locked
+        # copy over the next and prev pointers through an identity -> index map,
+        # links to points that aren't in the list are dropped
+        rows = {id(p): i for i, p in enumerate(points)}
+        for old, new in zip(points, new_points):
+            if old._next is not None and id(old._next) in rows:
+                new._next = new_points[rows[id(old._next)]]
+            if old._prev is not None and id(old._prev) in rows:
+                new._prev = new_points[rows[id(old._prev)]]
+            new._id = old._id
+            new._locked = old._locked
         return new_points
 
     @staticmethod    
@@ -205,12 +194,23 @@ class Util:
     """
     @staticmethod
     def reconnect_points(points: list['Point']) -> list['Point']:
-        
+        # first point with an id wins, same as findpoint
+        by_id: dict[int, 'Point'] = {}
+        for p in points:
+            by_id.setdefault(p._id, p)
+
+        def lookup(key) -> 'Point':
+            try:
+                return by_id.get(key)
+            except TypeError: # already a Point (unhashable), findpoint never matched those either
+                return None
+
         for p in points:
             if p._next is not None:
-                p._next = Util.findpoint(points, p._next)
+                p._next = lookup(p._next)
             if p._prev is not None:
-                p._prev = Util.findpoint(points, p._prev)
+                p._prev = lookup(p._prev)
+        return points
 
     @staticmethod
     def clear_point_metadata(points: list['Point']) -> list['Point']:
@@ -281,7 +281,113 @@ class Rect:
     def round(self, precision: int) -> 'Rect':
         return Rect(round(self.x, precision), round(self.y, precision), round(self.w, precision), round(self.h, precision))
 
+class Bounds:
+    """
+    Bounding box of a set of points that changes one point at a time. Growing it is O(1), only when a
+    point that was on the edge moves inward (or goes away) does it have to look at every point again,
+    and that waits until the next time the box is read.
+    """
+    def __init__(self, points: list[h_Point] | None = None) -> None:
+        self.reset(points if points is not None else [])
+
+    """
+    Starts tracking a new list, the list is kept and read again whenever the box has to be recomputed
+    """
+    def reset(self, points: list[h_Point]) -> None:
+        self._points = points
+        self._stale = True
+        self._extent = None # [min_x, min_y, max_x, max_y], None while there are no points
+
+    def add(self, x: float, y: float) -> None:
+        if self._stale:
+            return
+        e = self._extent
+        if e is None:
+            self._extent = [x, y, x, y]
+            return
+        e[0], e[1], e[2], e[3] = min(e[0], x), min(e[1], y), max(e[2], x), max(e[3], y)
+
+    def remove(self, x: float, y: float) -> None:
+        e = self._extent
+        if not self._stale and e is not None and (x == e[0] or y == e[1] or x == e[2] or y == e[3]):
+            self._stale = True
+
+    def move(self, old: tuple[float, float], new: tuple[float, float]) -> None:
+        self.remove(*old)
+        self.add(*new)
+
+    def _recompute(self) -> None:
+        self._stale = False
+        n = len(self._points)
+        if n == 0:
+            self._extent = None
+            return
+        xs = np.fromiter((p.x for p in self._points), np.float64, n)
+        ys = np.fromiter((p.y for p in self._points), np.float64, n)
+        self._extent = [float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())]
+
+    @property
+    def rect(self) -> Rect:
+        if self._stale:
+            self._recompute()
+        if self._extent is None:
+            return Rect(0, 0, 0, 0)
+        x0, y0, x1, y1 = self._extent
+        return Rect(x0, y0, x1 - x0, y1 - y0)
+
+class Viewport:
+    """
+    The editor's view of the world: screen = world * scale + offset. The offset is kept in whole pixels
+    so panning moves cached layers by exact pixel amounts.
+    """
+    def __init__(self, size: tuple[int, int], scale: float = 1.0, offset: tuple[int, int] = (0, 0)) -> None:
+        self.size = size
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def key(self) -> tuple[float, tuple[int, int]]:
+        return (self.scale, self.offset)
+
+    def to_screen(self, x: float, y: float) -> tuple[float, float]:
+        return (x * self.scale + self.offset[0], y * self.scale + self.offset[1])
+
+    def to_world(self, x: float, y: float) -> tuple[float, float]:
+        return ((x - self.offset[0]) / self.scale, (y - self.offset[1]) / self.scale)
+
+    def rect_to_screen(self, rect: Rect) -> Rect:
+        x, y = self.to_screen(rect.x, rect.y)
+        return Rect(x, y, rect.w * self.scale, rect.h * self.scale)
+
+    def rect_to_world(self, rect: Rect) -> Rect:
+        x, y = self.to_world(rect.x, rect.y)
+        return Rect(x, y, rect.w / self.scale, rect.h / self.scale)
+
+    """
+    The part of the world that's on screen
+    """
+    def visible(self) -> Rect:
+        return self.rect_to_world(Rect(0, 0, self.size[0], self.size[1]))
+
+    def pan(self, dx: float, dy: float) -> None:
+        self.offset = (self.offset[0] + round(dx), self.offset[1] + round(dy))
+
+    """
+    Changes the scale, the world position under pos (in screen coordinates) stays where it is
+    """
+    def zoom_at(self, pos: tuple[float, float], scale: float) -> None:
+        x, y = self.to_world(pos[0], pos[1])
+        self.scale = scale
+        self.offset = (round(pos[0] - x * scale), round(pos[1] - y * scale))
+
+    def reset(self) -> None:
+        self.scale = 1.0
+        self.offset = (0, 0)
+
 class Point(h_Point):
+    # a path can have hundreds of thousands of points, no per-instance __dict__
+    __slots__ = ("_id", "x", "y", "_next", "_prev", "_locked", "_initialized")
+
     def __init__(self, x: float | int, y: float | int, fully_initialized: bool = True) -> None:
         self._id: int = Util.get_unique_id()
         self.x = x
@@ -339,13 +445,25 @@ class Point(h_Point):
             "prev": self._prev._id if self._prev is not None else None
         }
     
+    """
+    Fills in keys that older files don't have. Upgrading to version 2 (the binary .cncproj format) also
+    makes sure every value fits the typed arrays that format stores them in.
+    """
     @staticmethod
-    def _upgrade_data(data: dict) -> dict:
+    def _upgrade_data(data: dict, version: int = 1) -> dict:
         _template = {"id": 0, "x": 0, "y": 0, "locked": False, "next": None, "prev": None}
         for k in _template:
             if k not in data:
                 data[k] = _template[k]
                 print(f"[INFO] Warning Point at {data.get('x', 'X-NotFound')}, {data.get('y', 'Y-NotFound')} is missing key [{k}, adding it to the memory copy")
+
+        if version >= 2:
+            data["id"] = int(data["id"])
+            data["x"] = float(data["x"])
+            data["y"] = float(data["y"])
+            data["locked"] = bool(data["locked"])
+            data["next"] = int(data["next"]) if data["next"] is not None else None
+            data["prev"] = int(data["prev"]) if data["prev"] is not None else None
         return data
 
     def __str__(self) -> str:
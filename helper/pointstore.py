@@ -0,0 +1,417 @@
+import numpy as np
+
+try:
+    from ..helper.mutil import Util, Point, Rect
+    from ..helper.contours import ContourPaths
+except ImportError:
+    from helper.mutil import Util, Point, Rect
+    from helper.contours import ContourPaths
+
+
+class PointStore:
+    """
+    Structure-of-arrays storage for large paths. Each point is a row: xy (float64), next/prev (int32 row
+    indices, -1 for none), flags (bitfield) and id (int64, the same ordering key as Point._id).
+    Rows never move, removed rows are only flagged until compact() is called, so a row index is a stable
+    handle to a point. view(row) returns a Point compatible object for code that expects h_Points.
+
+    snapshot() hands out a read-only copy that shares the arrays with this store, the store only copies
+    them the next time it's written to, so taking a snapshot for a background job is O(1).
+    """
+    _ARRAYS = ("_xy", "_next", "_prev", "_flags", "_ids")
+
+    LOCKED = 1
+    INITIALIZED = 2
+    DELETED = 4
+
+    def __init__(self, capacity: int = 1024) -> None:
+        capacity = max(capacity, 16)
+        self._count = 0
+        self._xy = np.zeros((capacity, 2), dtype=np.float64)
+        self._next = np.full(capacity, -1, dtype=np.int32)
+        self._prev = np.full(capacity, -1, dtype=np.int32)
+        self._flags = np.zeros(capacity, dtype=np.uint8)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._views: dict[int, 'PointView'] = {}
+        self._readonly = False
+        self._shared = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    # live views of the used part of the arrays ====
+    @property
+    def xy(self) -> np.ndarray:
+        return self._xy[:self._count]
+
+    @property
+    def next(self) -> np.ndarray:
+        return self._next[:self._count]
+
+    @property
+    def prev(self) -> np.ndarray:
+        return self._prev[:self._count]
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags[:self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._count]
+
+    @property
+    def nbytes(self) -> int:
+        return self._xy.nbytes + self._next.nbytes + self._prev.nbytes + self._flags.nbytes + self._ids.nbytes
+
+    def alive(self) -> np.ndarray:
+        return (self.flags & PointStore.DELETED) == 0
+
+    def rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive())
+
+    # copy on write ================================
+    def snapshot(self) -> 'PointStore':
+        snap = PointStore.__new__(PointStore)
+        snap._count = self._count
+        for name in PointStore._ARRAYS:
+            arr = getattr(self, name)
+            arr.flags.writeable = False
+            setattr(snap, name, arr)
+        snap._views = {}
+        snap._readonly = True
+        snap._shared = True
+        self._shared = True
+        return snap
+
+    @property
+    def readonly(self) -> bool:
+        return self._readonly
+
+    """
+    Called before every write, takes private copies of the arrays if a snapshot still shares them
+    """
+    def _own(self) -> None:
+        if self._readonly:
+            raise RuntimeError("PointStore snapshots are read-only")
+        if self._shared:
+            for name in PointStore._ARRAYS:
+                setattr(self, name, getattr(self, name).copy())
+            self._shared = False
+
+    def _reserve(self, count: int) -> None:
+        needed = self._count + count
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, len(self._ids) * 2)
+        self._xy = np.resize(self._xy, (capacity, 2))
+        for name, fill in (("_next", -1), ("_prev", -1), ("_flags", 0), ("_ids", 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+
+    # building ====================================
+    def append(self, x: float, y: float, id: int | None = None, locked: bool = False) -> int:
+        self._own()
+        self._reserve(1)
+        row = self._count
+        self._xy[row] = (x, y)
+        self._next[row] = -1
+        self._prev[row] = -1
+        self._flags[row] = PointStore.INITIALIZED | (PointStore.LOCKED if locked else 0)
+        self._ids[row] = Util.get_unique_id() if id is None else id
+        self._count += 1
+        return row
+
+    def extend(self, xy, ids=None) -> np.ndarray:
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        count = len(xy)
+        self._own()
+        self._reserve(count)
+        rows = np.arange(self._count, self._count + count)
+        self._xy[rows] = xy
+        self._next[rows] = -1
+        self._prev[rows] = -1
+        self._flags[rows] = PointStore.INITIALIZED
+        self._ids[rows] = Util.get_unique_ids(count) if ids is None else ids
+        self._count += count
+        return rows
+
+    @staticmethod
+    def from_xy(xy, ids=None) -> 'PointStore':
+        store = PointStore(len(xy))
+        store.extend(xy, ids)
+        return store
+
+    @staticmethod
+    def from_points(points: list[Point]) -> 'PointStore':
+        store = PointStore(len(points))
+        rows = {id(p): i for i, p in enumerate(points)}
+        store.extend([(p.x, p.y) for p in points], [p._id for p in points])
+        # links to points that aren't part of the list are dropped
+        store._next[:len(points)] = [rows.get(id(p._next), -1) for p in points]
+        store._prev[:len(points)] = [rows.get(id(p._prev), -1) for p in points]
+        store._flags[:len(points)] = [
+            (PointStore.LOCKED if p._locked else 0) | (PointStore.INITIALIZED if getattr(p, "_initialized", True) else 0)
+            for p in points
+        ]
+        return store
+
+    """
+    One chain per contour, the same as Util.points_from_paths
+    """
+    @staticmethod
+    def from_paths(paths: ContourPaths) -> 'PointStore':
+        store = PointStore.from_xy(paths.xy)
+        store.link_rows(*paths.links())
+        return store
+
+    def to_points(self) -> list[Point]:
+        rows = self.rows()
+        points = []
+        for (x, y), i, flags in zip(self._xy[rows].tolist(), self._ids[rows].tolist(), self._flags[rows].tolist()):
+            p = Point(x, y, bool(flags & PointStore.INITIALIZED))
+            p._id = i
+            p._locked = bool(flags & PointStore.LOCKED)
+            points.append(p)
+
+        index = np.full(self._count, -1, dtype=np.int64)
+        index[rows] = np.arange(len(rows))
+        for p, n, v in zip(points, self._next[rows].tolist(), self._prev[rows].tolist()):
+            p._next = points[index[n]] if n >= 0 and index[n] >= 0 else None
+            p._prev = points[index[v]] if v >= 0 and index[v] >= 0 else None
+        return points
+
+    # point access =================================
+    def view(self, row: int) -> 'PointView':
+        v = self._views.get(row)
+        if v is None:
+            v = self._views[row] = PointView(self, row)
+        return v
+
+    def views(self) -> list['PointView']:
+        return [self.view(row) for row in self.rows().tolist()]
+
+    def remove(self, row: int) -> None:
+        self._own()
+        # unlink first so no live row keeps pointing at a removed one
+        n, p = self._next[row], self._prev[row]
+        if n >= 0 and self._prev[n] == row:
+            self._prev[n] = -1
+        if p >= 0 and self._next[p] == row:
+            self._next[p] = -1
+        self._next[row] = self._prev[row] = -1
+        self._flags[row] |= PointStore.DELETED
+        self._views.pop(row, None)
+
+    """
+    remove() for many rows at once
+    """
+    def remove_rows(self, rows) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self._own()
+        removed = np.zeros(self._count, dtype=bool)
+        removed[rows] = True
+        nxt, prv = self.next, self.prev
+        nxt[(nxt >= 0) & removed[np.maximum(nxt, 0)]] = -1
+        prv[(prv >= 0) & removed[np.maximum(prv, 0)]] = -1
+        nxt[rows] = prv[rows] = -1
+        self.flags[rows] |= PointStore.DELETED
+        for row in rows.tolist():
+            self._views.pop(row, None)
+
+    """
+    Drops removed rows. Returns the old row -> new row mapping (-1 for removed rows), existing views are invalidated
+    """
+    def compact(self) -> np.ndarray:
+        self._own()
+        arrays, remap = self.packed()
+        count = len(arrays["ids"])
+        for name, arr in arrays.items():
+            getattr(self, "_" + name)[:count] = arr
+        self._count = count
+        self._views.clear()
+        return remap
+
+    """
+    Copies of the arrays with the removed rows dropped and the links renumbered, plus the old -> new row mapping
+    """
+    def packed(self) -> tuple[dict[str, np.ndarray], np.ndarray]:
+        keep = self.rows()
+        remap = np.full(self._count, -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+        nxt, prv = self._next[keep], self._prev[keep]
+        return {
+            "xy": self._xy[keep],
+            "next": np.where(nxt >= 0, remap[np.maximum(nxt, 0)], -1).astype(np.int32),
+            "prev": np.where(prv >= 0, remap[np.maximum(prv, 0)], -1).astype(np.int32),
+            "flags": self._flags[keep],
+            "ids": self._ids[keep],
+        }, remap
+
+    """
+    Wraps existing arrays (e.g. np.memmaps) without copying them, they're only copied once the store has to grow
+    """
+    @staticmethod
+    def from_arrays(xy: np.ndarray, next: np.ndarray, prev: np.ndarray, flags: np.ndarray, ids: np.ndarray) -> 'PointStore':
+        store = PointStore.__new__(PointStore)
+        store._count = len(ids)
+        store._xy, store._next, store._prev, store._flags, store._ids = xy, next, prev, flags, ids
+        store._views = {}
+        store._readonly = False
+        store._shared = False
+        return store
+
+    """
+    Row of the first live point with each of the given ids (-1 if there's none), the array version of Util.findpoint
+    """
+    def rows_for_ids(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = self.rows()
+        order = rows[np.argsort(self._ids[rows], kind="stable")]
+        known = self._ids[order]
+        if len(known) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        first = np.ones(len(known), dtype=bool)
+        first[1:] = known[1:] != known[:-1]
+        known, order = known[first], order[first]
+
+        pos = np.minimum(np.searchsorted(known, ids), len(known) - 1)
+        return np.where(known[pos] == ids, order[pos], -1)
+
+    def link_rows(self, next_rows, prev_rows) -> None:
+        self._own()
+        self._next[:self._count] = next_rows
+        self._prev[:self._count] = prev_rows
+
+    # bulk operations ==============================
+    """
+    Same linking rules as Util.connect_points, done with array operations
+    """
+    def connect(self) -> np.ndarray:
+        self._own()
+        rows = self.rows()
+        order = rows[np.argsort(self._ids[rows], kind="stable")]
+        ids = self._ids[order]
+        if len(order) == 0:
+            return order
+
+        connected = order[ids != -1]
+        positions = np.flatnonzero(ids != -1)
+        self._prev[connected] = np.where(positions > 0, order[np.maximum(positions - 1, 0)], -1)
+
+        has_next = positions < len(order) - 1
+        following = order[np.minimum(positions + 1, len(order) - 1)]
+        link = has_next & (self._ids[following] != -1)
+        self._next[connected[link]] = following[link]
+        self._next[connected[~has_next]] = -1
+        print(f"[INFO] Connected {len(connected)} points")
+        return order
+
+    def translate(self, dx: float, dy: float) -> None:
+        self._own()
+        self.xy[:] += (dx, dy)
+
+    def flip(self, horizontal: bool, vertical: bool) -> None:
+        self._own()
+        if horizontal:
+            self.xy[:, 0] *= -1
+        if vertical:
+            self.xy[:, 1] *= -1
+
+    def bounds(self) -> Rect:
+        xy = self._xy[self.rows()]
+        if len(xy) == 0:
+            return Rect(0, 0, 0, 0)
+        lo, hi = xy.min(axis=0), xy.max(axis=0)
+        return Rect(float(lo[0]), float(lo[1]), float(hi[0] - lo[0]), float(hi[1] - lo[1]))
+
+
+class PointView(Point):
+    """
+    A Point backed by one row of a PointStore. Reads and writes go straight to the arrays,
+    links can only point at other rows of the same store.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: PointStore, row: int) -> None:
+        self._store = store
+        self._row = row
+
+    def _link(self, p: Point | None) -> int:
+        if p is None:
+            return -1
+        if not isinstance(p, PointView) or p._store is not self._store:
+            raise ValueError("PointView can only be linked to points from the same PointStore")
+        return p._row
+
+    @property
+    def x(self) -> float:
+        return float(self._store._xy[self._row, 0])
+
+    @x.setter
+    def x(self, value: float) -> None:
+        self._store._own()
+        self._store._xy[self._row, 0] = value
+
+    @property
+    def y(self) -> float:
+        return float(self._store._xy[self._row, 1])
+
+    @y.setter
+    def y(self, value: float) -> None:
+        self._store._own()
+        self._store._xy[self._row, 1] = value
+
+    @property
+    def _id(self) -> int:
+        return int(self._store._ids[self._row])
+
+    @_id.setter
+    def _id(self, value: int) -> None:
+        self._store._own()
+        self._store._ids[self._row] = value
+
+    @property
+    def _next(self) -> 'PointView | None':
+        n = self._store._next[self._row]
+        return self._store.view(int(n)) if n >= 0 else None
+
+    @_next.setter
+    def _next(self, p: Point | None) -> None:
+        self._store._own()
+        self._store._next[self._row] = self._link(p)
+
+    @property
+    def _prev(self) -> 'PointView | None':
+        n = self._store._prev[self._row]
+        return self._store.view(int(n)) if n >= 0 else None
+
+    @_prev.setter
+    def _prev(self, p: Point | None) -> None:
+        self._store._own()
+        self._store._prev[self._row] = self._link(p)
+
+    @property
+    def _locked(self) -> bool:
+        return bool(self._store._flags[self._row] & PointStore.LOCKED)
+
+    @_locked.setter
+    def _locked(self, value: bool) -> None:
+        self._store._own()
+        if value:
+            self._store._flags[self._row] |= PointStore.LOCKED
+        else:
+            self._store._flags[self._row] &= ~np.uint8(PointStore.LOCKED)
+
+    @property
+    def _initialized(self) -> bool:
+        return bool(self._store._flags[self._row] & PointStore.INITIALIZED)
+
+    def __str__(self) -> str:
+        return f"PointView({self.x}, {self.y})"
@@ -0,0 +1,145 @@
+import json, os, time, threading, contextlib
+import numpy as np
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class PhaseStats:
+    """
+    Rolling numbers of one phase, in milliseconds
+    """
+    name: str
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    max: float
+
+
+class _Span:
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self._profiler, self._name = profiler, name
+
+    def __enter__(self) -> '_Span':
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._profiler.add(self._name, self._start, time.perf_counter_ns())
+
+
+class Profiler:
+    """
+    Timing hooks for the editor loop and the background pipelines. enabled keeps the last `window` durations of
+    every phase for the overlay (stats, histogram), recording keeps every span as a trace event for
+    export_chrome_trace. With both off span() hands out one shared no-op context and begin() returns None,
+    so the hooks can stay in the hot paths.
+    """
+    WINDOW = 300 # samples per phase, 5 seconds of frames at 60 fps
+    MAX_EVENTS = 1 << 20 # oldest trace events are dropped past this
+    HISTOGRAM = (0, 4, 8, 12, 16.7, 25, 33.3, 50, 100) # ms, bucket edges of the frame histogram
+
+    _NULL = contextlib.nullcontext()
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.enabled = False
+        self.recording = False
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._events: deque[tuple[str, int, int, int]] = deque(maxlen=Profiler.MAX_EVENTS)
+        self._threads: dict[int, str] = {}
+        self._origin = time.perf_counter_ns()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled or self.recording
+
+    def span(self, name: str):
+        if not (self.enabled or self.recording):
+            return Profiler._NULL
+        return _Span(self, name)
+
+    """
+    For phases that a with block doesn't fit around: token = begin(), ..., end(name, token)
+    """
+    def begin(self) -> int | None:
+        return time.perf_counter_ns() if (self.enabled or self.recording) else None
+
+    def end(self, name: str, token: int | None) -> None:
+        if token is not None:
+            self.add(name, token, time.perf_counter_ns())
+
+    """
+    func wrapped in a span, for handing timed work to threads
+    """
+    def wrap(self, name: str, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def add(self, name: str, start: int, end: int) -> None:
+        if self.enabled:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples.setdefault(name, deque(maxlen=self.window))
+            samples.append((end - start) / 1e6)
+        if self.recording:
+            ident = threading.get_ident()
+            if ident not in self._threads:
+                self._threads[ident] = threading.current_thread().name
+            self._events.append((name, start, end, ident))
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._events.clear()
+
+    """
+    Numbers of the rolling samples, or with recorded of every span recorded since the last reset
+    """
+    def stats(self, recorded: bool = False) -> list[PhaseStats]:
+        phases = self._recorded() if recorded else self._samples
+        result = []
+        for name, samples in list(phases.items()):
+            ms = np.fromiter(samples, np.float64)
+            if len(ms):
+                p50, p95 = np.percentile(ms, (50, 95))
+                result.append(PhaseStats(name, len(ms), float(ms.mean()), float(p50), float(p95), float(ms.max())))
+        return result
+
+    def _recorded(self) -> dict[str, list[float]]:
+        phases: dict[str, list[float]] = {}
+        for name, start, end, _ in list(self._events):
+            phases.setdefault(name, []).append((end - start) / 1e6)
+        return phases
+
+    """
+    Counts of the phase's rolling samples per bucket of HISTOGRAM, the last bucket holds everything above it
+    """
+    def histogram(self, name: str) -> np.ndarray:
+        ms = np.fromiter(self._samples.get(name, ()), np.float64)
+        edges = np.array(Profiler.HISTOGRAM[1:])
+        return np.bincount(np.searchsorted(edges, ms, side="right"), minlength=len(edges) + 1)
+
+    """
+    Writes the recorded spans in the Chrome trace event format (chrome://tracing, Perfetto),
+    returns the number of spans written
+    """
+    def export_chrome_trace(self, path: str) -> int:
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": name}}
+                  for ident, name in list(self._threads.items())]
+        spans = list(self._events)
+        for name, start, end, ident in spans:
+            events.append({"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": ident,
+                           "ts": (start - self._origin) / 1000, "dur": (end - start) / 1000})
+
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
+        return len(spans)
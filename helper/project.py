@@ -0,0 +1,321 @@
+import json, os, shutil, struct
+import numpy as np
+from typing import Any, Callable
+from dataclasses import dataclass, field
+
+try:
+    from ..helper.mutil import Point, Origin
+    from ..helper.pointstore import PointStore
+except ImportError:
+    from helper.mutil import Point, Origin
+    from helper.pointstore import PointStore
+
+
+class _JsonReader:
+    """
+    Pulls JSON values out of a file a chunk at a time, so big files never have to be in memory as one string
+    """
+    def __init__(self, f, chunk_size: int = 1 << 20) -> None:
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._dropped = 0 # characters already thrown away from the front of the buffer
+
+    @property
+    def position(self) -> int:
+        return self._dropped + self._pos
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        data = self._f.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._dropped += self._pos
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Invalid project file, expected '{ch}' at character {self.position}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a value that runs up to the end of the buffer might continue in the next chunk (numbers)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    """
+    Inside an array of flat objects: decodes every complete element in the buffer with one json.loads
+    call instead of one raw_decode per element. Returns an empty list when the array is done.
+    """
+    def objects(self) -> list[Any]:
+        while True:
+            ch = self.peek()
+            if ch == ",":
+                self._pos += 1
+                continue
+            if ch != "{":
+                return []
+            # stop at the end of the array, the file's closing brace must not be picked up
+            stop = self._buf.find("]", self._pos)
+            end = self._buf.rfind("}", self._pos, stop if stop != -1 else len(self._buf))
+            if end == -1:
+                if stop != -1:
+                    # the "]" is inside this object, it isn't a flat one
+                    return [self.value()]
+                if not self._fill():
+                    raise ValueError("Invalid project file, unexpected end of file")
+                continue
+            try:
+                values = json.loads("[" + self._buf[self._pos:end + 1] + "]")
+            except json.JSONDecodeError:
+                # not a run of flat objects after all, fall back to decoding one value
+                values = [self.value()]
+            else:
+                self._pos = end + 1
+            if not self._eof and self._pos >= len(self._buf) - 1:
+                self._fill()
+            return values
+
+
+@dataclass
+class Project:
+    """
+    .cncproj files come in two versions:
+      1 - a JSON document with one dict per point, links stored as point ids
+      2 - binary: MAGIC, uint32 version, uint32 header length, a JSON header (metadata and where each array is)
+          and the PointStore arrays (xy, next, prev, flags, ids) as little-endian blocks aligned to 64 bytes,
+          so they can be memory-mapped straight into a PointStore
+    Both can be loaded, saving always writes version 2.
+    """
+    points: PointStore | list[Point] = field(default_factory=list)
+    origin: int = Origin.CENTER
+    point_density: int = 10
+    image_path: str | None = None
+
+    MAGIC = b"CNCPROJ\0"
+    VERSION = 2
+
+    _BATCH = 1 << 16
+    _ALIGN = 64
+    _ARRAYS = (("xy", "<f8"), ("next", "<i4"), ("prev", "<i4"), ("flags", "u1"), ("ids", "<i8"))
+
+    @staticmethod
+    def version_of(path: str) -> int:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+        if head[:8] == Project.MAGIC:
+            return struct.unpack("<I", head[8:12])[0]
+        return 1
+
+    """
+    progress is called with the fraction of the file read so far (only JSON files take long enough to need it).
+    Binary files are memory-mapped copy-on-write unless mmap is False, edits never touch the file.
+    """
+    @staticmethod
+    def load(path: str, progress: Callable[[float], None] | None = None, mmap: bool = True) -> 'Project':
+        version = Project.version_of(path)
+        if version > Project.VERSION:
+            raise ValueError(f"'{path}' is a version {version} project, this build only reads up to version {Project.VERSION}")
+        if version == 2:
+            project = Project._load_binary(path, mmap)
+            if progress:
+                progress(1.0)
+            return project
+        return Project._load_json(path, progress)
+
+    @staticmethod
+    def _load_binary(path: str, mmap: bool) -> 'Project':
+        with open(path, 'rb') as f:
+            _, _, header_length = struct.unpack("<8sII", f.read(16))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if shape[0] == 0:
+                arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            elif mmap:
+                arrays[name] = np.memmap(path, dtype=spec["dtype"], mode='c', offset=spec["offset"], shape=shape)
+            else:
+                arrays[name] = np.fromfile(path, dtype=spec["dtype"], count=int(np.prod(shape)), offset=spec["offset"]).reshape(shape)
+
+        return Project(PointStore.from_arrays(**arrays), header["origin"], header["point_density"], header["image_path"])
+
+    @staticmethod
+    def _load_json(path: str, progress: Callable[[float], None] | None = None) -> 'Project':
+        size = max(os.path.getsize(path), 1)
+        meta: dict[str, Any] = {}
+        store = None
+
+        with open(path, 'r') as f:
+            reader = _JsonReader(f)
+            reader.expect("{")
+            while reader.peek() != "}":
+                key = reader.value()
+                reader.expect(":")
+                if key == "points":
+                    store = Project._read_points(reader, size, progress)
+                else:
+                    meta[key] = reader.value()
+                if reader.peek() == ",":
+                    reader.expect(",")
+
+        if progress:
+            progress(1.0)
+        return Project(store if store is not None else PointStore(), meta['origin'], meta['point_density'], meta['image_path'])
+
+    @staticmethod
+    def _read_points(reader: _JsonReader, size: int, progress: Callable[[float], None] | None) -> PointStore:
+        store = PointStore(Project._BATCH)
+        next_ids, prev_ids = [], []
+        xy, ids, locked = [], [], []
+
+        def flush():
+            rows = store.extend(xy, ids)
+            store.flags[rows[np.array(locked, dtype=bool)]] |= PointStore.LOCKED
+            xy.clear(), ids.clear(), locked.clear()
+            if progress:
+                progress(min(reader.position / size, 1.0))
+
+        reader.expect("[")
+        while values := reader.objects():
+            for d in values:
+                d = Point._upgrade_data(d, Project.VERSION)
+                xy.append((d["x"], d["y"]))
+                ids.append(d["id"])
+                locked.append(d["locked"])
+                next_ids.append(d["next"])
+                prev_ids.append(d["prev"])
+            if len(ids) >= Project._BATCH:
+                flush()
+        reader.expect("]")
+        if ids:
+            flush()
+
+        # links are stored as ids, resolve them all at once instead of looking every one up
+        store.link_rows(Project._resolve(store, next_ids), Project._resolve(store, prev_ids))
+        return store
+
+    @staticmethod
+    def _resolve(store: PointStore, ids: list[int | None]) -> np.ndarray:
+        has = np.fromiter((i is not None for i in ids), bool, len(ids))
+        targets = np.fromiter((i if i is not None else 0 for i in ids), np.int64, len(ids))
+        return np.where(has, store.rows_for_ids(targets), -1)
+
+    def save(self, path: str, version: int = VERSION) -> None:
+        # write next to the target and swap it in, a failed save never leaves a half written project behind
+        tmp = path + ".tmp"
+        if version == 1:
+            self._save_json(tmp)
+        else:
+            self._save_binary(tmp)
+        os.replace(tmp, path)
+
+    def _save_binary(self, path: str) -> None:
+        store = self.points if isinstance(self.points, PointStore) else PointStore.from_points(self.points)
+        arrays, _ = store.packed()
+
+        specs, offset = {}, 0
+        for name, dtype in Project._ARRAYS:
+            arrays[name] = np.ascontiguousarray(arrays[name], dtype=dtype)
+            specs[name] = {"dtype": dtype, "shape": list(arrays[name].shape), "offset": offset}
+            offset += -(-arrays[name].nbytes // Project._ALIGN) * Project._ALIGN
+
+        def encode_header(base: int) -> bytes:
+            return json.dumps({
+                'origin': self.origin,
+                'point_density': self.point_density,
+                'image_path': self.image_path,
+                'count': len(arrays["ids"]),
+                'arrays': {name: {**spec, "offset": spec["offset"] + base} for name, spec in specs.items()},
+            }).encode("utf-8")
+
+        # the array offsets are part of the header, so size the header once to know where the data starts
+        base = -(-(16 + len(encode_header(1 << 40))) // Project._ALIGN) * Project._ALIGN
+        header = encode_header(base)
+
+        with open(path, 'wb') as f:
+            f.write(struct.pack("<8sII", Project.MAGIC, Project.VERSION, len(header)))
+            f.write(header)
+            for name, _ in Project._ARRAYS:
+                f.seek(base + specs[name]["offset"])
+                arrays[name].tofile(f)
+
+    """
+    Rewrites a version 1 (JSON) project as version 2, the original is kept next to it as <path>.v1.bak
+    """
+    @staticmethod
+    def upgrade_file(path: str) -> bool:
+        if Project.version_of(path) >= Project.VERSION:
+            return False
+        project = Project.load(path)
+        Project.backup_older(path)
+        project.save(path)
+        return True
+
+    """
+    Copies an existing project file older than VERSION to <path>.v<version>.bak before it gets overwritten,
+    returns the backup's path or None if there was nothing to keep
+    """
+    @staticmethod
+    def backup_older(path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        version = Project.version_of(path)
+        if version >= Project.VERSION:
+            return None
+        backup = f"{path}.v{version}.bak"
+        shutil.copyfile(path, backup)
+        return backup
+
+    def _save_json(self, path: str) -> None:
+        points = self.points.views() if isinstance(self.points, PointStore) else self.points
+        with open(path, 'w') as f:
+            f.write('{"points": [')
+            for i, p in enumerate(points):
+                if i:
+                    f.write(', ')
+                f.write(json.dumps(p.to_dict()))
+            f.write('], ')
+            f.write(json.dumps({
+                'origin': self.origin,
+                'point_density': self.point_density,
+                'image_path': self.image_path
+            })[1:])
+
+    """
+    The image path is stored as it was when the project was saved, fall back to looking
+    next to the project file if it doesn't exist anymore
+    """
+    def resolve_image_path(self, project_path: str) -> str | None:
+        if not self.image_path:
+            return None
+        if os.path.exists(self.image_path):
+            return self.image_path
+        candidate = os.path.join(os.path.dirname(os.path.abspath(project_path)), os.path.basename(self.image_path))
+        return candidate if os.path.exists(candidate) else None
@@ -0,0 +1,213 @@
+import math
+import numpy as np
+
+try:
+    from ..header.h_point import h_Point
+except ImportError:
+    from header.h_point import h_Point
+
+
+class SpatialIndex:
+    """
+    Uniform grid over a set of points. Every point lives in exactly one cell so
+    hit-testing only has to look at the handful of cells around the cursor
+    instead of every point in the path.
+    """
+    def __init__(self, cell_size: float = 16) -> None:
+        self._cell_size = cell_size
+        self._cells: dict[tuple[int, int], list[h_Point]] = {}
+        self._keys: dict[int, tuple[int, int]] = {} # id(point) -> cell the point is stored in
+        self._extent: list[int] | None = None # [min_cx, min_cy, max_cx, max_cy], only ever grows
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, p: h_Point) -> bool:
+        return id(p) in self._keys
+
+    def _key(self, x: float, y: float) -> tuple[int, int]:
+        return (math.floor(x / self._cell_size), math.floor(y / self._cell_size))
+
+    def _grow_extent(self, key: tuple[int, int]) -> None:
+        if self._extent is None:
+            self._extent = [key[0], key[1], key[0], key[1]]
+            return
+        self._extent[0] = min(self._extent[0], key[0])
+        self._extent[1] = min(self._extent[1], key[1])
+        self._extent[2] = max(self._extent[2], key[0])
+        self._extent[3] = max(self._extent[3], key[1])
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._keys.clear()
+        self._extent = None
+
+    def rebuild(self, points: list[h_Point]) -> None:
+        self.clear()
+        if not points:
+            return
+        # all the cell keys and the extent in one go, only filling the dicts is left per point
+        n = len(points)
+        xy = np.fromiter((c for p in points for c in (p.x, p.y)), np.float64, 2 * n).reshape(n, 2)
+        cells = np.floor(xy / self._cell_size).astype(np.int64)
+        lo, hi = cells.min(axis=0).tolist(), cells.max(axis=0).tolist()
+        self._extent = [lo[0], lo[1], hi[0], hi[1]]
+        for p, key in zip(points, map(tuple, cells.tolist())):
+            if id(p) not in self._keys:
+                self._keys[id(p)] = key
+                self._cells.setdefault(key, []).append(p)
+
+    def insert(self, p: h_Point) -> None:
+        if id(p) in self._keys:
+            self.update(p)
+            return
+        key = self._key(p.x, p.y)
+        self._cells.setdefault(key, []).append(p)
+        self._keys[id(p)] = key
+        self._grow_extent(key)
+
+    def remove(self, p: h_Point) -> None:
+        key = self._keys.pop(id(p), None)
+        if key is None:
+            return
+        cell = self._cells[key]
+        # Point.__eq__ compares coordinates, so match on identity instead of list.remove
+        for i, q in enumerate(cell):
+            if q is p:
+                del cell[i]
+                break
+        if not cell:
+            del self._cells[key]
+
+    """
+    Must be called after a point has been moved so it ends up in the right cell
+    """
+    def update(self, p: h_Point) -> None:
+        old = self._keys.get(id(p))
+        if old is None:
+            self.insert(p)
+            return
+        if old != self._key(p.x, p.y):
+            self.remove(p)
+            self.insert(p)
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def query_radius(self, x: float, y: float, radius: float) -> list[h_Point]:
+        found = []
+        r2 = radius * radius
+        cx0, cy0 = self._key(x - radius, y - radius)
+        cx1, cy1 = self._key(x + radius, y + radius)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for p in self._cells.get((cx, cy), ()):
+                    if (p.x - x) ** 2 + (p.y - y) ** 2 <= r2:
+                        found.append(p)
+        return found
+
+    def query_rect(self, x: float, y: float, w: float, h: float) -> list[h_Point]:
+        found = []
+        cx0, cy0 = self._key(x, y)
+        cx1, cy1 = self._key(x + w, y + h)
+        # walk whichever is smaller, the cells covering the rect or the occupied cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            keys = [k for k in self._cells if cx0 <= k[0] <= cx1 and cy0 <= k[1] <= cy1]
+        else:
+            keys = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        for key in keys:
+            for p in self._cells.get(key, ()):
+                if x <= p.x <= x + w and y <= p.y <= y + h:
+                    found.append(p)
+        return found
+
+    """
+    Closest point to (x, y), or None if there is nothing within max_distance.
+    Without a max_distance the search expands ring by ring until it can't do better.
+    """
+    def nearest(self, x: float, y: float, max_distance: float | None = None) -> h_Point | None:
+        if not self._keys:
+            return None
+
+        cx, cy = self._key(x, y)
+        if max_distance is not None:
+            max_ring = math.ceil(max_distance / self._cell_size)
+        else:
+            ext = self._extent
+            max_ring = max(abs(cx - ext[0]), abs(cx - ext[2]), abs(cy - ext[1]), abs(cy - ext[3]))
+
+        best = None
+        best_d2 = math.inf if max_distance is None else max_distance * max_distance
+        for r in range(max_ring + 1):
+            for key in self._ring(cx, cy, r):
+                for p in self._cells.get(key, ()):
+                    d2 = (p.x - x) ** 2 + (p.y - y) ** 2
+                    if d2 <= best_d2:
+                        best, best_d2 = p, d2
+            # anything in the next ring is at least r cells away
+            if best is not None and best_d2 <= (r * self._cell_size) ** 2:
+                break
+        return best
+
+    """
+    Minimum-distance thinning: returns the indices (sorted) of the points to keep so that no two kept points are
+    closer than `spacing` and every dropped point has a kept point closer than `spacing`. Deterministic for a
+    given input order, inside a cell earlier points win.
+    """
+    @staticmethod
+    def thin(xy, spacing: float) -> np.ndarray:
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        if len(xy) == 0 or spacing <= 0:
+            return np.arange(len(xy))
+
+        # a cell's diagonal equals the spacing, so a cell holds at most one kept point and anything closer than
+        # the spacing is at most two cells away. Cells three apart in both directions can't see each other, so
+        # the grid splits into 9 phases that each pick one point per cell at once
+        cells = np.floor(xy / (spacing / math.sqrt(2))).astype(np.int64)
+        cells -= cells.min(axis=0) - 2
+        stride = int(cells[:, 1].max()) + 3
+        size = (int(cells[:, 0].max()) + 3) * stride
+        keys = cells[:, 0] * stride + cells[:, 1]
+        offsets = [dx * stride + dy for dx in range(-2, 3) for dy in range(-2, 3) if (dx, dy) != (0, 0)]
+
+        if size <= 4 * len(xy) + (1 << 20):
+            slot = lambda k: k
+        else:
+            # few points spread far apart, look up the cells that have points instead of allocating the grid
+            used = np.unique(keys)
+            size = len(used) + 1
+            def slot(k):
+                i = np.searchsorted(used, k)
+                i[used[np.minimum(i, len(used) - 1)] != k] = len(used)
+                return i
+
+        s2 = spacing * spacing
+        x, y = xy[:, 0], xy[:, 1]
+        phase = cells[:, 0] % 3 * 3 + cells[:, 1] % 3
+        order = np.lexsort((keys, phase)) # by phase, then cell, then input order
+        bounds = np.searchsorted(phase[order], np.arange(10))
+        kept = np.full(size, -1, dtype=np.int64) # cell -> index of the point kept there
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            rows = order[a:b]
+            k = keys[rows]
+            free = np.ones(len(rows), dtype=bool)
+            for o in offsets:
+                q = kept[slot(k + o)]
+                h = np.flatnonzero(q >= 0)
+                qh, rh = q[h], rows[h]
+                free[h[(x[qh] - x[rh]) ** 2 + (y[qh] - y[rh]) ** 2 < s2]] = False
+            rows, k = rows[free], k[free]
+            if len(rows) == 0:
+                continue
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = k[1:] != k[:-1]
+            kept[slot(k[first])] = rows[first]
+        return np.sort(kept[kept >= 0])
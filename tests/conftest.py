@@ -0,0 +1,5 @@
+import os, sys
+
+# the modules import each other from the repository root (helper.mutil, gcode.p2code, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
@@ -0,0 +1,80 @@
+import os, shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from helper.cache import ExtractionCache
+
+
+@pytest.fixture
+def image(tmp_path) -> str:
+    img = np.full((200, 240, 3), 255, dtype=np.uint8)
+    cv2.circle(img, (80, 90), 40, (0, 0, 0), 2)
+    cv2.rectangle(img, (140, 30), (220, 170), (0, 0, 0), 1)
+    path = str(tmp_path / "drawing.png")
+    cv2.imwrite(path, img)
+    return path
+
+
+def same(a, b) -> bool:
+    return (np.array_equal(a.paths.xy, b.paths.xy) and np.array_equal(a.paths.starts, b.paths.starts)
+            and np.array_equal(a.paths.parents, b.paths.parents) and np.array_equal(a.keep, b.keep) and a.size == b.size)
+
+
+def test_hit_by_content(tmp_path, image):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    traced = cache.extract(image, 5)
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+    assert same(cache.extract(image, 5), traced)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    # a renamed copy is the same bytes
+    copy = str(tmp_path / "copy.png")
+    shutil.copy(image, copy)
+    assert same(cache.extract(copy, 5), traced)
+    assert cache.stats.hits == 2
+
+    # an edited image is not
+    img = cv2.imread(image)
+    img[100, 100] = 0
+    cv2.imwrite(copy, img)
+    cache.extract(copy, 5)
+    assert cache.stats.misses == 2
+
+
+def test_misses_on_other_parameters(tmp_path, image, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    cache.extract(image, 5)
+    cache.extract(image, 8)
+    assert cache.stats.misses == 2
+    monkeypatch.setattr(ExtractionCache, "VERSION", ExtractionCache.VERSION + 1)
+    cache.extract(image, 5)
+    assert (cache.stats.hits, cache.stats.misses) == (0, 3)
+    assert cache.refresh_stats().entries == 3
+
+
+def test_unreadable_entry_is_traced_again(tmp_path, image):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    traced = cache.extract(image, 5)
+    (entry,) = os.listdir(cache.directory)
+    with open(os.path.join(cache.directory, entry), "wb") as f:
+        f.write(b"not a zip file")
+    assert same(cache.extract(image, 5), traced)
+    assert cache.stats.misses == 2
+    assert same(cache.extract(image, 5), traced)
+    assert cache.stats.hits == 1
+
+
+def test_evicts_least_recently_used(tmp_path, image):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    for density in (4, 5, 6):
+        cache.extract(image, density)
+    entries = sorted(cache._entries())
+    # distinct last use times, the first entry is the least recently used
+    for i, (_, path, _) in enumerate(entries):
+        os.utime(path, (1000 + i, 1000 + i))
+    cache.max_bytes = sum(size for _, _, size in entries) - 1
+    cache.evict()
+    assert cache.stats.evictions == 1
+    assert sorted(path for _, path, _ in cache._entries()) == sorted(path for _, path, _ in entries[1:])
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+
+from helper.contours import Contours, ContourPaths
+
+
+def drawing(seed: int) -> np.ndarray:
+    # nested and side by side outlines, the kind of contours that run close to each other
+    rng = np.random.default_rng(seed)
+    img = np.full((400, 400, 3), 255, dtype=np.uint8)
+    for _ in range(12):
+        center = tuple(int(v) for v in rng.integers(40, 360, 2))
+        cv2.circle(img, center, int(rng.integers(5, 60)), (0, 0, 0), int(rng.integers(1, 4)))
+    for _ in range(8):
+        a, b = (tuple(int(v) for v in rng.integers(0, 400, 2)) for _ in range(2))
+        cv2.line(img, a, b, (0, 0, 0), 1)
+    return img
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("spacing", [2, 5, 12])
+def test_sample_keeps_spacing_across_contours(seed, spacing):
+    paths = ContourPaths.from_contours(*Contours.find(drawing(seed)))
+    rows = paths.sample(spacing)
+    assert np.all(np.diff(rows) > 0)
+
+    xy = paths.xy[rows]
+    d = np.hypot(*(xy[:, None] - xy[None, :]).transpose(2, 0, 1))
+    np.fill_diagonal(d, np.inf)
+    assert d.min() >= spacing
+
+    # every contour keeps its numbering
+    assert len(paths.take(rows)) == len(paths)
+
+
+@pytest.mark.parametrize("tile_size", [64, 150, 256])
+def test_tiled_tracing_matches_whole_image(tile_size):
+    img = np.full((600, 700, 3), 255, dtype=np.uint8)
+    rng = np.random.default_rng(tile_size)
+    for _ in range(60):
+        center = tuple(int(v) for v in rng.integers(0, 700, 2))
+        shade = (int(rng.integers(0, 200)),) * 3
+        cv2.circle(img, center, int(rng.integers(3, 120)), shade, int(rng.choice([-1, 1, 2, 3])))
+        a, b = (tuple(int(v) for v in rng.integers(0, 700, 2)) for _ in range(2))
+        cv2.line(img, a, b, shade, int(rng.integers(1, 3)))
+
+    contours, parents = Contours.find(img)
+    found, found_parents = Contours.find_tiled(img, tile_size, workers=1)
+    assert len(found) == len(contours)
+    assert all(np.array_equal(a, b) for a, b in zip(found, contours))
+    assert np.array_equal(found_parents, parents)
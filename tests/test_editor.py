@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+# the editor draws into SDL's dummy driver, no window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+pytest.importorskip("debugpy")
+
+from ui.events import Message, HeadlessBackend, WM_MOUSEMOVE, WM_RBUTTONDOWN, WM_RBUTTONUP, WM_KEYDOWN, WM_KEYUP
+
+
+@pytest.fixture
+def editor(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYCNC_CACHE_DIR", str(tmp_path / "cache"))
+    pygame.init()
+    import editor as E
+    ed = E.Editor()
+    ed._image = pygame.Surface((400, 300))
+    yield ed
+    ed._jobs.shutdown()
+    pygame.quit()
+
+
+def keys(*codes: int) -> list[list[Message]]:
+    return [[Message(WM_KEYDOWN, c) for c in codes], [Message(WM_KEYUP, c) for c in reversed(codes)]]
+
+
+@pytest.mark.parametrize("action", ["delete", "lock", "unlink"])
+def test_undo_forgets_the_hovered_point(editor, action):
+    at = (100, 100)
+    session = [[Message(WM_MOUSEMOVE, 0, 0, at)], [Message(WM_RBUTTONDOWN, 0, 0, at)], [Message(WM_RBUTTONUP, 0, 0, at)],
+               [Message(WM_MOUSEMOVE, 0, 0, (at[0] + 1, at[1]))]]
+    added = len(session)
+    session += keys(17, 90) # Ctrl + Z
+    undone = len(session)
+    if action == "delete":
+        session += keys(46)
+    elif action == "lock":
+        session += keys(76)
+    else:
+        session += [[Message(WM_RBUTTONDOWN, 0, 0, at)], [Message(WM_RBUTTONUP, 0, 0, at)]]
+
+    class Probe(HeadlessBackend):
+        def _drain(self):
+            if self.frame == added:
+                assert len(editor._points) == 1 and editor._hover_point is editor._points[0]
+            if self.frame == undone:
+                editor._connect_mode = action == "unlink"
+            return super()._drain()
+
+    # add a point and hover it, undo the add without moving the mouse, then act on whatever is hovered
+    editor.run(Probe(session))
+    assert editor._points == [] and editor._hover_point is None
+    # nothing was recorded for the removed point, the add can still be redone
+    assert editor._journal.redo(editor) is not None and len(editor._points) == 1
+
+
+def test_remove_point_ignores_missing_points(editor):
+    from helper.mutil import Point
+    editor._set_points([Point(1, 2)])
+    assert editor._remove_point(Point(1, 2)) is None
+    assert len(editor._points) == 1
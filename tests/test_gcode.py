@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from gcode.p2code import GCode
+from helper.mutil import Origin
+from helper.pointstore import PointStore
+
+
+def test_format_coords_matches_round():
+    rng = np.random.default_rng(0)
+    values = np.concatenate((
+        rng.uniform(-100, 100, 20000),
+        np.round(rng.uniform(-100, 100, 20000), 4),  # lots of half thousandths like -6.2125
+        rng.uniform(-0.001, 0.001, 2000),            # negatives that round to -0.0
+        [-6.2125, 6.2125, 0.0, -0.0, 0.0005, -0.0005, 1e6 + 0.0005, 2.5, -2.5],
+    ))
+    assert GCode._format_coords(values) == [str(round(float(v), 3)) for v in values]
+
+
+def emit(machine: np.ndarray, tolerance: float) -> list[str]:
+    # size 0 and 1 pixel per inch: the machine x is the flipped pixel x, y is the same
+    store = PointStore.from_xy(np.column_stack((-machine[:, 0], machine[:, 1])))
+    return list(GCode.iter_gcode(store, (0, 0), Origin.CENTER, ppin=1, arc_tolerance=tolerance))
+
+
+def polyline_distance(p: np.ndarray, line: np.ndarray) -> np.ndarray:
+    # distance of every point in p to the polyline through line
+    a, b = line[:-1], line[1:]
+    ab = b - a
+    t = np.clip(((p[:, None] - a) * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-18), 0, 1)
+    closest = a + t[..., None] * ab
+    return np.hypot(*(p[:, None] - closest).transpose(2, 0, 1)).min(axis=1)
+
+
+# replays the program against the points it was made from: every arc has to end on its circle, go round it
+# the way its G2/G3 says through the points it replaces and stay within tolerance of them. Returns the G1/G2/G3 counts
+def check_arcs(machine: np.ndarray, lines: list[str], tolerance: float) -> dict[int, int]:
+    machine = np.round(machine, 3)
+    slack = 2e-3 # coordinates and centers are written rounded
+    counts = {1: 0, 2: 0, 3: 0}
+    k = 0
+    pos = None
+    for line in lines[1:]:
+        words = {w[0]: float(w[1:]) for w in line.split()}
+        end = np.array([words["X"], words["Y"]])
+        direction = int(words["G"])
+        counts[direction] += 1
+        if pos is None:
+            assert direction == 1
+            pos = end
+            continue
+
+        # the original points this move replaces
+        start = k
+        while not np.allclose(machine[k], end):
+            k += 1
+        covered = machine[start:k + 1]
+
+        if direction != 1:
+            center = pos + (words["I"], words["J"])
+            r = np.hypot(*(pos - center))
+            assert abs(np.hypot(*(end - center)) - r) <= slack
+            # the points lie on the circle
+            assert np.all(np.abs(np.hypot(*(covered - center).T) - r) <= tolerance + slack)
+            # and the tool passes them in order going round the way G2/G3 says
+            angles = np.arctan2(*(covered - center).T[::-1])
+            steps = (np.diff(angles) + np.pi) % (2 * np.pi) - np.pi
+            assert np.all(steps > 0) if direction == 3 else np.all(steps < 0)
+            # the arc itself never strays from the path through the points
+            sweep = steps.sum()
+            t = angles[0] + np.linspace(0, sweep, 200)
+            arc = center + r * np.column_stack((np.cos(t), np.sin(t)))
+            assert polyline_distance(arc, covered).max() <= tolerance + slack
+        pos = end
+    assert k == len(machine) - 1
+    return counts
+
+
+def circle(center, r, start, sweep, n, rng=None, noise=0.0):
+    t = start + np.linspace(0, sweep, n)
+    xy = np.column_stack((center[0] + r * np.cos(t), center[1] + r * np.sin(t)))
+    if rng is not None:
+        xy += rng.uniform(-noise, noise, xy.shape)
+    return xy
+
+
+@pytest.mark.parametrize("sweep,direction", [(1.5 * np.pi, 3), (-1.5 * np.pi, 2)])
+@pytest.mark.parametrize("tolerance", [0.002, 0.01, 0.05])
+def test_arcs_stay_within_tolerance(sweep, direction, tolerance):
+    machine = circle((3, -2), 5, 0.3, sweep, 300)
+    counts = check_arcs(machine, emit(machine, tolerance), tolerance)
+    assert counts[direction] > 0 and counts[5 - direction] == 0
+    assert counts[1] + counts[direction] < len(machine) // 4
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_arcs_on_noisy_mixed_paths(seed):
+    rng = np.random.default_rng(seed)
+    tolerance = 0.01
+    machine = np.vstack((
+        circle((0, 0), 4, 0, np.pi, 150, rng, tolerance / 4),
+        np.column_stack((np.linspace(-4.1, -8, 40), np.linspace(0, 1, 40))),
+        circle((-8, 3), 2, -np.pi / 2, -np.pi, 80, rng, tolerance / 4),
+        rng.uniform(-10, 10, (60, 2)), # jagged, lines only
+        circle((5, 5), 0.5, 0, 1.9 * np.pi, 60),
+    ))
+    counts = check_arcs(machine, emit(machine, tolerance), tolerance)
+    assert counts[2] > 0 and counts[3] > 0
+
+
+def test_collinear_points_stay_lines():
+    machine = np.column_stack((np.linspace(0, 10, 101), np.linspace(2, -3, 101)))
+    lines = emit(machine, 0.01)
+    counts = check_arcs(machine, lines, 0.01)
+    assert counts == {1: len(machine), 2: 0, 3: 0}
+    assert GCode._fit_arc(machine, 0, 100, 0.01) is None
+
+
+def traced_store(n_contours: int = 6, length: int = 20) -> PointStore:
+    # the way extraction links points: one chain per contour and no links between contours
+    xy = np.arange(n_contours * length * 2, dtype=np.float64).reshape(-1, 2)
+    store = PointStore.from_xy(xy)
+    nxt = np.arange(1, len(xy) + 1)
+    prv = np.arange(-1, len(xy) - 1)
+    nxt[length - 1::length] = -1
+    prv[::length] = -1
+    store.link_rows(nxt, prv)
+    return store
+
+
+def test_validate_accepts_separate_contours():
+    diagnostics = GCode.validate_path(traced_store())
+    assert diagnostics.ok
+    assert diagnostics.component_count == 6
+    assert len(diagnostics.contour_ends) == 5
+    assert len(diagnostics.dangling) == 0 and len(diagnostics.error_rows()) == 0
+
+
+def test_validate_reports_broken_pieces():
+    store = traced_store()
+    store.next[45] = 41     # a cycle in the third contour
+    store.next[65] = 70     # a branch into the fourth one, 70 keeps its own predecessor
+    diagnostics = GCode.validate_path(store)
+    assert not diagnostics.ok
+    assert [c.tolist() for c in diagnostics.cycles] == [[41, 42, 43, 44, 45]]
+    assert diagnostics.multiple_predecessors.tolist() == [41, 70]
+    assert diagnostics.asymmetric.tolist() == [45, 46, 65, 66]
+    # the clean contours' ends are still only expected breaks
+    assert set(diagnostics.contour_ends.tolist()) == {39, 99, 119}
+    assert set(diagnostics.dangling.tolist()) == {59, 79}
+    assert set(diagnostics.error_rows().tolist()).isdisjoint(diagnostics.contour_ends.tolist())
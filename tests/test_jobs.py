@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+
+from helper.jobs import Job, JobScheduler
+
+
+def wait_for(scheduler: JobScheduler, condition, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        scheduler.run_pending()
+        time.sleep(0.005)
+
+
+def test_job_finishing_during_run_pending_can_still_be_superseded():
+    scheduler = JobScheduler()
+    release = threading.Event()
+    applied = []
+    stale = scheduler.submit("extract", lambda job: release.wait(5) and "old", applied.append, group="image")
+
+    # the queue is found empty, then the job finishes completely before run_pending gets to pruning
+    handoff = scheduler._handoff
+
+    class Interleave:
+        def get_nowait(self):
+            try:
+                return handoff.get_nowait()
+            except queue.Empty:
+                scheduler._handoff = handoff
+                release.set()
+                stale._future.result(5)
+                time.sleep(0.05) # let the future's done callbacks run
+                raise
+
+        def put(self, item):
+            handoff.put(item)
+
+    scheduler._handoff = Interleave()
+    assert scheduler.run_pending() == 0
+
+    # a new image load supersedes the old extraction, whose result is already waiting
+    scheduler.submit("extract", lambda job: "new", applied.append, group="image")
+    assert stale.cancelled
+    wait_for(scheduler, lambda: not scheduler._jobs)
+    assert applied == ["new"]
+    scheduler.shutdown()
+
+
+def test_callbacks_run_on_the_calling_thread():
+    scheduler = JobScheduler()
+    threads = []
+    scheduler.submit("work", lambda job: threading.current_thread(), lambda t: threads.append((t, threading.current_thread())))
+    wait_for(scheduler, lambda: threads)
+    worker, main = threads[0]
+    assert worker is not main and main is threading.current_thread()
+    scheduler.shutdown()
+
+
+def test_cancelled_jobs_stop_and_are_forgotten():
+    scheduler = JobScheduler(workers=1)
+    started = threading.Event()
+    results = []
+
+    def slow(job: Job):
+        started.set()
+        for i in range(500):
+            job.progress(i / 500)
+            time.sleep(0.01)
+        return "slow"
+
+    running = scheduler.submit("slow", slow, results.append)
+    queued = scheduler.submit("queued", lambda job: "queued", results.append)
+    started.wait(5)
+    scheduler.cancel()
+    assert running.cancelled and queued.cancelled
+    wait_for(scheduler, lambda: not scheduler._jobs)
+    assert results == [] and scheduler.active() == []
+    scheduler.shutdown()
+
+
+def test_errors_go_to_on_error():
+    scheduler = JobScheduler()
+    errors = []
+
+    def fail(job):
+        raise ValueError("broken")
+
+    scheduler.submit("fail", fail, on_error=errors.append)
+    wait_for(scheduler, lambda: errors)
+    assert isinstance(errors[0], ValueError)
+    scheduler.shutdown()
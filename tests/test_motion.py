@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+import pytest
+
+from gcode.motion import MachineLimits, Motion
+
+# fast enough axes that only the feedrates and accelerations below matter
+LIMITS = MachineLimits(max_feed=(6000.0, 6000.0), acceleration=(10.0, 10.0), junction_deviation=0.0005)
+
+
+def test_parse_modal_words_and_arcs():
+    program = Motion.parse(
+        "G21\n"
+        "G1 X1 Y0 F100\n"
+        "X2 (still G1, Y and F carry over)\n"
+        "G3 X3 Y1 I0 J1\n"
+        "G2 X3 Y1 I-1 J0 ; back where it started, a full circle\n"
+        "G0 X0 Y0\n"
+        "Y5\n"
+    )
+    assert program.units == "mm"
+    assert program.line_count == 7
+    assert program.mode.tolist() == [1, 1, 3, 2, 0, 0]
+    assert program.lines.tolist() == [1, 2, 3, 4, 5, 6]
+    assert program.end.tolist() == [[1, 0], [2, 0], [3, 1], [3, 1], [0, 0], [0, 5]]
+    assert program.start[1:].tolist() == program.end[:-1].tolist()
+    assert program.feed[:4].tolist() == [100] * 4
+    assert np.isnan(program.feed[4:]).all()
+    assert program.center[2:4].tolist() == [[2, 1], [2, 1]]
+    assert np.isnan(program.center[[0, 1, 4, 5]]).all()
+
+
+def test_parse_rejects_what_it_cant_simulate():
+    with pytest.raises(ValueError, match="Line 2"):
+        Motion.parse("G0 X1\nG1 X2\n")
+    with pytest.raises(ValueError, match="G91"):
+        Motion.parse("G91\nG1 X1 F10\n")
+
+
+def test_straight_line_is_a_trapezoid():
+    # 5 in/s reached after 0.5s and 1.25in, 7.5in at full speed, the same to stop: 0.5 + 1.5 + 0.5
+    profile = Motion.simulate(Motion.parse("G1 X10 F300\n"), LIMITS)
+    assert profile.peak[0] == pytest.approx(5)
+    assert profile.entry[0] == profile.exit[0] == 0
+    assert profile.seconds == pytest.approx(2.5)
+
+    # too short to reach the feedrate: a triangle up to sqrt(a * length)
+    profile = Motion.simulate(Motion.parse("G1 X1 F300\n"), LIMITS)
+    assert profile.peak[0] == pytest.approx(math.sqrt(10))
+    assert profile.seconds == pytest.approx(2 * math.sqrt(1 / 10))
+
+
+def test_straight_on_through_a_junction_doesnt_slow_down():
+    single = Motion.simulate(Motion.parse("G1 X10 F300\n"), LIMITS)
+    split = Motion.simulate(Motion.parse("G1 X4 F300\nX10\n"), LIMITS)
+    assert split.exit[0] == pytest.approx(5)
+    assert split.seconds == pytest.approx(single.seconds)
+
+
+def test_right_angle_corner_speed():
+    profile = Motion.simulate(Motion.parse("G1 X10 F300\nY10\n"), LIMITS)
+    # grbl: v^2 = a * deviation * sin(theta / 2) / (1 - sin(theta / 2)), theta the angle the path turns through
+    s = math.sin(math.radians(90) / 2)
+    corner = math.sqrt(10 * 0.0005 * s / (1 - s))
+    assert profile.exit[0] == pytest.approx(corner)
+    assert profile.entry[1] == pytest.approx(corner)
+    # each leg: up to 5 in/s, hold, down to the corner speed
+    leg = 5 / 10 + (5 - corner) / 10 + (10 - 25 / 20 - (25 - corner ** 2) / 20) / 5
+    assert profile.seconds == pytest.approx(2 * leg)
+
+
+def test_rapid_and_cut_distances():
+    profile = Motion.simulate(Motion.parse("G0 X3 Y4\nG1 Y10 F60\nG0 X0 Y0\n"), LIMITS)
+    assert profile.rapid_distance == pytest.approx(5 + math.hypot(3, 10))
+    assert profile.cut_distance == pytest.approx(6)
+    assert profile.has_rapids
+    assert "no G0" not in profile.summary()
+
+    # what GCode.generate_gcode writes: every move a feed move
+    profile = Motion.simulate(Motion.parse("G1 X3 Y4 F60\nY10\n"), LIMITS)
+    assert profile.rapid_distance == 0
+    assert profile.cut_distance == pytest.approx(11)
+    assert "no G0" in profile.summary()
+
+
+def test_arc_length_and_speed():
+    # a quarter circle of radius 1, then a full circle: arcs are no faster than sqrt(a * r)
+    profile = Motion.simulate(Motion.parse("G1 X2 F600\nG3 X3 Y1 I0 J1\nG2 X3 Y1 I-1 J0\n"), LIMITS)
+    assert profile.length[1:].tolist() == pytest.approx([math.pi / 2, 2 * math.pi])
+    assert profile.peak[1:].tolist() == pytest.approx([math.sqrt(10)] * 2)
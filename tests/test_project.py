@@ -0,0 +1,160 @@
+import functools
+import json
+import os
+
+import numpy as np
+import pytest
+
+import helper.project as project_module
+from helper.mutil import Point, Origin
+from helper.pointstore import PointStore
+from helper.project import Project, _JsonReader
+
+
+def make_points(n: int, seed: int = 0) -> list[Point]:
+    # a few chains with unlinked points in between and some locked ones
+    rng = np.random.default_rng(seed)
+    points = []
+    for i, (x, y) in enumerate(rng.uniform(-500, 500, (n, 2)).tolist()):
+        p = Point(x, y)
+        p._locked = bool(rng.random() < 0.2)
+        if i % 7 and points:
+            points[-1]._next = p
+            p._prev = points[-1]
+        points.append(p)
+    return points
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def state(points) -> list[dict]:
+    if isinstance(points, PointStore):
+        points = points.views()
+    return sorted((p.to_dict() for p in points), key=lambda d: d["id"])
+
+
+def make_project(n: int = 300) -> Project:
+    return Project(make_points(n), Origin.TOP_LEFT, 7, "images/scan.png")
+
+
+def assert_same(a: Project, b: Project) -> None:
+    assert (a.origin, a.point_density, a.image_path) == (b.origin, b.point_density, b.image_path)
+    assert state(a.points) == state(b.points)
+
+
+@pytest.mark.parametrize("first,second", [(1, 2), (2, 1), (1, 1), (2, 2)])
+def test_round_trip_between_versions(tmp_path, first, second):
+    project = make_project()
+    project.save(str(tmp_path / "a.cncproj"), version=first)
+    assert Project.version_of(str(tmp_path / "a.cncproj")) == first
+
+    loaded = Project.load(str(tmp_path / "a.cncproj"))
+    assert_same(project, loaded)
+    loaded.save(str(tmp_path / "b.cncproj"), version=second)
+    assert Project.version_of(str(tmp_path / "b.cncproj")) == second
+    assert_same(project, Project.load(str(tmp_path / "b.cncproj")))
+
+
+def test_empty_project_round_trip(tmp_path):
+    for version in (1, 2):
+        path = str(tmp_path / f"empty{version}.cncproj")
+        Project().save(path, version=version)
+        assert state(Project.load(path).points) == []
+
+
+def test_json_is_plain_json(tmp_path):
+    make_project(20).save(str(tmp_path / "a.cncproj"), version=1)
+    with open(str(tmp_path / "a.cncproj")) as f:
+        data = json.load(f)
+    assert len(data["points"]) == 20 and data["point_density"] == 7
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1000, 1 << 20])
+def test_json_reader_chunk_sizes(tmp_path, monkeypatch, chunk_size):
+    # chunk boundaries fall inside numbers, keys and between objects
+    project = make_project(200)
+    project.save(str(tmp_path / "a.cncproj"), version=1)
+    monkeypatch.setattr(project_module, "_JsonReader", functools.partial(_JsonReader, chunk_size=chunk_size))
+    progress = []
+    loaded = Project.load(str(tmp_path / "a.cncproj"), progress=progress.append)
+    assert_same(project, loaded)
+    assert progress[-1] == 1.0 and progress == sorted(progress)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 100])
+def test_json_reader_objects(tmp_path, chunk_size):
+    values = [{"a": i, "b": [i, i + 0.5]} if i % 3 else {"a": i} for i in range(50)]
+    path = tmp_path / "a.json"
+    path.write_text(json.dumps({"x": values, "y": 1}))
+    with open(path) as f:
+        reader = _JsonReader(f, chunk_size)
+        reader.expect("{")
+        assert reader.value() == "x"
+        reader.expect(":")
+        reader.expect("[")
+        found = []
+        while batch := reader.objects():
+            found += batch
+        reader.expect("]")
+        reader.expect(",")
+        assert reader.value() == "y"
+    assert found == values
+
+
+def test_memmap_load(tmp_path):
+    project = make_project()
+    path = str(tmp_path / "a.cncproj")
+    project.save(path)
+    before = read(path)
+
+    mapped = Project.load(path)
+    assert isinstance(mapped.points._xy, np.memmap)
+    assert_same(project, mapped)
+    assert_same(project, Project.load(path, mmap=False))
+
+    # copy-on-write, editing the loaded points never touches the file
+    view = mapped.points.views()[0]
+    view.set_pos(1.5, 2.5)
+    mapped.points.remove(mapped.points.rows()[1])
+    assert read(path) == before
+    assert_same(project, Project.load(path))
+
+
+def test_upgrade_file_keeps_backup(tmp_path):
+    project = make_project()
+    path = str(tmp_path / "a.cncproj")
+    project.save(path, version=1)
+    original = read(path)
+
+    assert Project.upgrade_file(str(path))
+    assert Project.version_of(path) == 2
+    assert read(path + ".v1.bak") == original
+    assert_same(project, Project.load(path))
+
+    # already current, nothing to do
+    assert not Project.upgrade_file(str(path))
+    assert read(path + ".v1.bak") == original
+
+
+def test_backup_older(tmp_path):
+    path = str(tmp_path / "a.cncproj")
+    assert Project.backup_older(str(path)) is None
+    make_project(10).save(path)
+    assert Project.backup_older(str(path)) is None
+    make_project(10).save(path, version=1)
+    assert Project.backup_older(str(path)) == f"{path}.v1.bak"
+    assert os.path.exists(f"{path}.v1.bak")
+
+
+def test_newer_version_is_refused(tmp_path):
+    path = str(tmp_path / "a.cncproj")
+    make_project(5).save(path)
+    data = bytearray(read(path))
+    data[8:12] = (Project.VERSION + 1).to_bytes(4, "little")
+    with open(path, "wb") as f:
+        f.write(data)
+    with pytest.raises(ValueError):
+        Project.load(path)
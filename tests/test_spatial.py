@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from helper.spatial import SpatialIndex
+
+
+def thin_quadratic(xy: np.ndarray, spacing: float) -> list[int]:
+    # the old pass: walk the points in order, keep one when no kept point is closer than the spacing
+    keep = []
+    for i, p in enumerate(xy):
+        if all(np.hypot(*(p - xy[j])) >= spacing for j in keep):
+            keep.append(i)
+    return keep
+
+
+def random_points(seed: int, n: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 200, (n, 2))
+    # clusters and exact duplicates, like traced contours have
+    xy[: n // 4] = xy[0] + rng.normal(0, 3, (n // 4, 2))
+    xy[n // 4: n // 4 + 20] = xy[n // 4]
+    return xy
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("spacing", [0.5, 3, 10, 37.5])
+def test_thin_keeps_minimum_spacing(seed, spacing):
+    xy = random_points(seed, 1500)
+    kept = xy[SpatialIndex.thin(xy, spacing)]
+    d = np.hypot(*(kept[:, None] - kept[None, :]).transpose(2, 0, 1))
+    np.fill_diagonal(d, np.inf)
+    assert d.min() >= spacing
+
+
+def spiral(n: int) -> np.ndarray:
+    # points in path order, every point closer than the spacing to the one before it
+    t = np.linspace(0, 40 * np.pi, n)
+    return np.c_[t * np.cos(t), t * np.sin(t)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("spacing", [0.5, 3, 10, 37.5])
+def test_thin_covers_dropped_points(seed, spacing):
+    # a dropped point always has a kept point closer than the spacing, thinning doesn't open gaps
+    for xy in (random_points(seed, 1500), spiral(1500)):
+        kept = xy[SpatialIndex.thin(xy, spacing)]
+        d = np.hypot(*(xy[:, None] - kept[None, :]).transpose(2, 0, 1))
+        assert d.min(axis=1).max() < spacing
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("spacing", [0.5, 3, 10, 37.5])
+def test_thin_keeps_about_as_many_as_quadratic(seed, spacing):
+    xy = random_points(seed, 400)
+    kept, expected = len(SpatialIndex.thin(xy, spacing)), len(thin_quadratic(xy, spacing))
+    assert abs(kept - expected) <= 0.1 * expected + 1
+
+
+def test_thin_far_outlier_gives_the_same_result():
+    # the outlier makes the grid too big to allocate, the cells with points get looked up instead
+    xy = random_points(0, 1500)
+    far = np.vstack([xy, [(1e9, 1e9)]])
+    assert SpatialIndex.thin(far, 3).tolist() == SpatialIndex.thin(xy, 3).tolist() + [1500]
+
+
+def test_thin_edge_cases():
+    assert SpatialIndex.thin(np.empty((0, 2)), 5).tolist() == []
+    assert SpatialIndex.thin([(0, 0), (0, 0)], 0).tolist() == [0, 1]
+    # exactly the spacing apart is far enough
+    assert SpatialIndex.thin([(0, 0), (5, 0), (2, 0)], 5).tolist() == [0, 1]
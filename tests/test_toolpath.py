@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import pytest
+
+from gcode.toolpath import ToolPath
+from helper.pointstore import PointStore
+
+
+def strokes(seed: int, count: int, length: int = 12) -> PointStore:
+    # short random walks scattered over the page, linked into one path in the order they were drawn
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 1000, (count, 1, 2))
+    xy = (starts + np.cumsum(rng.normal(0, 1.5, (count, length, 2)), axis=1)).reshape(-1, 2)
+    store = PointStore.from_xy(xy)
+    n = len(xy)
+    store.link_rows(np.append(np.arange(1, n), -1), np.insert(np.arange(n - 1), 0, -1))
+    return store
+
+
+def air_travel(store: PointStore, rows: np.ndarray, gap: float) -> float:
+    xy = store.xy[rows]
+    step = np.hypot(*np.diff(xy, axis=0).T)
+    return float(step[step > gap].sum())
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("count", [2, 30, 300])
+def test_plan_order_never_adds_air_travel(seed, count):
+    store = strokes(seed, count)
+    gap = 20
+    segments = ToolPath.segments(store, gap)
+    before = air_travel(store, np.concatenate(segments), gap)
+
+    rows, report = ToolPath.plan_order(store, gap)
+    assert report.segments == len(segments)
+    assert report.travel_before == pytest.approx(before)
+    assert report.travel_after <= report.travel_before + 1e-9
+    # the report's travel is what the new order really jumps
+    segment_of = np.empty(len(store), dtype=np.int64)
+    for i, s in enumerate(segments):
+        segment_of[s] = i
+    jumps = sum(math.dist(store.xy[a], store.xy[b]) for a, b in zip(rows[:-1], rows[1:]) if segment_of[a] != segment_of[b])
+    assert jumps == pytest.approx(report.travel_after)
+
+    # every segment is cut whole, one way or the other, and the first one stays where the machine starts
+    assert sorted(rows.tolist()) == sorted(np.concatenate(segments).tolist())
+    assert rows[:len(segments[0])].tolist() == segments[0].tolist()
+    pieces = {tuple(s.tolist()) for s in segments} | {tuple(s[::-1].tolist()) for s in segments}
+    at = 0
+    while at < len(rows):
+        piece = next(p for p in pieces if tuple(rows[at:at + len(p)].tolist()) == p)
+        at += len(piece)
+
+
+def segment_distance(p: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    ab = b - a
+    t = np.clip(((p - a) * ab).sum(axis=1) / max(float((ab * ab).sum()), 1e-18), 0, 1)
+    return np.hypot(*(p - (a + t[:, None] * ab)).T)
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("tolerance", [0.01, 0.05, 0.5])
+def test_simplify_stays_within_tolerance(seed, tolerance):
+    ppin = 100
+    store = strokes(seed, 40, 60)
+    rng = np.random.default_rng(seed)
+    locked = rng.choice(len(store), 30, replace=False)
+    for row in locked.tolist():
+        store.view(row).setlocked(True)
+    original = store.xy.copy()
+    segments = [s.copy() for s in ToolPath.segments(store, math.inf)]
+    ids = store.ids.copy()
+
+    report = ToolPath.simplify(store, tolerance, ppin)
+    assert report.points_before == len(original)
+    assert report.points_after == len(store.rows())
+    kept_ids = set(store.ids[store.rows()].tolist())
+    assert set(ids[locked].tolist()) <= kept_ids
+    assert set(ids[[s[0] for s in segments] + [s[-1] for s in segments]].tolist()) <= kept_ids
+
+    # the kept points are still one path, in the same order
+    after = np.concatenate(ToolPath.segments(store, math.inf))
+    assert store.ids[after].tolist() == [i for i in ids[np.concatenate(segments)].tolist() if i in kept_ids]
+
+    # every dropped point is within the tolerance of the line between the kept points around it
+    for s in segments:
+        kept = np.flatnonzero(np.isin(ids[s], list(kept_ids)))
+        for a, b in zip(kept[:-1], kept[1:]):
+            if b - a > 1:
+                d = segment_distance(original[s[a + 1:b]], original[s[a]], original[s[b]])
+                assert d.max() <= tolerance * ppin + 1e-9
@@ -60,7 +60,7 @@ class Button(Component):
 
     def event(self, event) -> None:
         if self._disabled: return
-        pos = self._true_conversion(*pygame.mouse.get_pos())
+        pos = self._true_conversion(*getattr(event, "pos", None) or pygame.mouse.get_pos())
         if pos[0] < 0 or pos[1] < 0:
             return
         
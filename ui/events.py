@@ -0,0 +1,203 @@
+import os, json, ctypes
+import pygame
+from dataclasses import dataclass
+from typing import Iterable
+
+# Windows message codes, every backend speaks these so the editor and the components only handle one kind of event
+WM_CLOSE = 0x0010
+WM_KEYDOWN = 0x0100
+WM_KEYUP = 0x0101
+WM_CHAR = 0x0102
+WM_COMMAND = 0x0111
+WM_MOUSEMOVE = 0x0200
+WM_LBUTTONDOWN = 0x0201
+WM_LBUTTONUP = 0x0202
+WM_RBUTTONDOWN = 0x0204
+WM_RBUTTONUP = 0x0205
+WM_MOUSEWHEEL = 0x020A
+MK_LBUTTON = 0x0001
+MK_RBUTTON = 0x0002
+WHEEL_DELTA = 120
+
+
+@dataclass
+class Message:
+    """
+    One input event. message/wParam/lParam are named like a win32 MSG's fields, pos is the mouse position
+    in window pixels when it happened.
+    """
+    message: int
+    wParam: int = 0
+    lParam: int = 0
+    pos: tuple[int, int] = (0, 0)
+
+    def to_list(self) -> list:
+        return [self.message, self.wParam, self.lParam, self.pos[0], self.pos[1]]
+
+    @staticmethod
+    def from_list(values: list) -> 'Message':
+        return Message(values[0], values[1], values[2], (values[3], values[4]))
+
+
+class EventBackend:
+    """
+    Where the editor's input comes from. poll() waits for the next frame and returns everything that came in
+    since the last one, with runs of mouse moves coalesced into the last of them (nothing in between reacts to
+    the moves that got dropped, a drag or pan only needs where the mouse ended up).
+    """
+    FPS = 60 # frame cap, 0 for none
+
+    def __init__(self) -> None:
+        self.clock = pygame.time.Clock()
+
+    def poll(self) -> list[Message]:
+        self.clock.tick(self.FPS)
+        return EventBackend.coalesce(self._drain())
+
+    def _drain(self) -> list[Message]:
+        raise NotImplementedError
+
+    @staticmethod
+    def coalesce(messages: list[Message]) -> list[Message]:
+        result: list[Message] = []
+        for msg in messages:
+            if msg.message == WM_MOUSEMOVE and result and result[-1].message == WM_MOUSEMOVE:
+                result[-1] = msg
+            else:
+                result.append(msg)
+        return result
+
+    @staticmethod
+    def default() -> 'EventBackend':
+        # the win32 menu bar only talks through the windows message queue, pygame would drain it first
+        return Win32Backend() if os.name == "nt" else PygameBackend()
+
+
+class Win32Backend(EventBackend):
+    PM_REMOVE = 0x0001
+
+    def __init__(self) -> None:
+        super().__init__()
+        import ctypes.wintypes
+        self._user32 = ctypes.windll.user32
+        self._msg = ctypes.wintypes.MSG()
+
+    def _drain(self) -> list[Message]:
+        messages = []
+        msg = self._msg
+        while self._user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, Win32Backend.PM_REMOVE):
+            self._user32.TranslateMessage(ctypes.byref(msg))
+            self._user32.DispatchMessageW(ctypes.byref(msg))
+            if WM_MOUSEMOVE <= msg.message <= WM_RBUTTONUP:
+                # client coordinates, signed words of lParam
+                pos = (ctypes.c_int16(msg.lParam & 0xFFFF).value, ctypes.c_int16((msg.lParam >> 16) & 0xFFFF).value)
+            else:
+                pos = pygame.mouse.get_pos()
+            messages.append(Message(msg.message, msg.wParam or 0, msg.lParam or 0, pos))
+        return messages
+
+
+class PygameBackend(EventBackend):
+    """
+    pygame's event queue turned into the same messages win32 sends (works anywhere SDL does)
+    """
+    KEYS = {
+        pygame.K_LCTRL: 17, pygame.K_RCTRL: 17, pygame.K_LSHIFT: 16, pygame.K_RSHIFT: 16, pygame.K_DELETE: 46,
+        pygame.K_ESCAPE: 27, pygame.K_RETURN: 13, pygame.K_BACKSPACE: 8, pygame.K_TAB: 9, pygame.K_SPACE: 32,
+        pygame.K_LEFT: 37, pygame.K_UP: 38, pygame.K_RIGHT: 39, pygame.K_DOWN: 40,
+        **{getattr(pygame, f"K_F{i}"): 111 + i for i in range(1, 13)},
+    }
+
+    @staticmethod
+    def virtual_key(key: int) -> int | None:
+        if pygame.K_a <= key <= pygame.K_z:
+            return key - pygame.K_a + 65
+        if pygame.K_0 <= key <= pygame.K_9:
+            return key - pygame.K_0 + 48
+        return PygameBackend.KEYS.get(key)
+
+    def _drain(self) -> list[Message]:
+        return [msg for event in pygame.event.get() for msg in PygameBackend.translate(event)]
+
+    @staticmethod
+    def translate(event: pygame.event.Event) -> Iterable[Message]:
+        if event.type == pygame.QUIT:
+            yield Message(WM_CLOSE, pos=pygame.mouse.get_pos())
+        elif event.type == pygame.MOUSEMOTION:
+            yield Message(WM_MOUSEMOVE, MK_LBUTTON if event.buttons[0] else 0, 0, event.pos)
+        elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and event.button in (1, 3):
+            down = event.type == pygame.MOUSEBUTTONDOWN
+            if event.button == 1:
+                yield Message(WM_LBUTTONDOWN if down else WM_LBUTTONUP, MK_LBUTTON if down else 0, 0, event.pos)
+            else:
+                yield Message(WM_RBUTTONDOWN if down else WM_RBUTTONUP, MK_RBUTTON if down else 0, 0, event.pos)
+        elif event.type == pygame.MOUSEWHEEL:
+            # the wheel delta sits in the high word of wParam, like win32 sends it
+            yield Message(WM_MOUSEWHEEL, ((WHEEL_DELTA * event.y) & 0xFFFF) << 16, 0, pygame.mouse.get_pos())
+        elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+            key = PygameBackend.virtual_key(event.key)
+            if key is not None:
+                yield Message(WM_KEYDOWN if event.type == pygame.KEYDOWN else WM_KEYUP, key, 0, pygame.mouse.get_pos())
+            if event.type == pygame.KEYDOWN and event.unicode and event.unicode.isprintable():
+                yield Message(WM_CHAR, ord(event.unicode), 0, pygame.mouse.get_pos())
+
+
+class HeadlessBackend(EventBackend):
+    """
+    Plays back a scripted session, one list of messages per frame, as fast as frames can be drawn.
+    Once the script is done it sends WM_CLOSE. Meant for the SDL dummy video driver (SDL_VIDEODRIVER=dummy).
+    """
+    FPS = 0
+
+    def __init__(self, frames: list[list[Message]]) -> None:
+        super().__init__()
+        self.frames = frames
+        self.frame = 0
+
+    def _drain(self) -> list[Message]:
+        # pygame still wants its queue pumped, even without a real window
+        pygame.event.pump()
+        if self.frame >= len(self.frames):
+            return [Message(WM_CLOSE)]
+        messages = self.frames[self.frame]
+        self.frame += 1
+        return list(messages)
+
+    @staticmethod
+    def load(path: str) -> 'HeadlessBackend':
+        return HeadlessBackend(Session.load(path))
+
+
+class RecordingBackend(EventBackend):
+    """
+    Passes another backend's messages through and keeps them per frame, save() writes them as a session
+    that HeadlessBackend.load plays back
+    """
+    def __init__(self, backend: EventBackend) -> None:
+        super().__init__()
+        self.backend = backend
+        self.frames: list[list[Message]] = []
+
+    def poll(self) -> list[Message]:
+        messages = self.backend.poll()
+        self.frames.append(messages)
+        return messages
+
+    def save(self, path: str) -> None:
+        Session.save(path, self.frames)
+
+
+class Session:
+    """
+    Recorded input, stored as JSON lines: one line per frame, a list of [message, wParam, lParam, x, y]
+    """
+    @staticmethod
+    def save(path: str, frames: list[list[Message]]) -> None:
+        with open(path, "w") as f:
+            for messages in frames:
+                f.write(json.dumps([m.to_list() for m in messages]) + "\n")
+
+    @staticmethod
+    def load(path: str) -> list[list[Message]]:
+        with open(path) as f:
+            return [[Message.from_list(m) for m in json.loads(line)] for line in f if line.strip()]
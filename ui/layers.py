@@ -0,0 +1,101 @@
+import pygame
+
+
+class Layer:
+    """
+    Offscreen surface that keeps what was drawn on it until it's invalidated, either as a whole or in
+    rects. Transparent layers use a colorkey instead of per pixel alpha so blitting them stays cheap.
+    """
+    KEY = (255, 254, 253) # nothing is ever drawn in this colour
+    MAX_RECTS = 32 # past this many dirty rects a full redraw is cheaper
+
+    def __init__(self, size: tuple[int, int], transparent: bool = True) -> None:
+        self.surface = pygame.Surface(size)
+        self._background = Layer.KEY if transparent else (255, 255, 255)
+        if transparent:
+            self.surface.set_colorkey(Layer.KEY)
+        self._full = True
+        self._rects: list[pygame.Rect] = []
+        self._key = None
+
+    @property
+    def dirty(self) -> bool:
+        return self._full or bool(self._rects)
+
+    def invalidate(self, rect: pygame.Rect | tuple[float, float, float, float] | None = None) -> None:
+        if rect is None:
+            self._full = True
+            self._rects = []
+        elif not self._full:
+            self._rects.append(pygame.Rect(rect))
+            if len(self._rects) > Layer.MAX_RECTS:
+                self.invalidate()
+
+    """
+    Moves what's on the layer by (dx, dy) pixels, only the strips that scrolled into view have to be redrawn
+    """
+    def scroll(self, dx: int, dy: int) -> None:
+        w, h = self.surface.get_size()
+        if self._full or abs(dx) >= w or abs(dy) >= h:
+            self.invalidate()
+            return
+
+        self.surface.scroll(dx, dy)
+        self._rects = [r.move(dx, dy) for r in self._rects]
+        if dx:
+            self.invalidate((0, 0, dx, h) if dx > 0 else (w + dx, 0, -dx, h))
+        if dy:
+            self.invalidate((0, 0, w, dy) if dy > 0 else (0, h + dy, w, -dy))
+
+    """
+    For layers that only depend on a bit of state: invalidates the layer when key differs from last time
+    """
+    def check_key(self, key) -> None:
+        if key != self._key:
+            self._key = key
+            self.invalidate()
+
+    """
+    Brings the layer up to date, draw_full(surface) redraws everything, draw_rect(surface, rect) only has
+    to cover rect (the surface is clipped to it). Returns True if anything was redrawn.
+    """
+    def redraw(self, draw_full, draw_rect) -> bool:
+        # take the pending work first, invalidations that come in while drawing are kept for the next frame
+        if self._full:
+            self._full, self._rects = False, []
+            self.surface.set_clip(None)
+            self.surface.fill(self._background)
+            draw_full(self.surface)
+            return True
+
+        if self._rects:
+            rects, self._rects = Layer._merge(self._rects), []
+            for rect in rects:
+                self.surface.set_clip(rect)
+                self.surface.fill(self._background, rect)
+                draw_rect(self.surface, rect)
+            self.surface.set_clip(None)
+            return True
+        return False
+
+    """
+    Overlapping rects are joined when their union isn't bigger than the two of them, so mostly overlapping
+    rects (a point before and after a move) are drawn once but an L shape doesn't turn into a big square
+    """
+    @staticmethod
+    def _merge(rects: list[pygame.Rect]) -> list[pygame.Rect]:
+        merged: list[pygame.Rect] = []
+        for rect in rects:
+            rect = rect.copy()
+            joined = True
+            while joined:
+                joined = False
+                for i, other in enumerate(merged):
+                    union = rect.union(other)
+                    if rect.colliderect(other) and union.w * union.h <= rect.w * rect.h + other.w * other.h:
+                        rect = union
+                        del merged[i]
+                        joined = True
+                        break
+            merged.append(rect)
+        return merged